@@ -0,0 +1,191 @@
+"""
+Benchmarks
+=====
+
+Times bank and structure parsing on synthetic banks and measures peak memory, comparing each result with a
+recorded baseline. Timings depend on the machine, so record the baseline on the machine the comparison runs on,
+and raise `--tolerance` on noisy ones. Memory figures are deterministic.
+
+Usage::
+
+    python -m benchmarks.bench                  # compare with benchmarks/baseline.json
+    python -m benchmarks.bench --save           # record a new baseline
+    python -m benchmarks.bench -k struct/       # only run benchmarks whose name contains 'struct/'
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from zelda64audiobank.audiobank import Audiobank
+from zelda64audiobank.structures.drum import Drum
+from zelda64audiobank.structures.envelope import Envelope
+from zelda64audiobank.structures.instrument import Instrument
+from zelda64audiobank.structures.sample import Sample
+from zelda64audiobank.structures.vadpcm import VadpcmBook, VadpcmLoop
+
+from .synthetic import generate_bank
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# Synthetic bank configurations, passed to `generate_bank`
+BANKS: dict[str, dict] = {
+    'small': dict(num_instruments=16, num_drums=16, num_effects=8),
+    'default': dict(),
+    'large': dict(num_instruments=255, num_drums=255, num_effects=256, order=4, num_predictors=8),
+    'unshared': dict(sharing=0.0),
+    'shared': dict(sharing=1.0),
+}
+
+STRUCTS = [Instrument, Drum, Sample, VadpcmLoop, VadpcmBook, Envelope]
+
+def _time(func, min_time: float = 0.5, repeat: int = 7) -> float:
+    """ Returns the best time of one call to `func` in seconds, over `repeat` runs of at least `min_time` each. """
+    # Like timeit, keep the garbage collector from adding noise to the timings
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _time_runs(func, min_time, repeat)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+def _time_runs(func, min_time: float, repeat: int) -> float:
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / repeat:
+            break
+        number *= 2
+
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+def _peak_memory(func) -> int:
+    """ Returns the peak number of bytes allocated while `func` runs. """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run(selected: str = '') -> dict[str, dict]:
+    """
+    Runs every benchmark whose name contains `selected`.
+
+    Returns:
+        results (dict[str, dict]): The value and unit of each benchmark by name.
+    """
+    results = {}
+
+    def record(name: str, unit: str, measure):
+        if selected in name:
+            results[name] = {'value': measure(), 'unit': unit}
+            print(f'{name:<28} {_format(results[name])}', file=sys.stderr)
+
+    banks = {name: generate_bank(**config) for name, config in BANKS.items()}
+
+    for name, bank in banks.items():
+        record(f'parse/{name}', 's', lambda: _time(lambda: Audiobank.from_bytes(bank.table_entry, bank.bank_data)))
+
+    for name, bank in banks.items():
+        record(f'memory/{name}', 'B', lambda: _peak_memory(lambda: Audiobank.from_bytes(bank.table_entry, bank.bank_data)))
+
+    # Structures are parsed one at a time without a shared context, so pointers are followed every time
+    bank = banks['default']
+    for struct_type in STRUCTS:
+        offsets = bank.offsets[struct_type.__name__]
+
+        def parse_all():
+            for offset in offsets:
+                struct_type.from_bytes(bank.bank_data, offset)
+
+        record(f'struct/{struct_type.__name__}', 's', lambda: _time(parse_all) / len(offsets))
+
+    return results
+
+def _format(result: dict) -> str:
+    if result['unit'] == 's':
+        return f'{result["value"] * 1e6:12.2f} us'
+    return f'{result["value"] / 1024:12.1f} KiB'
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], tolerance: float) -> list[str]:
+    """
+    Compares results with a baseline.
+
+    Args:
+        results (dict[str, dict]): Results from `run`.
+        baseline (dict[str, dict]): Results recorded earlier.
+        tolerance (float): Allowed relative increase before a result counts as a regression.
+
+    Returns:
+        regressions (list[str]): Names of the benchmarks that regressed.
+    """
+    regressions = []
+    print(f'\n{"benchmark":<28} {"current":>15} {"baseline":>15} {"ratio":>7}')
+    for name, result in results.items():
+        if name not in baseline:
+            print(f'{name:<28} {_format(result)} {"-":>15} {"-":>7}')
+            continue
+
+        ratio = result['value'] / baseline[name]['value'] if baseline[name]['value'] else float('inf')
+        status = ''
+        if ratio > 1 + tolerance:
+            status = '  REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 - tolerance:
+            status = '  improved'
+        print(f'{name:<28} {_format(result)} {_format(baseline[name])} {ratio:7.2f}{status}')
+
+    return regressions
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark Zelda64Audiobank on synthetic banks.')
+    parser.add_argument('-k', dest='selected', default='', help='only run benchmarks whose name contains this string')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline JSON file (default: %(default)s)')
+    parser.add_argument('--save', action='store_true', help='record the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    results = run(args.selected)
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'results': results,
+            }, f, indent=2)
+            f.write('\n')
+        print(f'Baseline written to {args.baseline}', file=sys.stderr)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f'No baseline at {args.baseline}, run with --save to record one', file=sys.stderr)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f'\n{len(regressions)} regression(s): {", ".join(regressions)}')
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
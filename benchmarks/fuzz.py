@@ -0,0 +1,187 @@
+"""
+Fuzzing
+=====
+
+Feeds malformed banks to the strict parser and measures how fast it rejects them. Every input must either parse
+or raise a `ValueError` (strict parsing raises `BankFormatError` subclasses); any other exception is a failure.
+The worst time per byte over all inputs must stay within `--max-slowdown` times the time per byte of well-formed
+banks, which is what keeps a hostile bank from costing much more than a well-formed bank of the same size. Inputs
+shorter than 256 bytes are counted as 256 bytes, so the fixed cost of a parse does not dominate the smallest inputs.
+
+Usage::
+
+    python -m benchmarks.fuzz                       # 2000 inputs
+    python -m benchmarks.fuzz --cases 20000 --seed 3
+"""
+import argparse
+import gc
+import random
+import struct
+import sys
+import time
+from collections import Counter
+
+from zelda64audiobank.audiobank import Audiobank
+
+from .synthetic import generate_bank
+
+_MIN_BYTES = 0x100
+
+def _entry(bank_size: int, num_instruments: int, num_drums: int, num_effects: int) -> bytes:
+    return struct.pack('>2I4B2BH', 0, bank_size, 2, 2, 1, 0xFF, num_instruments, num_drums, num_effects)
+
+def envelope_chain(num_instruments: int = 255, run_points: int = 4096) -> tuple[bytes, bytes]:
+    """
+    A bank whose instruments point to staggered offsets of one long run of envelope points. Without a length limit
+    and work budget, every envelope is read to the end of the run, which is quadratic in the size of the bank.
+    """
+    list_end = 0x08 + 4 * num_instruments
+    instrument_start = (list_end + 0xF) & ~0xF
+    run_start = instrument_start + 0x20 * num_instruments
+    data = bytearray(run_start + 4 * (run_points + 1))
+    struct.pack_into('>2I', data, 0, 0, 0)
+    for i in range(num_instruments):
+        offset = instrument_start + 0x20 * i
+        struct.pack_into('>I', data, 0x08 + 4 * i, offset)
+        struct.pack_into('>4BI', data, offset, 0, 0, 127, 0, run_start + 4 * i)
+    for i in range(run_points):
+        struct.pack_into('>2h', data, run_start + 4 * i, 1, 0x7FFF)
+    # The run ends with a HANG opcode (0), which the zero padding already holds
+    return _entry(len(data), num_instruments, 0, 0), bytes(data)
+
+def book_bomb(order: int = 0x7FFF, num_predictors: int = 0x7FFF) -> tuple[bytes, bytes]:
+    """ A bank with a single sample whose codebook claims an enormous number of coefficients. """
+    data = bytearray(0x80)
+    struct.pack_into('>2I', data, 0, 0, 0)
+    struct.pack_into('>I', data, 0x08, 0x10)
+    struct.pack_into('>4BI', data, 0x10, 0, 0, 127, 0, 0)
+    struct.pack_into('>If', data, 0x10 + 0x10, 0x30, 1.0)
+    struct.pack_into('>4I', data, 0x30, 0x1000, 0, 0, 0x50)
+    struct.pack_into('>2i', data, 0x50, order, num_predictors)
+    return _entry(len(data), 1, 0, 0), bytes(data)
+
+def _mutate(rng: random.Random, table_entry: bytes, bank_data: bytes) -> tuple[bytes, bytes]:
+    data = bytearray(bank_data)
+    mode = rng.randrange(5)
+    if mode == 0:
+        # Random byte flips
+        for _ in range(rng.randint(1, 32)):
+            data[rng.randrange(len(data))] = rng.randrange(256)
+    elif mode == 1:
+        # Truncation
+        del data[rng.randrange(len(data)):]
+    elif mode == 2:
+        # Pointers to random, possibly unaligned or out of range, offsets
+        for _ in range(rng.randint(1, 16)):
+            word = rng.randrange(len(data) // 4) * 4
+            struct.pack_into('>I', data, word, rng.randrange(len(data) + 0x100))
+    elif mode == 3:
+        # Pointers into the middle of other structures
+        for _ in range(rng.randint(1, 16)):
+            word = rng.randrange(len(data) // 4) * 4
+            struct.pack_into('>I', data, word, rng.randrange(len(data) // 4) * 4)
+    else:
+        # Random garbage after the lists
+        start = rng.randrange(len(data))
+        data[start:] = rng.randbytes(len(data) - start)
+    return table_entry, bytes(data)
+
+def cases(count: int, seed: int):
+    """ Yields (name, table entry, bank data) for `count` malformed banks, plus the crafted worst cases. """
+    yield 'envelope_chain', *envelope_chain()
+    yield 'envelope_chain_short', *envelope_chain(run_points=200)
+    yield 'book_bomb', *book_bomb()
+    yield 'book_negative', *book_bomb(-1, 4)
+
+    rng = random.Random(seed)
+    bases = [generate_bank(num_instruments=16, num_drums=16, num_effects=8, seed=seed), generate_bank(seed=seed)]
+    for _ in range(count):
+        base = rng.choice(bases)
+        yield 'mutated', *_mutate(rng, base.table_entry, base.bank_data)
+
+def _parse(table_entry: bytes, bank_data: bytes) -> str:
+    try:
+        Audiobank.from_bytes(table_entry, bank_data, strict=True)
+    except ValueError as e:
+        return type(e).__name__
+    return 'ok'
+
+def _us_per_byte(table_entry: bytes, bank_data: bytes, repeat: int = 1) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _parse(table_entry, bank_data)
+        best = min(best, time.perf_counter() - start)
+    return best * 1e6 / max(len(bank_data), _MIN_BYTES)
+
+def run(count: int, seed: int, max_slowdown: float, max_us_per_byte: float | None = None) -> int:
+    outcomes = Counter()
+    failures = []
+    total_bytes = 0
+    total_time = 0.0
+    slowest = []    # (us per byte, name, outcome, table entry, bank data)
+
+    # Well-formed banks give the reference cost per byte, so the limit does not depend on the machine
+    reference = min(
+        _us_per_byte(bank.table_entry, bank.bank_data, repeat=20)
+        for bank in (generate_bank(seed=seed), generate_bank(sharing=0.0, seed=seed))
+    )
+
+    gc.disable()
+    try:
+        for name, table_entry, bank_data in cases(count, seed):
+            start = time.perf_counter()
+            try:
+                outcome = _parse(table_entry, bank_data)
+            except Exception as e:
+                outcome = f'unexpected {type(e).__name__}'
+                failures.append(f'{name}: {type(e).__name__}: {e}')
+            elapsed = time.perf_counter() - start
+
+            outcomes[outcome] += 1
+            total_bytes += len(bank_data)
+            total_time += elapsed
+            slowest.append((elapsed * 1e6 / max(len(bank_data), _MIN_BYTES), name, outcome, table_entry, bank_data))
+            if len(slowest) > 64:
+                slowest = sorted(slowest, key=lambda case: -case[0])[:16]
+
+        # Time the slowest inputs again, so a single hiccup of the machine is not reported as the worst case
+        worst = max(
+            ((_us_per_byte(table_entry, bank_data, repeat=5), f'{name} ({len(bank_data)} bytes, {outcome})')
+             for _, name, outcome, table_entry, bank_data in slowest if not outcome.startswith('unexpected')),
+            default=(0.0, '-')
+        )
+    finally:
+        gc.enable()
+
+    limit = max_slowdown * reference if max_us_per_byte is None else max_us_per_byte
+    inputs = sum(outcomes.values())
+    print(f'{inputs} inputs, {total_bytes / 1024:.1f} KiB in {total_time:.2f} s')
+    print(f'  throughput  {inputs / total_time:10.0f} inputs/s  {total_bytes / total_time / 1024 / 1024:8.2f} MiB/s')
+    print(f'  reference   {reference:10.3f} us/byte  well-formed banks')
+    print(f'  worst case  {worst[0]:10.3f} us/byte  {worst[1]}, {worst[0] / reference:.1f}x the reference')
+    for outcome, n in outcomes.most_common():
+        print(f'  {outcome:<28} {n:>8}')
+
+    status = 0
+    if failures:
+        print(f'\n{len(failures)} input(s) raised an exception other than ValueError:')
+        for failure in failures[:20]:
+            print(f'  {failure}')
+        status = 1
+    if worst[0] > limit:
+        print(f'\nWorst case of {worst[0]:.3f} us/byte exceeds the limit of {limit:.3f} us/byte')
+        status = 1
+    return status
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Fuzz the strict bank parser with malformed banks.')
+    parser.add_argument('--cases', type=int, default=2000, help='number of mutated banks (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the mutations (default: %(default)s)')
+    parser.add_argument('--max-slowdown', type=float, default=20.0, help='allowed worst-case time per byte, relative to well-formed banks (default: %(default)s)')
+    parser.add_argument('--max-us-per-byte', type=float, help='allowed worst-case time per byte in microseconds, instead of --max-slowdown')
+    args = parser.parse_args(argv)
+    return run(args.cases, args.seed, args.max_slowdown, args.max_us_per_byte)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Synthetic Banks
+=====
+
+Deterministic generator for synthetic instrument banks, so parser changes can be measured without shipping
+ROM data. Banks are written directly with `struct`, independently of the library's own serializer.
+"""
+import math
+import random
+import struct
+from dataclasses import dataclass, field
+
+def _align(offset: int, align: int) -> int:
+    return (offset + align - 1) & ~(align - 1)
+
+@dataclass
+class SyntheticBank:
+    """ A generated instrument bank and the offsets of every structure written into it. """
+    table_entry: bytes
+    bank_data: bytes
+    offsets: dict[str, list[int]] = field(default_factory=dict)
+
+def generate_bank(
+        num_instruments: int = 64,
+        num_drums: int = 64,
+        num_effects: int = 32,
+        sharing: float = 0.75,
+        order: int = 2,
+        num_predictors: int = 4,
+        envelope_points: int = 4,
+        empty_slots: float = 0.1,
+        seed: int = 0
+    ) -> SyntheticBank:
+    """
+    Generates a synthetic instrument bank.
+
+    Args:
+        num_instruments (int): Number of instrument list slots.
+        num_drums (int): Number of drum list slots.
+        num_effects (int): Number of effect list slots.
+        sharing (float): Degree of sharing between 0 and 1. At 0 every sample and envelope reference points to
+            its own structure, at 1 every reference points to the same one.
+        order (int): Codebook order of every sample.
+        num_predictors (int): Number of predictors in every codebook.
+        envelope_points (int): Number of points in every envelope, not counting the closing opcode.
+        empty_slots (float): Fraction of list slots left empty.
+        seed (int): Seed of the generator. The same arguments always produce the same bank.
+
+    Returns:
+        bank (SyntheticBank): The table entry, bank data and structure offsets.
+    """
+    if not 0 <= sharing <= 1:
+        raise ValueError(f'sharing must be between 0 and 1, got {sharing}')
+    if num_instruments > 0xFF or num_drums > 0xFF or num_effects > 0xFFFF:
+        raise ValueError('Too many list slots for an audiobank table entry')
+
+    rng = random.Random(seed)
+
+    instrument_slots = [rng.random() >= empty_slots for _ in range(num_instruments)]
+    drum_slots = [rng.random() >= empty_slots for _ in range(num_drums)]
+    effect_slots = [rng.random() >= empty_slots for _ in range(num_effects)]
+
+    # Every instrument references three samples, every drum and effect one
+    sample_refs = 3 * sum(instrument_slots) + sum(drum_slots) + sum(effect_slots)
+    envelope_refs = sum(instrument_slots) + sum(drum_slots)
+    num_samples = max(1, math.ceil(sample_refs * (1 - sharing)))
+    num_envelopes = max(1, math.ceil(envelope_refs * (1 - sharing)))
+
+    # Lists, then structures grouped by type
+    drum_list = _align(0x08 + (4 * num_instruments), 0x10)
+    effect_list = _align(drum_list + (4 * num_drums), 0x10)
+    cursor = effect_list + (8 * num_effects)
+
+    offsets: dict[str, list[int]] = {'Instrument': [], 'Drum': [], 'Sample': [], 'VadpcmLoop': [], 'VadpcmBook': [], 'Envelope': []}
+
+    def place(kind: str, size: int, align: int = 1) -> int:
+        nonlocal cursor
+        cursor = _align(cursor, align)
+        offsets[kind].append(cursor)
+        cursor += size
+        return cursor - size
+
+    instruments = [place('Instrument', 0x20) if used else 0 for used in instrument_slots]
+    drums = [place('Drum', 0x10) if used else 0 for used in drum_slots]
+    samples = [place('Sample', 0x10) for _ in range(num_samples)]
+    looped = [i % 2 == 0 for i in range(num_samples)]
+    loops = [place('VadpcmLoop', 0x30 if looped[i] else 0x10) for i in range(num_samples)]
+    book_size = 0x08 + (2 * 8 * order * num_predictors)
+    books = [place('VadpcmBook', book_size, 0x10) for _ in range(num_samples)]
+    envelopes = [place('Envelope', 4 * (envelope_points + 1), 0x10) for _ in range(num_envelopes)]
+    bank_size = _align(cursor, 0x10)
+
+    data = bytearray(bank_size)
+    struct.pack_into('>2I', data, 0, drum_list, effect_list)
+
+    for i, (sample, loop, book) in enumerate(zip(samples, loops, books)):
+        codec = rng.choice((0, 3))
+        num_frames = rng.randint(16, 4096)
+        size = num_frames * (9 if codec == 0 else 5)
+        flags = (codec << 28) | (rng.randint(0, 1) << 26) | size
+        struct.pack_into('>4I', data, sample, flags, rng.randrange(0, 0x400000, 0x10), loop, book)
+
+        num_samples_in_loop = num_frames * 16
+        if looped[i]:
+            struct.pack_into('>4I', data, loop, 16, num_samples_in_loop, 0xFFFFFFFF, num_samples_in_loop)
+            struct.pack_into('>16h', data, loop + 0x10, *(rng.randint(-0x800, 0x7FF) for _ in range(16)))
+        else:
+            struct.pack_into('>4I', data, loop, 0, num_samples_in_loop, 0, num_samples_in_loop)
+
+        num_coefficients = 8 * order * num_predictors
+        struct.pack_into('>2i', data, book, order, num_predictors)
+        struct.pack_into(f'>{num_coefficients}h', data, book + 0x08, *(rng.randint(-0x8000, 0x7FFF) for _ in range(num_coefficients)))
+
+    for envelope in envelopes:
+        for point in range(envelope_points):
+            struct.pack_into('>2h', data, envelope + (4 * point), rng.randint(1, 500), rng.randint(0, 0x7FFF))
+        struct.pack_into('>2h', data, envelope + (4 * envelope_points), -1, 0)
+
+    def tuned_sample() -> tuple[int, float]:
+        return rng.choice(samples), rng.uniform(0.25, 4.0)
+
+    for i, instrument in enumerate(instruments):
+        if not instrument:
+            continue
+        struct.pack_into('>I', data, 0x08 + (4 * i), instrument)
+        low, prim, high = tuned_sample(), tuned_sample(), tuned_sample()
+        low_key, high_key = sorted(rng.sample(range(1, 127), 2))
+        struct.pack_into(
+            '>4BIIfIfIf', data, instrument,
+            0, low_key, high_key, rng.randint(0, 255), rng.choice(envelopes), *low, *prim, *high
+        )
+
+    for i, drum in enumerate(drums):
+        if not drum:
+            continue
+        struct.pack_into('>I', data, drum_list + (4 * i), drum)
+        sample, tuning = tuned_sample()
+        struct.pack_into('>4BIfI', data, drum, rng.randint(0, 255), rng.randint(0, 127), 0, 0, sample, tuning, rng.choice(envelopes))
+
+    for i, used in enumerate(effect_slots):
+        if used:
+            struct.pack_into('>If', data, effect_list + (8 * i), *tuned_sample())
+
+    table_entry = struct.pack('>2I4B2BH', 0, bank_size, 2, 2, 1, 0xFF, num_instruments, num_drums, num_effects)
+    return SyntheticBank(table_entry, bytes(data), offsets)
@@ -1,14 +1,807 @@
+import asyncio
+import io
+import json
 import os
+import struct
 import sys
 
-from zelda64audiobank.audiobank import Audiobank
+import numpy as np
+import pytest
 
-with open(sys.argv[1], 'rb') as e:
-    entry_data = e.read()
+from benchmarks.fuzz import book_bomb, envelope_chain
+from benchmarks.synthetic import generate_bank
+from zelda64audiobank.__main__ import main
+from zelda64audiobank.adsr import decay_step, envelope_curve
+from zelda64audiobank.audiobank import Audiobank, BankView
+from zelda64audiobank.bankstruct import (
+    BankFormatError, BankStruct, EnvelopeLengthError, ParseContext, ParseLimits, PointerAlignmentError, PointerCycleError,
+    PointerRangeError, TruncatedBankError, WorkBudgetError, pointer,
+)
+from zelda64audiobank.cache import BankCache, DiskCache, bank_digest, estimate_size
+from zelda64audiobank.columns import columns_from_bytes, corpus_columns
+from zelda64audiobank.constants import AudioSampleCodec
+from zelda64audiobank.decoder import decode_samples, decode_vadpcm_batch
+from zelda64audiobank.diff import diff_banks
+from zelda64audiobank.render import NoteEvent, render_clips, render_notes
+from zelda64audiobank.duplicates import find_duplicates, index_bank
+from zelda64audiobank.loader import load_banks
+from zelda64audiobank import stats as parse_stats
+from zelda64audiobank.samplebank import SampleBankTable
+from zelda64audiobank.table import AudiobankTable
+from zelda64audiobank.structures.drum import Drum
+from zelda64audiobank.structures.envelope import Envelope, EnvelopePoint
+from zelda64audiobank.structures.instrument import Instrument
+from zelda64audiobank.structures.metadata import AudiobankEntry
+from zelda64audiobank.structures.sample import Sample, SampleFlags
+from zelda64audiobank.structures.tuned_sample import TunedSample
+from zelda64audiobank.structures.vadpcm import VadpcmBook
 
-with open(sys.argv[2], 'rb') as b:
-    bank_data = b.read()
+def test_effect_index_past_255():
+    bank = generate_bank(num_instruments=2, num_drums=2, num_effects=300, empty_slots=0, seed=1)
+    effects = columns_from_bytes(bank.table_entry, bank.bank_data)['effects']
+    assert effects['index'].tolist() == list(range(300))
 
-abbank = Audiobank.from_bytes(entry_data, bank_data)
+def test_columns_match_parsed_bank():
+    bank = generate_bank(num_instruments=8, num_drums=8, num_effects=8, sharing=0.5, seed=10)
+    abbank = Audiobank.from_bytes(bank.table_entry, bank.bank_data, record_origins=True)
+    tables = columns_from_bytes(bank.table_entry, bank.bank_data)
 
-print(abbank.drums[0])
\ No newline at end of file
+    instruments = tables['instruments']
+    assert instruments['index'].tolist() == abbank.instrument_indices
+    assert instruments['offset'].tolist() == [abbank.origin_of(instrument) for instrument in abbank.instruments]
+    assert instruments['low_key_region'].tolist() == [instrument.low_key_region for instrument in abbank.instruments]
+    assert instruments['envelope'].tolist() == [abbank.origin_of(instrument.envelope) for instrument in abbank.instruments]
+    assert tables['drums']['index'].tolist() == abbank.drum_indices
+    assert tables['effects']['index'].tolist() == abbank.effect_indices
+    samples = {abbank.origin_of(target) for node in abbank.instruments + abbank.drums + abbank.effects for target in node.pointer_targets() if isinstance(target, Sample)}
+    assert tables['samples']['offset'].tolist() == sorted(samples)
+    assert set(tables['envelopes']['offset'].tolist()) == {abbank.origin_of(instrument.envelope) for instrument in abbank.instruments + abbank.drums}
+
+    # Loop states and codebooks are runs of the flat value arrays
+    nodes = {}
+    for sample in {id(target): target for node in abbank.instruments + abbank.drums + abbank.effects for target in node.pointer_targets() if isinstance(target, Sample)}.values():
+        nodes[abbank.origin_of(sample.loop)] = sample.loop
+        nodes[abbank.origin_of(sample.book)] = sample.book
+
+    def runs(table: str, array: str, start: str, count: str) -> dict[int, list[int]]:
+        rows = tables[table]
+        return {offset: tables[array][first:first + n].tolist() for offset, first, n in zip(rows['offset'].tolist(), rows[start].tolist(), rows[count].tolist())}
+
+    loops = runs('loops', 'loop_predictors', 'predictor_start', 'predictor_count')
+    books = runs('books', 'book_coefficients', 'coefficient_start', 'coefficient_count')
+    assert any(loops.values()) and not all(loops.values())
+    assert loops == {offset: list(nodes[offset].predictors) for offset in loops}
+    assert books == {offset: list(nodes[offset].predictors) for offset in books}
+    assert len(tables['book_coefficients']) == tables['books']['coefficient_count'].sum()
+
+    corpus = corpus_columns([(bank.table_entry, bank.bank_data), abbank])
+    assert corpus['instruments']['bank'].tolist() == [0] * len(instruments) + [1] * len(instruments)
+    # Starts in corpus tables index the concatenated value arrays
+    def coefficients(tables: dict, bank: int) -> list[list[int]]:
+        books = tables['books'][tables['books']['bank'] == bank]
+        return [tables['book_coefficients'][first:first + n].tolist() for first, n in zip(books['coefficient_start'].tolist(), books['coefficient_count'].tolist())]
+
+    assert len(corpus['book_coefficients']) == 2 * len(tables['book_coefficients'])
+    assert coefficients(corpus, 1) == coefficients(abbank.to_columns(), 0)
+
+def test_columns_bounds_checks():
+    bank = generate_bank(num_instruments=4, num_drums=4, num_effects=4, seed=11)
+    # Lists that run past the end of the bank data
+    bank_data = bytearray(bank.bank_data)
+    struct.pack_into('>I', bank_data, 0, len(bank_data) - 4)
+    with pytest.raises(TruncatedBankError, match='Drum list'):
+        columns_from_bytes(bank.table_entry, bytes(bank_data))
+    with pytest.raises(TruncatedBankError, match='Instrument list'):
+        columns_from_bytes(bank.table_entry, bank.bank_data[:0x10])
+
+    # A codebook claiming more coefficients than the bank holds
+    table_entry, bank_data = book_bomb()
+    for strict in (False, True):
+        with pytest.raises(TruncatedBankError):
+            columns_from_bytes(table_entry, bank_data, strict=strict)
+    table_entry, bank_data = book_bomb(order=0, num_predictors=4)
+    assert columns_from_bytes(table_entry, bank_data)['books']['coefficient_count'].tolist() == [0]
+    with pytest.raises(BankFormatError):
+        columns_from_bytes(table_entry, bank_data, strict=True)
+
+def test_disk_cache_round_trip(tmp_path):
+    bank = generate_bank(num_instruments=16, num_drums=8, num_effects=8, seed=4)
+    parsed = Audiobank.from_bytes(bank.table_entry, bank.bank_data, collect_stats=True)
+    DiskCache(tmp_path).put(bank.table_entry, bank.bank_data, parsed)
+
+    loaded = DiskCache(tmp_path).get(bank.table_entry, bank.bank_data)
+    assert loaded is not parsed and loaded.parse_stats is None
+    assert loaded.to_bytes() == parsed.to_bytes()
+    assert loaded.to_dict() == parsed.to_dict()
+
+    # Structures shared between instruments, drums and effects are still shared
+    def samples(abbank: Audiobank) -> list[Sample]:
+        tuned = [instrument.prim_key_region_sample for instrument in abbank.instruments]
+        tuned += [drum.tuned_sample for drum in abbank.drums] + abbank.effects
+        return [tuned_sample.sample for tuned_sample in tuned]
+    assert len({id(sample) for sample in samples(loaded)}) == len({id(sample) for sample in samples(parsed)}) < len(samples(parsed))
+    assert all(type(sample) is Sample for sample in samples(loaded))
+
+    # Banks parsed with change tracking are stored as the types they were parsed as
+    tracked = Audiobank.from_bytes(bank.table_entry, bank.bank_data, track_changes=True)
+    DiskCache(tmp_path).put(bank.table_entry, bank.bank_data, tracked)
+    assert DiskCache(tmp_path).get(bank.table_entry, bank.bank_data).to_dict() == parsed.to_dict()
+
+    # A file that cannot be read is a miss, and is removed
+    cache = DiskCache(tmp_path)
+    path = cache._path(bank_digest(bank.table_entry, bank.bank_data))
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) // 2)
+    assert cache.get(bank.table_entry, bank.bank_data) is None
+    assert not os.path.exists(path)
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    banks = [generate_bank(num_instruments=4, num_drums=4, num_effects=4, seed=seed) for seed in range(4)]
+    sizes = []
+    for bank in banks:
+        cache = DiskCache(tmp_path / 'sizes')
+        cache.load(bank.table_entry, bank.bank_data)
+        sizes.append(cache._size)
+        cache.clear()
+
+    # Room for the first three banks, so the fourth write evicts the two oldest
+    cache = DiskCache(tmp_path / 'cache', max_size=sum(sizes[:3]))
+    scans = []
+    files = cache._files
+    cache._files = lambda: scans.append(None) or files()
+    for bank in banks[:3]:
+        cache.load(bank.table_entry, bank.bank_data)
+    assert len(scans) == 1
+    cache.load(banks[3].table_entry, banks[3].bank_data)
+    assert len(scans) == 2
+
+    assert [cache.get(bank.table_entry, bank.bank_data) is not None for bank in banks] == [False, False, True, True]
+    assert cache._size == sum(size for _, _, size in files()) == sizes[2] + sizes[3]
+
+def test_bank_cache_evicts_least_recently_used():
+    banks = [generate_bank(num_instruments=4, num_drums=4, num_effects=4, seed=seed) for seed in range(3)]
+    sizes = [estimate_size(Audiobank.from_bytes(bank.table_entry, bank.bank_data)) for bank in banks]
+    cache = BankCache(max_bytes=sizes[0] + max(sizes[1:]))
+
+    first = cache.load(banks[0].table_entry, banks[0].bank_data)
+    assert cache.load(banks[0].table_entry, banks[0].bank_data) is first
+    cache.load(banks[1].table_entry, banks[1].bank_data)
+    # Using the first bank again makes the second one the least recently used
+    cache.get(banks[0].table_entry, banks[0].bank_data)
+    cache.load(banks[2].table_entry, banks[2].bank_data)
+
+    assert cache.get(banks[1].table_entry, banks[1].bank_data) is None
+    assert cache.get(banks[0].table_entry, banks[0].bank_data) is first
+    stats = cache.stats()
+    assert (stats.hits, stats.evictions, stats.entries) == (3, 1, 2)
+    assert stats.size <= cache.max_bytes
+
+def test_find_duplicates_across_banks():
+    bank = generate_bank(num_instruments=8, num_drums=8, num_effects=8, seed=2)
+    other = generate_bank(num_instruments=8, num_drums=8, num_effects=8, seed=3)
+    index = index_bank(bank.table_entry, bank.bank_data)
+
+    report = find_duplicates([(bank.table_entry, bank.bank_data), (other.table_entry, other.bank_data), (bank.table_entry, bank.bank_data)])
+    assert report.banks == 3
+    assert {(0, offset) for *_, offset in index} <= {location for group in report.groups for location in group.locations}
+    for group in report.groups:
+        assert group.count >= 2
+        # Sample groups only count their headers
+        assert group.saved_bytes == (group.count - 1) * group.size
+    assert report.saved_bytes() >= sum(size for _, _, size, _, _ in index)
+
+def test_record_origins_without_tracking():
+    bank = generate_bank(num_instruments=4, num_drums=4, num_effects=4, empty_slots=0, seed=4)
+    abbank = Audiobank.from_bytes(bank.table_entry, bank.bank_data, record_origins=True)
+    instrument = abbank.instruments[0]
+    assert abbank.origin_of(instrument) == bank.offsets['Instrument'][0]
+    assert type(instrument) is Instrument
+    assert abbank.origin_of(instrument.envelope) is not None
+    plain = Audiobank.from_bytes(bank.table_entry, bank.bank_data)
+    assert plain.origin_of(plain.instruments[0]) is None
+    assert plain.origin_of(instrument) is None
+
+def test_patch_into_writes_only_changed_structures():
+    bank = generate_bank(num_instruments=4, num_drums=4, num_effects=4, sharing=0, empty_slots=0, seed=8)
+    abbank = Audiobank.from_bytes(bank.table_entry, bank.bank_data, track_changes=True)
+    bank_data = bytearray(bank.bank_data)
+
+    instrument = abbank.instruments[1]
+    point = abbank.drums[0].envelope.points[0]
+    instrument.high_key_region = 99
+    point.amp_or_index = 1234
+    # Each tracked bank reports to its own tracker
+    other = Audiobank.from_bytes(bank.table_entry, bank.bank_data, track_changes=True)
+    assert other.patch_into(bytearray(bank.bank_data)) == []
+
+    ranges = abbank.patch_into(bank_data)
+    instrument_at, point_at = abbank.origin_of(instrument), abbank.origin_of(point)
+    assert ranges == [(instrument_at, instrument_at + 0x20), (point_at, point_at + 4)]
+    assert [i for i in range(len(bank_data)) if bank_data[i] != bank.bank_data[i]] == [instrument_at + 2, point_at + 2, point_at + 3]
+    assert abbank.patch_into(bank_data) == []
+
+    reparsed = Audiobank.from_bytes(bank.table_entry, bytes(bank_data))
+    assert reparsed.instruments[1].high_key_region == 99
+    assert reparsed.drums[0].envelope.points[0].amp_or_index == 1234
+
+def test_write_back_lays_out_again_when_sizes_change():
+    bank = generate_bank(num_instruments=4, num_drums=4, num_effects=4, sharing=0, empty_slots=0, seed=8)
+    abbank = Audiobank.from_bytes(bank.table_entry, bank.bank_data, track_changes=True)
+    bank_data = bytearray(bank.bank_data)
+
+    envelope = abbank.instruments[0].envelope
+    envelope.points.insert(0, envelope.points[0])
+    envelope.mark_dirty()
+    assert abbank.patch_into(bank_data) is None
+    new_data, table_entry = abbank.write_back(bank_data)
+    assert bank_data == bank.bank_data
+    assert len(Audiobank.from_bytes(table_entry, new_data).instruments[0].envelope.points) == len(envelope.points)
+
+def test_to_dict_and_write_json():
+    bank = generate_bank(num_instruments=4, num_drums=4, num_effects=4, sharing=1, empty_slots=0, seed=9)
+    abbank = Audiobank.from_bytes(bank.table_entry, bank.bank_data)
+    data = abbank.to_dict()
+
+    structs = data['structs']
+    assert [structs[offset]['type'] for offset in data['instruments']] == ['Instrument'] * 4
+    # Every instrument points to the same envelope, which is converted once
+    envelopes = {structs[offset]['fields']['envelope'] for offset in data['instruments']}
+    assert len(envelopes) == 1 and structs[envelopes.pop()]['type'] == 'Envelope'
+    assert [node['type'] for node in structs.values()].count('Envelope') == 1
+
+    fp = io.StringIO()
+    abbank.write_json(fp)
+    assert json.loads(fp.getvalue()) == json.loads(json.dumps(data))
+    assert len(fp.getvalue().splitlines()) == len(structs) + 2
+
+def test_bank_repr():
+    bank = generate_bank(num_instruments=4, num_drums=4, num_effects=4, sharing=1, empty_slots=0, seed=9)
+    abbank = Audiobank.from_bytes(bank.table_entry, bank.bank_data)
+    text = repr(abbank)
+    lines = text.splitlines()
+    assert lines[0] == 'Audiobank(' and lines[-1] == ')'
+    assert lines[1].startswith('  metadata=AudiobankEntry(')
+    # The envelope shared by every instrument and drum is written out once
+    assert text.count('envelope=Envelope(') == 1
+    assert text.count('envelope=<Envelope, shown above>') == 7
+    assert '  instrument_indices=[0, 1, 2, 3]' in lines
+    assert repr(abbank.instruments[0]) in text.replace('\n    ', '\n')
+
+def _sample_table_rom() -> bytes:
+    # A sample bank index at 0x100 and an Audiotable segment at 0x1000 whose bytes count up from 0
+    rom = bytearray(0x2000)
+    entries = [(0, 0x800), (0x800, 0x400), (0, 0), (0xC00, 0x100)]
+    struct.pack_into('>hhI8x', rom, 0x100, len(entries), 0, 0)
+    for i, (addr, size) in enumerate(entries):
+        struct.pack_into('>IIbbhhh', rom, 0x110 + (16 * i), addr, size, 2, 0, 0, 0, 0)
+    rom[0x1000:] = bytes(i & 0xFF for i in range(0x1000))
+    return bytes(rom)
+
+def _sample(medium: int, is_relocated: int, addr: int, size: int) -> Sample:
+    return Sample._new_(SampleFlags(0, 0, medium, 0, is_relocated, size), addr, None, None)
+
+def test_sample_bank_table_resolution(tmp_path):
+    rom = _sample_table_rom()
+    table = SampleBankTable.from_bytes(rom, 0x100, rom, 0x1000)
+    assert len(table) == 4 and table[2] is table[0]
+    assert [len(bank) for bank in table] == [0x800, 0x400, 0x800, 0x100]
+
+    sample_banks = table.select(AudiobankEntry.from_bytes(struct.pack('>IIBBBBBBH', 0, 0, 2, 2, 0, 1, 0, 0, 0)))
+    assert bytes(_sample(0, 0, 0x10, 4).data(sample_banks)) == bytes([0x10, 0x11, 0x12, 0x13])
+    # Medium 1 reads from the second sample bank, at 0x800 in the Audiotable
+    assert bytes(_sample(1, 0, 0x12, 2).data(sample_banks)) == bytes([0x12, 0x13])
+    assert _sample(1, 0, 0x12, 2).data(sample_banks).obj is not None
+    # Relocated samples hold an Audiotable address
+    assert bytes(_sample(0, 1, 0xC05, 2).data(sample_banks)) == bytes([5, 6])
+    with pytest.raises(ValueError):
+        _sample(1, 0, 0x3FF, 2).data(sample_banks)
+
+    # Without a second sample bank, medium 1 reads from the first one
+    sample_banks = table.select(AudiobankEntry.from_bytes(struct.pack('>IIBBBBBBH', 0, 0, 2, 2, 3, 0xFF, 0, 0, 0)))
+    assert bytes(_sample(1, 0, 0x2, 1).data(sample_banks)) == bytes([2])
+    with pytest.raises(ValueError):
+        table.select(AudiobankEntry.from_bytes(struct.pack('>IIBBBBBBH', 0, 0, 2, 2, 4, 0xFF, 0, 0, 0)))
+
+    rom_path = tmp_path / 'rom.z64'
+    rom_path.write_bytes(rom)
+    with SampleBankTable.from_file(rom_path, 0x100, audiotable_offset=0x1000) as table:
+        data = _sample(0, 0, 0x20, 4).data(table.select(AudiobankEntry.from_bytes(struct.pack('>IIBBBBBBH', 0, 0, 2, 2, 3, 0xFF, 0, 0, 0))))
+        assert bytes(data) == bytes([0x20, 0x21, 0x22, 0x23])
+        data.release()
+
+def _sine_bank() -> tuple[Audiobank, bytes]:
+    # A bank playing one 440 Hz sine, stored as 16-bit PCM, one second long at 32 kHz
+    sine = (np.sin(2 * np.pi * 440 * np.arange(32000) / 32000) * 20000).astype('>i2').tobytes()
+    sample = Sample._new_(SampleFlags(0, 5, 0, 0, 0, len(sine)), 0, None, None)
+    envelope = Envelope._new_([EnvelopePoint._new_(1, 32767), EnvelopePoint._new_(-1, 0)])
+    empty = TunedSample._new_(None, 1.0)
+    bank = Audiobank()
+    bank.metadata = AudiobankEntry.from_bytes(struct.pack('>IIBBBBBBH', 0, 0, 2, 2, 0, 0xFF, 2, 1, 0))
+    bank.instruments = [
+        Instrument._new_(False, 0, 127, 200, envelope, empty, TunedSample._new_(sample, 1.0), empty),
+        Instrument._new_(False, 0, 30, 200, envelope, empty, TunedSample._new_(sample, 1.0), empty),
+    ]
+    bank.instrument_indices = [0, 1]
+    bank.drums = [Drum._new_(200, 64, False, 0, TunedSample._new_(sample, 0.5), envelope)]
+    bank.drum_indices = [0]
+    return bank, sine
+
+def _peak_frequency(clip: 'np.ndarray', frames: int = 8000) -> float:
+    return np.argmax(np.abs(np.fft.rfft(clip[:frames].astype(np.float64)))) * 32000 / frames
+
+def test_render_clips_pitch_and_regions():
+    bank, sine = _sine_bank()
+    instrument, limited = bank.instruments
+    clips = render_clips(bank, sine, [(instrument, 60, 127, 0.5), (instrument, 72, 127, 0.5), (0, 48, 127, 0.5), (bank.drums[0], 90, 127, 0.5), (limited, 72, 127, 0.5)])
+    assert [_peak_frequency(clip) for clip in clips[:4]] == [440, 880, 220, 220]
+    # The sample is one second long, so a note an octave up runs out of sample data after half a second
+    assert 16000 <= len(clips[0]) <= 32000 and len(clips[1]) == 16000
+    # Game note 51 is above the high key region of the second instrument, which has no sample
+    assert len(clips[4]) == 0
+    assert all(clip.dtype == np.int16 for clip in clips)
+
+def test_render_notes_mixes_at_start_times():
+    bank, sine = _sine_bank()
+    clip, = render_clips(bank, sine, [NoteEvent(0, 60, 127, 0.25)])
+    mix = render_notes(bank, sine, [NoteEvent(0, 60, 127, 0.25, 0.0), NoteEvent(0, 60, 127, 0.25, 1.0)])
+    assert len(clip) <= 32000 and len(mix) == 32000 + len(clip)
+    # Mixing may round differently by one step
+    assert np.abs(mix[:len(clip)].astype(np.int32) - clip).max() <= 1
+    assert np.abs(mix[32000:].astype(np.int32) - clip).max() <= 1
+
+def test_diff_banks_added_removed_changed():
+    bank = generate_bank(num_instruments=6, num_drums=4, num_effects=4, sharing=0, empty_slots=0, seed=5)
+    edited = Audiobank.from_bytes(bank.table_entry, bank.bank_data)
+    edited.instruments[0].low_key_region += 1
+    del edited.instruments[2], edited.instrument_indices[2]
+    edited.effects.append(edited.effects[0])
+    edited.effect_indices.append(4)
+
+    changes = {(change.path, change.kind) for change in diff_banks((bank.table_entry, bank.bank_data), edited)}
+    assert changes == {
+        ('instruments[0].low_key_region', 'changed'),
+        ('instruments[2]', 'removed'),
+        ('effects[4]', 'added'),
+    }
+    assert not diff_banks((bank.table_entry, bank.bank_data), (bank.table_entry, bank.bank_data))
+
+def _with_instrument_pointer(bank, offset: int) -> bytes:
+    bank_data = bytearray(bank.bank_data)
+    struct.pack_into('>I', bank_data, 0x08, offset)
+    return bytes(bank_data)
+
+def test_strict_truncated_bank():
+    bank = generate_bank(num_instruments=4, num_drums=4, num_effects=4, seed=6)
+    with pytest.raises(TruncatedBankError):
+        Audiobank.from_bytes(bank.table_entry, bank.bank_data[:0x10], strict=True)
+
+def test_strict_pointer_out_of_range():
+    bank = generate_bank(num_instruments=4, num_drums=4, num_effects=4, empty_slots=0, seed=6)
+    with pytest.raises(PointerRangeError):
+        Audiobank.from_bytes(bank.table_entry, _with_instrument_pointer(bank, 0x7FFFFFF0), strict=True)
+
+def test_strict_misaligned_pointer():
+    bank = generate_bank(num_instruments=4, num_drums=4, num_effects=4, empty_slots=0, seed=6)
+    bank_data = _with_instrument_pointer(bank, bank.offsets['Instrument'][0] + 1)
+    with pytest.raises(PointerAlignmentError):
+        Audiobank.from_bytes(bank.table_entry, bank_data, strict=True)
+
+def test_strict_pointer_cycle():
+    class Link(BankStruct):
+        _fields_ = [('next', pointer(None)), ('value', pointer(None))]
+    for _, _, field_type in Link._pointers_:
+        field_type.struct_type = Link
+
+    # A link at 0x10 points to a link at 0x20, which points back to it
+    bank_data = bytearray(0x30)
+    struct.pack_into('>2I', bank_data, 0x10, 0x20, 0)
+    struct.pack_into('>2I', bank_data, 0x20, 0x10, 0)
+    with pytest.raises(PointerCycleError):
+        ParseContext(limits=ParseLimits()).resolve(Link, bytes(bank_data), 0x10)
+
+def test_strict_envelope_length():
+    table_entry, bank_data = envelope_chain(num_instruments=1, run_points=300)
+    with pytest.raises(EnvelopeLengthError):
+        Audiobank.from_bytes(table_entry, bank_data, strict=True)
+    assert len(Audiobank.from_bytes(table_entry, bank_data).instruments[0].envelope.points) == 301
+    with pytest.raises(EnvelopeLengthError):
+        BankView.from_bytes(table_entry, bank_data, strict=True).instrument(0).envelope
+    with pytest.raises(EnvelopeLengthError):
+        columns_from_bytes(table_entry, bank_data, strict=True)
+
+def test_strict_work_budget():
+    table_entry, bank_data = envelope_chain(num_instruments=64, run_points=200)
+    with pytest.raises(WorkBudgetError):
+        Audiobank.from_bytes(table_entry, bank_data, strict=True)
+    with pytest.raises(WorkBudgetError):
+        columns_from_bytes(table_entry, bank_data, strict=True)
+
+def test_envelope_disable_holds_for_one_update():
+    curve = envelope_curve([(4, 32767), (0, 0)])
+    assert curve.render(7).tolist() == [0.25, 0.5, 0.75, 1.0, 1.0, 0.0, 0.0]
+    # Released after the envelope stopped the note
+    assert curve.render(7, release_at=5, decay_index=1).tolist() == [0.25, 0.5, 0.75, 1.0, 1.0, 0.0, 0.0]
+
+def test_envelope_hang_goto_and_release():
+    assert envelope_curve([(2, 32767), (-1, 0)]).render(5).tolist() == [0.5, 1.0, 1.0, 1.0, 1.0]
+    # The game delay is scaled by the update rate, and GOTO repeats from the point it jumps to
+    curve = envelope_curve([(8, 32767), (8, 0), (-2, 0)], update_rate=120.0)
+    assert curve.render(12).tolist() == [0.25, 0.5, 0.75, 1.0, 0.75, 0.5, 0.25, 0.0, 0.25, 0.5, 0.75, 1.0]
+
+    step = decay_step(200)
+    released = envelope_curve([(4, 32767), (-1, 0)]).render(8, release_at=4, decay_index=200)
+    assert released[:4].tolist() == [0.25, 0.5, 0.75, 1.0]
+    assert released[4:] == pytest.approx([1.0 - step * i for i in range(1, 5)])
+
+def test_to_bytes_round_trip():
+    for sharing in (0, 0.5, 1):
+        bank = generate_bank(num_instruments=8, num_drums=8, num_effects=8, sharing=sharing, seed=7)
+        abbank = Audiobank.from_bytes(bank.table_entry, bank.bank_data)
+        bank_data, table_entry = abbank.to_bytes()
+        reparsed = Audiobank.from_bytes(table_entry, bank_data)
+
+        # Laying out a bank that was read from `to_bytes` reproduces it byte for byte
+        assert reparsed.to_bytes() == (bank_data, table_entry)
+        assert len(table_entry) == 0x10 and len(abbank.to_bytes(truncated=True)[1]) == 0x08
+        assert reparsed.instrument_indices == abbank.instrument_indices
+        assert reparsed.effect_indices == abbank.effect_indices
+        memo = {}
+        assert [node.content_hash() for node in reparsed.instruments + reparsed.drums + reparsed.effects] == \
+            [node.content_hash(memo) for node in abbank.instruments + abbank.drums + abbank.effects]
+
+def _book_bytes(order: int, num_predictors: int, seed: int) -> bytes:
+    rng = np.random.default_rng(seed)
+    coefficients = rng.integers(-0x1000, 0x1000, 8 * order * num_predictors)
+    return struct.pack(f'>2i{len(coefficients)}h', order, num_predictors, *coefficients.tolist())
+
+def _reference_vadpcm(data: bytes, book: VadpcmBook, codec: AudioSampleCodec) -> list[int]:
+    # One output sample at a time, as the game's decode step is usually written
+    order = book.header.order
+    coefficients = [book.predictors[i * 8:(i + 1) * 8] for i in range(order * book.header.num_predictors)]
+    bits, max_shift = (4, 12) if codec == AudioSampleCodec.ADPCM else (2, 14)
+    frame_size = 1 + 2 * bits
+    out = [0] * 8
+    for frame in range(len(data) // frame_size):
+        header = data[frame * frame_size]
+        shift = min(header >> 4, max_shift)
+        rows = coefficients[(header & 0xF) * order:((header & 0xF) + 1) * order]
+        codes = []
+        for byte in data[frame * frame_size + 1:(frame + 1) * frame_size]:
+            for position in range(8 // bits - 1, -1, -1):
+                code = (byte >> (position * bits)) & ((1 << bits) - 1)
+                codes.append(code - (1 << bits) if code >= 1 << (bits - 1) else code)
+        for half in range(2):
+            residuals = [code << shift for code in codes[half * 8:(half + 1) * 8]]
+            history = out[len(out) - order:]
+            for j in range(8):
+                total = sum(rows[o][j] * history[o] for o in range(order))
+                total += residuals[j] << 11
+                total += sum(rows[order - 1][j - k - 1] * residuals[k] for k in range(j))
+                out.append(max(-0x8000, min(0x7FFF, total >> 11)))
+    return out[8:]
+
+def test_vadpcm_batch_matches_scalar_reference():
+    rng = np.random.default_rng(3)
+    samples = []
+    for order, num_predictors, codec, num_frames in [
+        (2, 2, AudioSampleCodec.ADPCM, 40),
+        (4, 1, AudioSampleCodec.SMALL_ADPCM, 25),
+        (2, 4, AudioSampleCodec.ADPCM, 0),
+        (3, 2, AudioSampleCodec.SMALL_ADPCM, 7),
+    ]:
+        book = VadpcmBook.from_bytes(_book_bytes(order, num_predictors, seed=order), 0)
+        frame_size = 9 if codec == AudioSampleCodec.ADPCM else 5
+        data = bytearray(rng.integers(0, 0x100, num_frames * frame_size, dtype=np.uint8).tobytes())
+        for frame in range(num_frames):
+            # Every scale shift, including the ones past the saturation point, and valid predictors only
+            data[frame * frame_size] = ((frame % 16) << 4) | (data[frame * frame_size] % num_predictors)
+        samples.append((bytes(data), book, codec))
+
+    decoded = decode_vadpcm_batch(samples)
+    assert [len(pcm) for pcm in decoded] == [640, 400, 0, 112]
+    for (data, book, codec), pcm in zip(samples, decoded):
+        assert pcm.dtype == np.int16
+        assert pcm.tolist() == _reference_vadpcm(data, book, codec)
+
+def test_decode_looped_sample():
+    # A looped sample, its loop with the predictor state and its codebook, followed by the sample data
+    book = _book_bytes(2, 2, seed=5)
+    num_frames = 12
+    data = bytes(((i % 2) | 0x90) if i % 9 == 0 else (i * 37) & 0xFF for i in range(num_frames * 9))
+    buffer = bytearray(0x40)
+    struct.pack_into('>4I', buffer, 0, (AudioSampleCodec.ADPCM << 28) | len(data), 0, 0x10, 0x40)
+    struct.pack_into('>3Ii16h', buffer, 0x10, 16, num_frames * 16, 0xFFFFFFFF, num_frames * 16, *range(16))
+    sample = Sample.from_bytes(bytes(buffer) + book, 0, ParseContext())
+    assert sample.loop.header.loop_start == 16 and len(sample.loop.predictors) == 16
+
+    pcm, = decode_samples([sample], data)
+    assert pcm.tolist() == _reference_vadpcm(data, sample.book, AudioSampleCodec.ADPCM)
+
+def _audiobank_rom(links: dict[int, int]) -> tuple[bytes, list]:
+    # An audiobank index at 0x100 and an Audiobank segment at 0x400. Entries in `links` have a size of 0 and
+    # refer to another entry.
+    banks = [generate_bank(num_instruments=4, num_drums=2, num_effects=2, seed=seed) for seed in range(3)]
+    num_entries = len(banks) + len(links)
+    rom = bytearray(0x400)
+    struct.pack_into('>hhI8x', rom, 0x100, num_entries, 0, 0)
+    real = iter(banks)
+    for i in range(num_entries):
+        if i in links:
+            entry = struct.pack('>2I8x', links[i], 0)
+        else:
+            bank = next(real)
+            entry = struct.pack('>2I', len(rom) - 0x400, len(bank.bank_data)) + bank.table_entry[8:]
+            rom += bank.bank_data
+        rom[0x110 + 0x10 * i:0x120 + 0x10 * i] = entry
+    return bytes(rom), banks
+
+def test_audiobank_table_aliases_and_process_pool(tmp_path):
+    # Entry 1 refers to entry 0, and entry 4 to entry 1 and so to entry 0 as well
+    rom, banks = _audiobank_rom({1: 0, 4: 1})
+    table = AudiobankTable.from_bytes(rom, 0x100, rom, 0x400)
+    assert len(table.banks) == 5
+    assert table.banks[1] is table.banks[0] and table.banks[4] is table.banks[0]
+    assert [bank.to_bytes()[0] for bank in (table.banks[0], table.banks[2], table.banks[3])] == \
+        [Audiobank.from_bytes(bank.table_entry, bank.bank_data).to_bytes()[0] for bank in banks]
+
+    path = tmp_path / 'rom.bin'
+    path.write_bytes(rom)
+    pooled = AudiobankTable.from_file(path, 0x100, bank_offset=0x400, jobs=2)
+    assert pooled.banks[1] is pooled.banks[0] and pooled.banks[4] is pooled.banks[0]
+    assert [bank.to_bytes() for bank in pooled.banks] == [bank.to_bytes() for bank in table.banks]
+
+    rom, _ = _audiobank_rom({1: 4, 4: 1})
+    with pytest.raises(ValueError, match='reference loop'):
+        AudiobankTable.from_bytes(rom, 0x100, rom, 0x400)
+    rom, _ = _audiobank_rom({1: 9})
+    with pytest.raises(ValueError, match='nonexistent entry 9'):
+        AudiobankTable.from_bytes(rom, 0x100, rom, 0x400)
+
+def _bank_files(tmp_path, count: int) -> list[tuple[str, str]]:
+    pairs = []
+    for seed in range(count):
+        bank = generate_bank(num_instruments=4, num_drums=2, num_effects=2, seed=seed)
+        entry_path, bank_path = tmp_path / f'{seed}.entry', tmp_path / f'{seed}.bank'
+        entry_path.write_bytes(bank.table_entry)
+        bank_path.write_bytes(bank.bank_data)
+        pairs.append((entry_path, bank_path))
+    return pairs
+
+def test_load_banks_backpressure_and_errors(tmp_path):
+    pairs = _bank_files(tmp_path, 8)
+    pairs[2] = (pairs[2][0], tmp_path / 'missing.bank')
+    # A bank header pointing past the end of the bank data
+    (tmp_path / 'broken.bank').write_bytes(b'\xff' * 8)
+    pairs[5] = (pairs[5][0], tmp_path / 'broken.bank')
+    taken = []
+
+    async def source():
+        for pair in pairs:
+            taken.append(pair)
+            yield pair
+
+    async def consume():
+        results = []
+        async for result in load_banks(source(), concurrency=3, ordered=True):
+            # No more pairs are taken than the results yielded so far plus `concurrency`
+            assert len(taken) <= len(results) + 3
+            results.append(result)
+            await asyncio.sleep(0.01)
+        return results
+
+    results = asyncio.run(consume())
+    assert [result.index for result in results] == list(range(8))
+    assert [result.ok for result in results] == [True, True, False, True, True, False, True, True]
+    assert isinstance(results[2].error, FileNotFoundError) and results[2].bank is None
+    assert results[5].error is not None and results[5].bank is None
+    assert results[7].bank.to_bytes() == Audiobank.from_bytes(pairs[7][0].read_bytes(), pairs[7][1].read_bytes()).to_bytes()
+
+    async def first():
+        async for result in load_banks(source(), concurrency=2):
+            return result
+
+    taken.clear()
+    assert asyncio.run(first()).ok
+    assert len(taken) <= 2
+
+    async def invalid():
+        return await anext(load_banks(pairs, concurrency=0))
+
+    with pytest.raises(ValueError, match='concurrency'):
+        asyncio.run(invalid())
+
+def _cli_records(capsys, argv: list[str]) -> tuple[int, list[dict]]:
+    status = main([str(arg) for arg in argv])
+    return status, [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+def test_cli_records_and_exit_status(tmp_path, capsys):
+    rom, banks = _audiobank_rom({1: 0, 4: 1})
+    (tmp_path / 'rom.bin').write_bytes(rom)
+    status, records = _cli_records(capsys, [tmp_path / 'rom.bin', '--table-offset', '0x100', '--bank-offset', '0x400', '--structs'])
+    assert status == 0
+
+    bank_records = [record for record in records if record['record'] == 'bank']
+    assert [(record['entry'], record.get('alias_of')) for record in bank_records] == [(0, None), (1, 0), (2, None), (3, None), (4, 0)]
+    assert all(record['ok'] for record in bank_records)
+    assert bank_records[0]['instruments'] == len(Audiobank.from_bytes(banks[0].table_entry, banks[0].bank_data).instruments)
+
+    # The struct records of a bank come before its bank record, and point to each other by offset
+    structs = records[:records.index(bank_records[0])]
+    assert structs and all(record['record'] == 'struct' and record['entry'] == 0 for record in structs)
+    by_offset = {record['offset']: record for record in structs}
+    instruments = [record for record in structs if record['type'] == 'Instrument']
+    assert {record['offset'] for record in instruments} == set(banks[0].offsets['Instrument'])
+    assert all(by_offset[record['fields']['envelope']]['type'] == 'Envelope' for record in instruments)
+
+    status, pooled = _cli_records(capsys, [tmp_path / 'rom.bin', '--table-offset', '0x100', '--bank-offset', '0x400', '--jobs', '2'])
+    assert status == 0
+    assert sorted(json.dumps(record) for record in pooled) == sorted(json.dumps(record) for record in bank_records)
+
+    # A broken bank, a file that is neither a bank nor a ROM, and an index with a reference loop
+    bank = generate_bank(num_instruments=2, num_drums=2, num_effects=2, seed=1)
+    (tmp_path / 'good.zbank').write_bytes(bank.bank_data)
+    (tmp_path / 'good.bankmeta').write_bytes(bank.table_entry)
+    (tmp_path / 'bad.zbank').write_bytes(b'\xff' * 8)
+    (tmp_path / 'bad.bankmeta').write_bytes(bank.table_entry)
+    (tmp_path / 'loop.bin').write_bytes(_audiobank_rom({1: 4, 4: 1})[0])
+    status, records = _cli_records(capsys, [tmp_path / 'bad.zbank', tmp_path / 'good.zbank', tmp_path / 'notes.txt', tmp_path / 'loop.bin'])
+    assert status == 1
+    assert [(record['ok'], os.path.basename(record['source'])) for record in records] == \
+        [(False, 'bad.zbank'), (True, 'good.zbank'), (False, 'notes.txt'), (False, 'loop.bin')]
+    assert 'no --table-offset' in records[2]['error']
+
+    status, records = _cli_records(capsys, [tmp_path / 'loop.bin', '--table-offset', '0x100', '--bank-offset', '0x400'])
+    assert status == 1
+    assert [(record['entry'], record['ok']) for record in records] == [(0, True), (1, False), (2, True), (3, True), (4, False)]
+    assert 'reference loop' in records[1]['error']
+
+def test_key_tables_regions_and_drums():
+    bank = generate_bank(num_instruments=6, num_drums=10, num_effects=2, empty_slots=0.3, seed=6)
+    abbank = Audiobank.from_bytes(bank.table_entry, bank.bank_data)
+    instruments, drums, _ = abbank.list_slots()
+    assert None in instruments and None in drums
+    tables = abbank.key_tables()
+    assert abbank.key_tables() is tables
+
+    for slot, instrument in enumerate(instruments):
+        for note in range(128):
+            tuned_sample, ratio = tables.instrument(slot, note)
+            if instrument is None:
+                assert (tuned_sample, ratio) == (None, 0.0)
+                continue
+            game_note = note - 21
+            if game_note < instrument.low_key_region:
+                expected = instrument.low_key_region_sample
+            elif game_note <= instrument.high_key_region:
+                expected = instrument.prim_key_region_sample
+            else:
+                expected = instrument.high_key_region_sample
+            if expected is None or expected.sample is None:
+                assert (tuned_sample, ratio) == (None, 0.0)
+            else:
+                assert tuned_sample is expected
+                assert ratio == pytest.approx(expected.tuning * 2 ** ((note - 60) / 12), rel=1e-6)
+
+    # Drum slot n is played by MIDI note 21 + n, at the drum's own tuning
+    for note in range(128):
+        slot = note - 21
+        drum = drums[slot] if 0 <= slot < len(drums) else None
+        tuned_sample, ratio = tables.drum(note)
+        assert tables.drum_index[note] == (slot if drum is not None else -1)
+        if drum is None:
+            assert (tuned_sample, ratio) == (None, 0.0)
+        else:
+            assert tuned_sample is drum.tuned_sample
+            assert ratio == pytest.approx(drum.tuned_sample.tuning)
+
+    # Tables are kept until rebuilt, and a region without a sample does not sound
+    slot = instruments.index(next(instrument for instrument in instruments if instrument is not None))
+    instrument = instruments[slot]
+    instrument.low_key_region, instrument.high_key_region = 30, 50
+    instrument.high_key_region_sample = None
+    assert abbank.key_tables() is tables
+    rebuilt = abbank.key_tables(rebuild=True)
+    assert rebuilt.instrument(slot, 21 + 29)[0] is instrument.low_key_region_sample
+    assert rebuilt.instrument(slot, 21 + 30)[0] is instrument.prim_key_region_sample
+    assert rebuilt.instrument(slot, 21 + 50)[0] is instrument.prim_key_region_sample
+    assert rebuilt.instrument(slot, 21 + 51) == (None, 0.0)
+    assert rebuilt.slot_of(instrument) == slot
+    with pytest.raises(ValueError):
+        rebuilt.slot_of(Instrument.from_bytes(bank.bank_data, bank.offsets['Instrument'][0]))
+
+def test_parse_stats_time_excludes_children(monkeypatch):
+    # A clock that advances by one on every reading, so each decode spans one tick of its own plus one for every
+    # structure it decodes through a pointer
+    ticks = iter(range(1_000_000))
+    monkeypatch.setattr(parse_stats, 'perf_counter', lambda: float(next(ticks)))
+    bank = generate_bank(num_instruments=8, num_drums=8, num_effects=4, seed=2)
+    with parse_stats.collect_parse_stats() as collected:
+        abbank = Audiobank.from_bytes(bank.table_entry, bank.bank_data)
+        Audiobank.from_bytes(bank.table_entry, bank.bank_data)
+    stats = abbank.parse_stats
+    assert collected.banks == 2 and collected.total().instances == 2 * stats.total().instances
+
+    for leaf in ('Envelope', 'VadpcmLoop', 'VadpcmBook'):
+        assert stats[leaf].time == stats[leaf].instances
+    assert stats['Sample'].time == stats['Sample'].instances + stats['VadpcmLoop'].instances + stats['VadpcmBook'].instances
+    top_level = stats['Instrument'].instances + stats['Drum'].instances + stats['TunedSample'].instances
+    assert stats.total().time == 2 * stats.total().instances - top_level
+
+    assert stats['Instrument'].instances == len(abbank.instruments)
+    assert stats['Instrument'].pointer_derefs == len(abbank.instruments)
+    assert stats['Sample'].repeat_visits == stats['Sample'].pointer_derefs - stats['Sample'].instances
+
+def test_bank_view_matches_eager_parse():
+    bank = generate_bank(num_instruments=8, num_drums=8, num_effects=4, sharing=0.7, empty_slots=0.2, seed=9)
+    eager = Audiobank.from_bytes(bank.table_entry, bank.bank_data)
+    view = BankView.from_bytes(bank.table_entry, bank.bank_data)
+    instruments, drums, effects = eager.list_slots()
+
+    # Nothing past the list slot is decoded until a pointer field is read
+    first = view.instrument(eager.instrument_indices[0])
+    _, _, pending = object.__getattribute__(first, '_lazy_')
+    assert set(pending) == {name for name, _, _ in Instrument._pointers_}
+    assert first.envelope.to_dict() == instruments[eager.instrument_indices[0]].envelope.to_dict()
+    assert 'envelope' not in pending
+
+    for slots, get in ((instruments, view.instrument), (drums, view.drum), (effects, view.effect)):
+        for index, node in enumerate(slots):
+            lazy = get(index)
+            assert lazy is get(index)
+            if node is None:
+                assert lazy is None
+                continue
+            assert lazy.to_dict() == node.to_dict()
+            assert lazy.content_hash() == node.content_hash()
+
+    # Structures shared in the bank are shared between the structures of the view as well
+    eager_samples = {id(target) for node in eager.instruments for target in node.pointer_targets()}
+    lazy_samples = {id(target) for index in eager.instrument_indices for target in view.instrument(index).pointer_targets()}
+    assert len(lazy_samples) == len(eager_samples)
+    with pytest.raises(IndexError):
+        view.drum(len(drums))
+
+def _is_mapped(path) -> bool:
+    with open('/proc/self/maps') as maps:
+        return any(line.rstrip().endswith(str(path)) for line in maps)
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/maps'), reason='needs /proc/self/maps to see file mappings')
+def test_from_file_releases_its_mapping(tmp_path):
+    bank = generate_bank(num_instruments=4, num_drums=4, num_effects=2, seed=10)
+    entry_path, bank_path = tmp_path / 'bank.bankmeta', tmp_path / 'bank.zbank'
+    entry_path.write_bytes(bank.table_entry)
+    bank_path.write_bytes(bank.bank_data)
+    eager = Audiobank.from_bytes(bank.table_entry, bank.bank_data)
+
+    # The parsed bank does not keep the mapping alive
+    loaded = Audiobank.from_file(entry_path, bank_path)
+    assert not _is_mapped(bank_path)
+    assert loaded.to_bytes() == eager.to_bytes()
+
+    with BankView.from_file(entry_path, bank_path) as view:
+        assert _is_mapped(bank_path)
+        instrument = view.instrument(eager.instrument_indices[0])
+        envelope = instrument.envelope
+        assert envelope.to_dict() == eager.instruments[0].envelope.to_dict()
+    assert not _is_mapped(bank_path)
+    # Resolved pointers stay usable, but the unresolved ones can no longer be read
+    assert envelope.to_dict() == eager.instruments[0].envelope.to_dict()
+    with pytest.raises(ValueError):
+        instrument.prim_key_region_sample.sample
+
+    # A view that fails to open does not leak its mapping either
+    (tmp_path / 'short.bankmeta').write_bytes(b'\0' * 4)
+    with pytest.raises(ValueError):
+        BankView.from_file(tmp_path / 'short.bankmeta', bank_path)
+    assert not _is_mapped(bank_path)
+
+if __name__ == '__main__':
+    with open(sys.argv[1], 'rb') as e:
+        entry_data = e.read()
+
+    with open(sys.argv[2], 'rb') as b:
+        bank_data = b.read()
+
+    abbank = Audiobank.from_bytes(entry_data, bank_data)
+
+    print(abbank.drums[0])
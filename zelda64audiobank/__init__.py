@@ -5,4 +5,6 @@ Zelda64 Audiobank
 WIP
 
 A library for parsing Zelda64 instrument banks.
-"""
\ No newline at end of file
+"""
+
+__version__ = '0.1.0'
@@ -0,0 +1,189 @@
+"""
+Command Line
+=====
+
+Parses instrument banks in bulk and streams one JSON record per line to stdout as each bank is parsed.
+
+Usage::
+
+    python -m zelda64audiobank banks/ --jobs 8                  # every .zbank/.bankmeta pair under banks/
+    python -m zelda64audiobank song.zbank --structs             # one record per structure as well
+    python -m zelda64audiobank rom.z64 --table-offset 0xBCC4E0  # every bank of a decompressed ROM
+
+Directories are searched recursively for `.zbank` files with a `.bankmeta` table entry of the same name. Any other
+file is read as a ROM or code segment holding the audiobank index at `--table-offset`, with the Audiobank segment
+in the same file at `--bank-offset`, or in the file given by `--bank-file`.
+
+Every bank produces a record with `"record": "bank"`. With `--structs`, it is preceded by one record with
+`"record": "struct"` per structure stored in the bank, pointers being given as the offset of their target. A bank
+that fails to parse produces a bank record with `"ok": false` and the error, and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from typing import Iterator
+
+from .audiobank import Audiobank
+from .cache import bank_digest
+from .helpers import mapped_file
+from .structures.metadata import AudiobankEntry
+from .table import AudiobankTable
+
+# A unit of work: (source path, entry index or None, table entry, bank path, bank start, bank size or None)
+Job = tuple[str, int | None, bytes | None, str, int, int | None]
+
+def _find_jobs(paths: list[str], table_offset: int | None, bank_file: str | None, bank_offset: int) -> Iterator[Job | dict]:
+    """ Yields a job for every bank found in `paths`, or a record for entries that are not parsed themselves. """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                for name in sorted(names):
+                    if name.endswith('.zbank'):
+                        yield from _find_jobs([os.path.join(root, name)], table_offset, bank_file, bank_offset)
+        elif path.endswith('.zbank'):
+            yield (path, None, None, path, 0, None)
+        elif table_offset is None:
+            yield {'record': 'bank', 'source': path, 'entry': None, 'ok': False, 'error': 'not a .zbank file, and no --table-offset was given'}
+        else:
+            yield from _rom_jobs(path, table_offset, bank_file or path, bank_offset)
+
+def _rom_jobs(path: str, table_offset: int, bank_path: str, bank_offset: int) -> Iterator[Job | dict]:
+    try:
+        with mapped_file(path) as table_data:
+            header, table_entries = AudiobankTable.read_index(table_data, table_offset)
+    except Exception as e:
+        yield {'record': 'bank', 'source': path, 'entry': None, 'ok': False, 'error': _describe(e)}
+        return
+
+    entries = [AudiobankEntry.from_bytes(table_entry) for table_entry in table_entries]
+    for i, (table_entry, entry) in enumerate(zip(table_entries, entries)):
+        try:
+            real_index = AudiobankTable.real_index(entries, i)
+        except ValueError as e:
+            yield {'record': 'bank', 'source': path, 'entry': i, 'ok': False, 'error': _describe(e)}
+            continue
+        if real_index != i:
+            yield {'record': 'bank', 'source': path, 'entry': i, 'ok': True, 'alias_of': real_index}
+        else:
+            yield (path, i, table_entry, bank_path, bank_offset + entry.rom_addr, entry.bank_size)
+
+def _describe(e: BaseException) -> str:
+    return f'{type(e).__name__}: {e}'
+
+def _read_job(job: Job) -> tuple[bytes, bytes]:
+    source, _, table_entry, bank_path, bank_start, bank_size = job
+    if table_entry is None:
+        with open(os.path.splitext(source)[0] + '.bankmeta', 'rb') as e:
+            table_entry = e.read()
+    with open(bank_path, 'rb') as b:
+        b.seek(bank_start)
+        bank_data = b.read() if bank_size is None else b.read(bank_size)
+    if bank_size is not None and len(bank_data) != bank_size:
+        raise ValueError(f'Bank at {hex(bank_start)} extends past the end of {bank_path}')
+    return table_entry, bank_data
+
+def _process(job: Job, structs: bool) -> list[dict]:
+    source, index = job[0], job[1]
+    try:
+        table_entry, bank_data = _read_job(job)
+        # Struct records refer to each other by the offset every structure was read from
+        bank = Audiobank.from_bytes(table_entry, bank_data, record_origins=structs)
+    except Exception as e:
+        return [{'record': 'bank', 'source': source, 'entry': index, 'ok': False, 'error': _describe(e)}]
+
+    stored = []
+    seen = set()
+    pending = deque(bank.instruments + bank.drums)
+    pending.extend(target for effect in bank.effects for target in effect.pointer_targets())
+    counts: dict[str, int] = {}
+    while pending:
+        node = pending.popleft()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        stored.append(node)
+        counts[type(node).__name__] = counts.get(type(node).__name__, 0) + 1
+        pending.extend(node.pointer_targets())
+
+    records = []
+    if structs:
+        offsets = {id(node): bank.origin_of(node) for node in stored}
+        records = [
+            {
+                'record': 'struct', 'source': source, 'entry': index,
+                'type': type(node).__name__, 'offset': offsets[id(node)], 'fields': node.to_dict(offsets),
+            }
+            for node in stored
+        ]
+
+    metadata = bank.metadata
+    records.append({
+        'record': 'bank', 'source': source, 'entry': index, 'ok': True,
+        'digest': bank_digest(table_entry, bank_data),
+        'bank_size': len(bank_data),
+        'medium': metadata.to_dict()['medium'],
+        'sample_banks': [metadata.sample_bank_id_1, metadata.sample_bank_id_2],
+        'instruments': len(bank.instruments),
+        'drums': len(bank.drums),
+        'effects': len(bank.effects),
+        'structures': counts,
+    })
+    return records
+
+def _run(jobs: Iterator[Job | dict], workers: int, structs: bool) -> Iterator[list[dict]]:
+    """ Yields the records of each job as soon as it finishes. """
+    if workers <= 1:
+        for job in jobs:
+            yield [job] if isinstance(job, dict) else _process(job, structs)
+        return
+
+    # Only a few jobs per worker are submitted ahead, so huge corpora are not queued up front
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        running = set()
+        for job in jobs:
+            if isinstance(job, dict):
+                yield [job]
+                continue
+            running.add(pool.submit(_process, job, structs))
+            # Wait for a result once enough jobs are queued, and otherwise only take the results already finished
+            timeout = None if len(running) >= workers * 4 else 0
+            done, running = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+        for future in as_completed(running):
+            yield future.result()
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m zelda64audiobank', description='Parse Zelda64 instrument banks and print one JSON record per line.')
+    parser.add_argument('paths', nargs='+', help='directories, .zbank files, or ROMs and code segments with --table-offset')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='number of worker processes, 0 for one per CPU (default: %(default)s)')
+    parser.add_argument('--structs', action='store_true', help='also print a record for every structure of each bank')
+    parser.add_argument('--table-offset', type=lambda s: int(s, 0), help='offset of the audiobank index in ROM and code segment files')
+    parser.add_argument('--bank-file', help='file holding the Audiobank segment, if it is not the file holding the index')
+    parser.add_argument('--bank-offset', type=lambda s: int(s, 0), default=0, help='offset of the Audiobank segment (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    workers = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    jobs = _find_jobs(args.paths, args.table_offset, args.bank_file, args.bank_offset)
+
+    failed = False
+    try:
+        for records in _run(jobs, workers, args.structs):
+            for record in records:
+                if record['record'] == 'bank' and not record['ok']:
+                    failed = True
+                sys.stdout.write(json.dumps(record) + '\n')
+            sys.stdout.flush()
+    except BrokenPipeError:
+        # The reader went away, such as `head`. Stop quietly, without a second error when stdout is flushed at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
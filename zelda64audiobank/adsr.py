@@ -0,0 +1,336 @@
+"""
+ADSR
+=====
+
+Evaluates envelopes into amplitude curves, following the game's ADSR update.
+
+The game updates every playing note's envelope `update_rate` times per second, at 60 audio frames per second. Each
+envelope point whose time is positive fades the amplitude linearly to `(amp / 32767) ** 2` over
+`time * update_rate / 240` updates (at least one). `GOTO` jumps to another point within the same update, `RESTART`
+waits one update and starts again from the first point, `HANG` holds the amplitude, and `DISABLE` stops the note
+after one more update at its current amplitude. Once a note is released, its amplitude decreases by a fixed step per
+update, chosen by the instrument's `decay_index`, until it reaches 0.
+
+An envelope is walked once into its linear segments, and a looping envelope is cut at the point where it starts to
+repeat. Curves are then expanded from the segments with NumPy, so rendering a curve costs the same for every note
+using the envelope, however many points it has. `envelope_curve` keeps walked envelopes in an LRU cache keyed by
+their content, so envelopes shared between instruments, or across banks, are walked once.
+
+Requires NumPy.
+"""
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .cache import CacheStats
+from .constants import AdsrOpcode
+from .structures.envelope import Envelope
+
+DEFAULT_UPDATE_RATE = 240.0
+""" Envelope updates per second when the game runs 4 audio updates per frame. """
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('Evaluating envelopes requires NumPy')
+
+@lru_cache(maxsize=16)
+def _decay_table(update_rate: float) -> 'np.ndarray':
+    # AudioHeap_InitAdsrDecayTable: each step is 1 / (updatesPerFrame * scaleInv)
+    scale_inv = np.empty(256, dtype=np.float64)
+    i = np.arange(256)
+    scale_inv[1:16] = 60 * (23 - i[1:16])
+    scale_inv[16:128] = 4 * (143 - i[16:128])
+    scale_inv[128:251] = 251 - i[128:251]
+    scale_inv[251:] = [0.75, 0.66, 0.5, 0.33, 0.25]
+
+    table = np.empty(256, dtype=np.float64)
+    table[1:] = 1.0 / ((update_rate / 60.0) * scale_inv[1:])
+    table[0] = 0.0
+    table.setflags(write=False)
+    return table
+
+def decay_step(decay_index: int, update_rate: float = DEFAULT_UPDATE_RATE) -> float:
+    """
+    Returns how much a released note's amplitude decreases per update.
+
+    Args:
+        decay_index (int): The instrument's or drum's `decay_index`, from 0 (never decays) to 255 (immediate).
+        update_rate (float): Envelope updates per second.
+
+    Returns:
+        step (float): The decrease of the amplitude per update.
+    """
+    _require_numpy()
+    if not 0 <= decay_index <= 0xFF:
+        raise ValueError(f'Decay index {decay_index} out of range')
+    return float(_decay_table(float(update_rate))[decay_index])
+
+def _envelope_key(envelope: Envelope | list[tuple[int, int]]) -> tuple[tuple[int, int], ...]:
+    if isinstance(envelope, Envelope):
+        return tuple((point._time_or_opcode, point.amp_or_index) for point in envelope.points)
+    return tuple((int(time_or_opcode), int(amp_or_index)) for time_or_opcode, amp_or_index in envelope)
+
+class EnvelopeCurve:
+    """
+    The amplitude curve of an envelope, stored as linear segments of one update or more.
+
+    The curve is made of a fixed part, followed by what the envelope ends with: a hold of the last amplitude (`HANG`),
+    silence after the last amplitude is held for one update (`DISABLE`), or a repetition of the segments from
+    `loop_start` on (`GOTO` or `RESTART`).
+
+    Attributes:
+        update_rate (float): Envelope updates per second.
+        length (int): Number of updates covered by the segments.
+        end (AdsrOpcode): `HANG`, `DISABLE`, or `GOTO` for a looping curve.
+        loop_start (int): First update of the repeating part of a looping curve, or `length` otherwise.
+        render (method): Returns the amplitude after each update of a note.
+    """
+    def __init__(self, points: tuple[tuple[int, int], ...], update_rate: float = DEFAULT_UPDATE_RATE):
+        _require_numpy()
+        self.update_rate: float = float(update_rate)
+
+        lengths, values, steps, end, loop_start = self._walk(points, self.update_rate)
+        self.end: AdsrOpcode = end
+        self._lengths = np.array(lengths, dtype=np.int64)
+        self._values = np.array(values, dtype=np.float64)
+        self._steps = np.array(steps, dtype=np.float64)
+        self._ends = np.cumsum(self._lengths)
+        self.length: int = int(self._ends[-1]) if len(self._ends) else 0
+        self.loop_start: int = self.length if loop_start is None else loop_start
+        self._final = values[-1] + steps[-1] * lengths[-1] if lengths else 0.0
+
+        # Amplitudes before release, expanded on demand and kept for the next note of the same length or shorter
+        self._prefix = np.empty(0, dtype=np.float32)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _walk(points: tuple[tuple[int, int], ...], update_rate: float):
+        lengths, values, steps = [], [], []
+        scale = update_rate / 240.0
+        current = 0.0
+        index = 0
+        elapsed = 0
+        jumps: dict[tuple[int, float], int] = {}   # (point, amplitude) after each jump, to the update it happened at
+        visited: set[int] = set()                  # Points visited since the last update
+
+        while True:
+            if not 0 <= index < len(points):
+                raise ValueError(f'Envelope reaches nonexistent point {index}')
+            if index in visited:
+                raise ValueError(f'Envelope loops through point {index} without advancing time')
+            visited.add(index)
+            time_or_opcode, amp_or_index = points[index]
+
+            if time_or_opcode > 0:
+                # The game truncates the scaled delay, and waits for at least one update
+                length = max(int(time_or_opcode * scale), 1)
+                target = (amp_or_index / 32767.0) ** 2
+                lengths.append(length)
+                values.append(current)
+                steps.append((target - current) / length)
+                elapsed += length
+                current = target
+                index += 1
+                visited.clear()
+                continue
+
+            if time_or_opcode == AdsrOpcode.DISABLE:
+                # The note keeps its amplitude for the update that reads the opcode, and is silent from the next one
+                lengths.append(1)
+                values.append(current)
+                steps.append(0.0)
+                return lengths, values, steps, AdsrOpcode.DISABLE, None
+            if time_or_opcode == AdsrOpcode.HANG:
+                return lengths, values, steps, AdsrOpcode.HANG, None
+            if time_or_opcode == AdsrOpcode.GOTO:
+                index = amp_or_index
+            elif time_or_opcode == AdsrOpcode.RESTART:
+                # The envelope starts over on the next update, holding its amplitude for this one
+                lengths.append(1)
+                values.append(current)
+                steps.append(0.0)
+                elapsed += 1
+                index = 0
+                visited.clear()
+            else:
+                raise ValueError(f'Unknown envelope opcode {time_or_opcode} at point {index}')
+
+            # Segments always end on an exact target, so a repeated (point, amplitude) pair repeats everything after it
+            state = (index, current)
+            if state in jumps:
+                return lengths, values, steps, AdsrOpcode.GOTO, jumps[state]
+            jumps[state] = elapsed
+
+    def _expand(self, updates: 'np.ndarray') -> 'np.ndarray':
+        if self.end == AdsrOpcode.GOTO and self.length > self.loop_start:
+            period = self.length - self.loop_start
+            updates = np.where(
+                updates < self.length, updates, self.loop_start + (updates - self.loop_start) % period
+            )
+
+        segment = np.searchsorted(self._ends, updates, side='right')
+        inside = segment < len(self._lengths)
+        segment = np.minimum(segment, len(self._lengths) - 1)
+        into = updates - (self._ends[segment] - self._lengths[segment]) + 1
+        amplitude = self._values[segment] + self._steps[segment] * into
+
+        after = 0.0 if self.end == AdsrOpcode.DISABLE else self._final
+        return np.where(inside, amplitude, after).astype(np.float32)
+
+    def _sustain(self, num_updates: int) -> 'np.ndarray':
+        with self._lock:
+            if len(self._prefix) < num_updates:
+                # An envelope that stops or hangs before its first update stays silent
+                prefix = np.zeros(num_updates, dtype=np.float32) if self.length == 0 else self._expand(np.arange(num_updates))
+                prefix.setflags(write=False)
+                self._prefix = prefix
+            return self._prefix[:num_updates]
+
+    def render(self, num_updates: int, release_at: int | None = None, decay_index: int = 0) -> 'np.ndarray':
+        """
+        Returns the amplitude of a note after each of its first `num_updates` updates.
+
+        Without a release, the result is a read-only view of amplitudes shared by every note of the envelope.
+
+        Args:
+            num_updates (int): Number of updates to render.
+            release_at (int | None): Number of updates the note is held for before it is released, or `None`.
+            decay_index (int): The instrument's or drum's `decay_index`, which sets how fast a released note decays.
+
+        Returns:
+            amplitude (ndarray): `num_updates` amplitudes from 0 to 1, as float32.
+        """
+        if num_updates < 0:
+            raise ValueError(f'Cannot render {num_updates} updates')
+        if release_at is None or release_at >= num_updates:
+            return self._sustain(num_updates)
+
+        release_at = max(release_at, 0)
+        held = self._sustain(release_at)
+        start = float(held[-1]) if release_at > 0 else 0.0
+        if self.end == AdsrOpcode.DISABLE and release_at >= self.length:
+            # The envelope stopped the note before it was released
+            start = 0.0
+
+        step = decay_step(decay_index, self.update_rate)
+        released = start - step * np.arange(1, num_updates - release_at + 1, dtype=np.float64)
+        # The game silences the note once its amplitude drops below 0.00001
+        released[released < 0.00001] = 0.0
+        return np.concatenate((held, released.astype(np.float32)))
+
+    @property
+    def nbytes(self) -> int:
+        return self._prefix.nbytes + self._lengths.nbytes + self._values.nbytes + self._steps.nbytes + self._ends.nbytes
+
+    def __repr__(self):
+        return f'EnvelopeCurve(segments={len(self._lengths)}, length={self.length}, end={self.end}, loop_start={self.loop_start})'
+
+class CurveCache:
+    """
+    An LRU cache of envelope curves, keyed by the content of the envelope and the update rate.
+
+    Keying by content rather than by object means envelopes that are equal but stored separately share one curve,
+    and an envelope that is modified after being rendered is walked again. The cache can be shared between threads.
+
+    Attributes:
+        get (method): Returns the curve of an envelope, walking and caching it on a miss.
+        clear (method): Removes every cached curve.
+        stats (method): Returns the cache's usage statistics.
+    """
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries: int = max_entries
+        self._curves: OrderedDict[tuple, EnvelopeCurve] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def __len__(self):
+        return len(self._curves)
+
+    def get(self, envelope: Envelope | list[tuple[int, int]], update_rate: float = DEFAULT_UPDATE_RATE) -> EnvelopeCurve:
+        """
+        Returns the curve of an envelope, walking and caching it on a miss.
+
+        Args:
+            envelope (Envelope | list[tuple[int, int]]): The envelope, or its (time or opcode, amp or index) pairs.
+            update_rate (float): Envelope updates per second.
+
+        Returns:
+            curve (EnvelopeCurve): The envelope's amplitude curve.
+        """
+        key = (_envelope_key(envelope), float(update_rate))
+        with self._lock:
+            curve = self._curves.get(key)
+            if curve is not None:
+                self._curves.move_to_end(key)
+                self._hits += 1
+                return curve
+            self._misses += 1
+
+        curve = EnvelopeCurve(key[0], update_rate)
+
+        with self._lock:
+            # Another thread may have walked the same envelope first, so keep returning a single object
+            curve = self._curves.setdefault(key, curve)
+            self._curves.move_to_end(key)
+            while len(self._curves) > self.max_entries:
+                self._curves.popitem(last=False)
+                self._evictions += 1
+        return curve
+
+    def clear(self):
+        """ Removes every cached curve. Statistics are kept. """
+        with self._lock:
+            self._curves.clear()
+
+    def stats(self) -> CacheStats:
+        """ Returns the cache's usage statistics, the size being the memory held by the cached curves. """
+        with self._lock:
+            size = sum(curve.nbytes for curve in self._curves.values())
+            return CacheStats(self._hits, self._misses, self._evictions, len(self._curves), size)
+
+_default_cache = CurveCache()
+
+def envelope_curve(envelope: Envelope | list[tuple[int, int]], update_rate: float = DEFAULT_UPDATE_RATE, cache: CurveCache | None = _default_cache) -> EnvelopeCurve:
+    """
+    Returns the amplitude curve of an envelope.
+
+    Args:
+        envelope (Envelope | list[tuple[int, int]]): The envelope, or its (time or opcode, amp or index) pairs.
+        update_rate (float): Envelope updates per second.
+        cache (CurveCache | None): The cache to look the curve up in, or `None` to walk the envelope every time.
+
+    Returns:
+        curve (EnvelopeCurve): The envelope's amplitude curve.
+    """
+    if cache is None:
+        return EnvelopeCurve(_envelope_key(envelope), update_rate)
+    return cache.get(envelope, update_rate)
+
+def render_envelope(
+    envelope: Envelope | list[tuple[int, int]],
+    num_updates: int,
+    release_at: int | None = None,
+    decay_index: int = 0,
+    update_rate: float = DEFAULT_UPDATE_RATE,
+) -> 'np.ndarray':
+    """
+    Renders the amplitude of a note played with an envelope, one value per update.
+
+    Args:
+        envelope (Envelope | list[tuple[int, int]]): The envelope, or its (time or opcode, amp or index) pairs.
+        num_updates (int): Number of updates to render.
+        release_at (int | None): Number of updates the note is held for before it is released, or `None`.
+        decay_index (int): The instrument's or drum's `decay_index`, which sets how fast a released note decays.
+        update_rate (float): Envelope updates per second.
+
+    Returns:
+        amplitude (ndarray): `num_updates` amplitudes from 0 to 1, as float32.
+    """
+    return envelope_curve(envelope, update_rate).render(num_updates, release_at, decay_index)
@@ -2,84 +2,682 @@
 Audiobank
 =====
 """
+import os
+import json
+import mmap
 import struct
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Iterator, TextIO
 
+from .bankstruct import BankStruct, ChangeTracker, ParseContext, ParseLimits, PointerAlignmentError, nested_repr
+from .helpers import mapped_file
+from .stats import ParseStats, StatsContext, active_collector
 from .structures.metadata import AudiobankEntry
 from .structures.instrument import Instrument
 from .structures.drum import Drum
 from .structures.tuned_sample import TunedSample
 
+def _read_table_entry(table_entry: bytes) -> AudiobankEntry:
+    # There are two table_entry lengths possible at the current time taking OOTR and MMR music into account.
+    # The regular table_entry length from the audiobank index in code is 16 bytes long and includes an address
+    # to the audiobank and its size in bytes. The truncated tables used by custom music files for OOTR and MMR
+    # are only 8 bytes long because the address and size are built by the randomizers.
+    match memoryview(table_entry).nbytes:
+        case 0x08:
+            _table_entry: bytes = (b'\x00' * 8) + table_entry
+        case 0x10:
+            _table_entry: bytes = table_entry
+        case _:
+            raise ValueError(f'Unexpected table entry size, expected 0x08 or 0x10 bytes, but got {hex(memoryview(table_entry).nbytes)} bytes instead!')
+
+    return AudiobankEntry.from_bytes(_table_entry)
+
+def _check_lists(context: ParseContext, bank_data: bytes, metadata: AudiobankEntry, drum_list_offset: int, effect_list_offset: int):
+    # In strict mode, checks the instrument, drum and effect lists before any of their slots is read
+    lists = [
+        ('Instrument list', 0x08, 4 * metadata.num_instruments),
+        ('Drum list', drum_list_offset, 4 * metadata.num_drums),
+        ('Effect list', effect_list_offset, 8 * metadata.num_effects),
+    ]
+    for name, offset, size in lists:
+        if size == 0:
+            continue
+        if context.limits.check_alignment and offset % 4:
+            raise PointerAlignmentError(f'{name} at {hex(offset)} is not aligned to 4 bytes')
+        context.charge(bank_data, offset, size, name)
+
+@dataclass
+class BankLayout:
+    """
+    Where `Audiobank.to_bytes` places the lists and structures of an instrument bank.
+
+    Attributes:
+        instruments (list[Instrument | None]): The instrument of each list slot, `None` for an empty slot.
+        drums (list[Drum | None]): The drum of each list slot, `None` for an empty slot.
+        effects (list[TunedSample | None]): The effect of each list slot, `None` for an empty slot.
+        drum_list_offset (int): Offset of the drum list.
+        effect_list_offset (int): Offset of the effect list, which holds the effects themselves.
+        groups (dict[type, list[BankStruct]]): Every structure stored in the bank, grouped by type, in the order
+            they are written.
+        offsets (dict[int, int]): The offset of every structure in `groups`, by `id`.
+        end (int): The end of the last structure, before the bank is padded.
+    """
+    instruments: list[Instrument | None]
+    drums: list[Drum | None]
+    effects: list[TunedSample | None]
+    drum_list_offset: int
+    effect_list_offset: int
+    groups: dict[type, list[BankStruct]]
+    offsets: dict[int, int]
+    end: int
+
 class Audiobank:
     """
     Represents a Zelda64 instrument bank.
 
+    Empty list slots are left out of `instruments`, `drums` and `effects`. The slot each entry was read from is
+    kept at the same position in `instrument_indices`, `drum_indices` and `effect_indices`.
+
+    Banks parsed with `track_changes` record changes made to their structures, so `write_back` can patch only
+    the modified bytes into the original bank data instead of laying the whole bank out again.
+
     Attributes:
         from_bytes (method): Parses binary data and creates an `Audiobank` object in memory.
+        to_bytes (method): Converts an `Audiobank` object back into binary data.
+        list_slots (method): Returns the instrument, drum and effect lists with `None` in their empty slots.
+        layout (method): Returns where `to_bytes` places every structure.
+        origin_of (method): Returns the offset a structure was parsed from.
+        write_back (method): Writes the changes made since parsing back into the original binary data.
+        to_columns (method): Exports the instrument bank as tables of NumPy structured arrays.
+        key_tables (method): Returns the cached tables of what every note of every instrument and drum plays.
+        to_dict (method): Converts the instrument bank into a dictionary of plain values.
+        write_json (method): Writes the instrument bank as JSON, one structure at a time.
     """
     def __init__(self):
         self.metadata: AudiobankEntry = None
         self.instruments: list[Instrument] = []
         self.drums: list[Drum] = []
         self.effects: list[TunedSample] = []
+        self.instrument_indices: list[int] = []
+        self.drum_indices: list[int] = []
+        self.effect_indices: list[int] = []
         self.drum_list_offset: int = 0
         self.effect_list_offset: int = 0
+        self.parse_stats: ParseStats | None = None
+        # Offsets structures were parsed from, by `id`, set by `from_bytes` with `record_origins`
+        self._origins: dict[int, tuple[BankStruct, int]] | None = None
+        # Change tracking, set by `from_bytes`
+        self._changes: ChangeTracker | None = None
+        self._layout: tuple | None = None
+        # Built on first use by `key_tables`
+        self._key_tables = None
 
     @classmethod
-    def from_bytes(cls, table_entry: bytes, bank_data: bytes):
+    def from_bytes(cls, table_entry: bytes, bank_data: bytes, collect_stats: bool = False, track_changes: bool = False, strict: bool | ParseLimits = False, record_origins: bool = False):
         """
         Instantiates an instrument bank object using binary data.
 
+        Both arguments may be any object supporting the buffer protocol (`bytes`, `bytearray`, `memoryview`, `mmap`).
+        The bank data is read in place and never copied.
+
+        Parse statistics are collected into `parse_stats` when `collect_stats` is set or when the bank is parsed
+        inside `stats.collect_parse_stats()`, which also aggregates them. Otherwise `parse_stats` is `None`.
+
+        With `record_origins`, the offset every structure was read from is recorded, and returned by `origin_of`.
+        With `track_changes`, it is as well and assignments to the fields of structures are recorded, so
+        `write_back` can patch the edits into `bank_data` in place. Banks that are only read should use
+        `record_origins`, which leaves structures as plain instances of their class.
+
+        Banks from untrusted sources should be parsed with `strict`, which bounds the work a malformed bank can
+        cause: every list and structure is checked against the end of the bank data before it is read, pointers must
+        be aligned, envelopes are limited in length and the bytes decoded are charged against a budget proportional
+        to the size of the bank. Violations raise a subclass of `BankFormatError`, itself a `ValueError`. Pass a
+        `ParseLimits` object to change the limits.
+
         Args:
             table_entry (bytes): Binary table entry data. Can be either truncated (0x08) or full (0x10) bytes long.
             bank_data (bytes): Binary instrument bank data.
+            collect_stats (bool): Whether to collect parse statistics.
+            track_changes (bool): Whether to track changes made to the parsed structures.
+            strict (bool | ParseLimits): Whether to parse strictly, or the limits to parse strictly with.
+            record_origins (bool): Whether to record the offset every structure was read from.
 
         Returns:
             object (Audiobank): A fully parsed instrument bank.
         """
-        # There are two table_entry lengths possible at the current time taking OOTR and MMR music into account.
-        # The regular table_entry length from the audiobank index in code is 16 bytes long and includes an address
-        # to the audiobank and its size in bytes. The truncated tables used by custom music files for OOTR and MMR
-        # are only 8 bytes long because the address and size are built by the randomizers.
-        match len(table_entry):
-            case 0x08:
-                _table_entry: bytes = (b'\x00' * 8) + table_entry
-            case 0x10:
-                _table_entry: bytes = table_entry
-            case _:
-                raise ValueError(f'Unexpected table entry size, expected 0x08 or 0x10 bytes, but got {hex(len(table_entry))} bytes instead!')
-
         obj = cls()
+        limits = ParseLimits() if strict is True else (strict or None)
+        collector = active_collector()
+        if collect_stats or collector is not None:
+            context = StatsContext(track_changes=track_changes, limits=limits, record_origins=record_origins)
+        else:
+            context = ParseContext(track_changes=track_changes, limits=limits, record_origins=record_origins)
 
-        obj.metadata = AudiobankEntry.from_bytes(_table_entry)
-        obj.drum_list_offset, obj.effect_list_offset = struct.unpack('>2I', bank_data[:0x08])
+        obj.metadata = _read_table_entry(table_entry)
+        context.charge(bank_data, 0, 0x08, 'Bank header')
+        obj.drum_list_offset, obj.effect_list_offset = struct.unpack_from('>2I', bank_data, 0)
+
+        if limits is not None:
+            _check_lists(context, bank_data, obj.metadata, obj.drum_list_offset, obj.effect_list_offset)
 
         # From this point, the from_bytes method will walk through every structure that has a pointer or data (effects)
         # and fully instantiate every required child structure. Effects are just a TunedSample struct, so the effect list
         # is just a list of TunedSample structs instead of a list of pointers to another struct. This means each entry is
         # 8 bytes long instead of 4 bytes, because that is the size of the TunedSample struct.
+        #
+        # Every structure is decoded through the same ParseContext, so anything shared between instruments, drums
+        # and effects (usually samples, envelopes, loops and books) is only decoded once and shared by reference.
 
         # Drums
         for i in range(0, obj.metadata.num_drums):
             offset = obj.drum_list_offset + (i * 4)
             drum_offset = struct.unpack_from('>I', bank_data, offset)[0]
             if drum_offset != 0:
-                obj.drums.append(Drum.from_bytes(bank_data, drum_offset))
+                obj.drums.append(context.resolve(Drum, bank_data, drum_offset))
+                obj.drum_indices.append(i)
 
         # Effects
         for i in range(0, obj.metadata.num_effects):
             offset = obj.effect_list_offset + (8 * i)
-            effect = bank_data[offset:offset + 0x08]
-            if effect != (b'\x00' * 8):
-                obj.effects.append(TunedSample.from_bytes(bank_data, offset))
+            if struct.unpack_from('>2I', bank_data, offset) != (0, 0):
+                obj.effects.append(context.decode(TunedSample, bank_data, offset))
+                obj.effect_indices.append(i)
 
         # Instruments
         for i in range(0, obj.metadata.num_instruments):
             offset = 0x08 + (i * 4)
             instrument_offset = struct.unpack_from('>I', bank_data, offset)[0]
             if instrument_offset != 0:
-                obj.instruments.append(Instrument.from_bytes(bank_data, instrument_offset))
+                obj.instruments.append(context.resolve(Instrument, bank_data, instrument_offset))
+                obj.instrument_indices.append(i)
+
+        obj._origins = context.origins
+        if context.tracker is not None:
+            obj._changes = context.tracker
+            obj._layout = obj._list_layout()
+
+        if isinstance(context, StatsContext):
+            obj.parse_stats = context.stats
+            obj.parse_stats.banks = 1
+            if collector is not None:
+                collector.merge(obj.parse_stats)
 
         return obj
 
+    @classmethod
+    def from_file(cls, entry_path: str | os.PathLike, bank_path: str | os.PathLike):
+        """
+        Instantiates an instrument bank object from a table entry file and a bank file.
+
+        The bank file is memory-mapped and parsed in place instead of being read into memory.
+
+        Args:
+            entry_path (str | PathLike): Path to the binary table entry, either truncated (0x08) or full (0x10) bytes long.
+            bank_path (str | PathLike): Path to the binary instrument bank.
+
+        Returns:
+            object (Audiobank): A fully parsed instrument bank.
+        """
+        with open(entry_path, 'rb') as e:
+            table_entry = e.read()
+
+        with mapped_file(bank_path) as bank_data:
+            return cls.from_bytes(table_entry, bank_data)
+
+    @staticmethod
+    def _slots(items: list, indices: list[int], count: int) -> list:
+        # Entries appended without a slot index go into the slots after the last known one
+        positions = list(indices[:len(items)])
+        next_slot = max(positions, default=-1) + 1
+        positions.extend(range(next_slot, next_slot + len(items) - len(positions)))
+
+        slots = [None] * max(count, max(positions, default=-1) + 1)
+        for item, position in zip(items, positions):
+            slots[position] = item
+        return slots
+
+    def list_slots(self) -> tuple[list[Instrument | None], list[Drum | None], list[TunedSample | None]]:
+        """
+        Returns the instrument, drum and effect lists as they are stored in the bank, one entry per list slot.
+
+        Returns:
+            slots (tuple[list, list, list]): The instrument, drum and effect of each list slot, `None` for an empty slot.
+        """
+        return (
+            self._slots(self.instruments, self.instrument_indices, self.metadata.num_instruments),
+            self._slots(self.drums, self.drum_indices, self.metadata.num_drums),
+            self._slots(self.effects, self.effect_indices, self.metadata.num_effects),
+        )
+
+    def layout(self) -> BankLayout:
+        """
+        Places every structure of the bank the way `to_bytes` writes it, without writing anything.
+
+        Returns:
+            layout (BankLayout): The list slots, list offsets and the offset of every structure.
+        """
+        instruments, drums, effects = self.list_slots()
+
+        drum_list_offset = BankStruct._align_to(0x08 + (4 * len(instruments)), 0x10)
+        effect_list_offset = BankStruct._align_to(drum_list_offset + (4 * len(drums)), 0x10)
+        cursor = effect_list_offset + (8 * len(effects))
+
+        # Collect every structure reachable from the lists once, grouped by type in the order they are reached
+        groups: dict[type, list[BankStruct]] = {}
+        seen: set[int] = set()
+        pending = deque()
+        roots = [node for node in instruments + drums if node is not None]
+        roots += [target for effect in effects if effect is not None for target in effect.pointer_targets()]
+        for node in roots:
+            if id(node) not in seen:
+                seen.add(id(node))
+                pending.append(node)
+
+        while pending:
+            node = pending.popleft()
+            groups.setdefault(type(node), []).append(node)
+            for target in node.pointer_targets():
+                if id(target) not in seen:
+                    seen.add(id(target))
+                    pending.append(target)
+
+        offsets: dict[int, int] = {}
+        for struct_type, structs in groups.items():
+            for node in structs:
+                cursor = BankStruct._align_to(cursor, struct_type._align_)
+                offsets[id(node)] = cursor
+                cursor += node.packed_size()
+
+        return BankLayout(instruments, drums, effects, drum_list_offset, effect_list_offset, groups, offsets, cursor)
+
+    def to_bytes(self, truncated: bool = False) -> tuple[bytes, bytes]:
+        """
+        Converts the instrument bank back into binary data.
+
+        The bank is written into a single preallocated buffer. Structures shared by several instruments, drums or
+        effects are written once and every reference points to that copy. Each structure is placed at an offset
+        aligned to its `_align_`, and the bank is padded to a multiple of 0x10 bytes.
+
+        Args:
+            truncated (bool): Whether to return a truncated (0x08) table entry instead of a full (0x10) one.
+
+        Returns:
+            data (tuple[bytes, bytes]): The binary instrument bank and its table entry, updated with the new bank
+                size and list lengths.
+        """
+        layout = self.layout()
+        offsets = layout.offsets
+
+        bank_size = BankStruct._align_to(layout.end, 0x10)
+        bank_data = bytearray(bank_size)
+
+        struct.pack_into('>2I', bank_data, 0, layout.drum_list_offset, layout.effect_list_offset)
+        for i, instrument in enumerate(layout.instruments):
+            struct.pack_into('>I', bank_data, 0x08 + (i * 4), offsets[id(instrument)] if instrument is not None else 0)
+        for i, drum in enumerate(layout.drums):
+            struct.pack_into('>I', bank_data, layout.drum_list_offset + (i * 4), offsets[id(drum)] if drum is not None else 0)
+        for i, effect in enumerate(layout.effects):
+            if effect is not None:
+                effect.pack_into(bank_data, layout.effect_list_offset + (i * 8), offsets)
+
+        for structs in layout.groups.values():
+            for node in structs:
+                node.pack_into(bank_data, offsets[id(node)], offsets)
+
+        table_entry = self._table_entry(bank_size, len(layout.instruments), len(layout.drums), len(layout.effects), truncated)
+        return bytes(bank_data), table_entry
+
+    def _table_entry(self, bank_size: int, num_instruments: int, num_drums: int, num_effects: int, truncated: bool) -> bytes:
+        entry = AudiobankEntry.from_bytes(self.metadata.to_bytes())
+        entry.bank_size = bank_size
+        entry.num_instruments = num_instruments
+        entry.num_drums = num_drums
+        entry.num_effects = num_effects
+        table_entry = entry.to_bytes()
+        return table_entry[0x08:] if truncated else table_entry
+
+    def _list_layout(self) -> tuple:
+        return (
+            tuple(self.instruments), tuple(self.instrument_indices),
+            tuple(self.drums), tuple(self.drum_indices),
+            tuple(self.effects), tuple(self.effect_indices),
+            self.drum_list_offset, self.effect_list_offset
+        )
+
+    def origin_of(self, node: BankStruct) -> int | None:
+        """
+        Returns the offset a structure of this bank was parsed from.
+
+        Args:
+            node (BankStruct): A structure reached from this bank.
+
+        Returns:
+            offset (int | None): The offset of the structure in the bank data, or `None` if the bank was parsed
+                without `record_origins` or `track_changes`, or the structure was not parsed with it.
+        """
+        if self._origins is None:
+            return None
+        entry = self._origins.get(id(node))
+        if entry is None or entry[0] is not node:
+            return None
+        return entry[1]
+
+    @staticmethod
+    def _original_size(node: BankStruct, bank_data: bytes, offset: int) -> int:
+        node_type = type(node).__dict__.get('_untracked_type', type(node))
+        if node_type.packed_size is BankStruct.packed_size:
+            return node_type.size()
+        # Variable-size structures are measured by decoding them again, without following their pointers
+        return node_type.from_bytes(bank_data, offset, ParseContext(lazy=True)).packed_size()
+
+    def patch_into(self, bank_data: bytearray) -> list[tuple[int, int]] | None:
+        """
+        Writes the structures modified since parsing back into the bank data they were parsed from.
+
+        Only the modified structures are packed, each at the offset it was read from. Nothing is written when
+        that is not possible: when the bank was not parsed by `from_bytes`, when a list slot changed, when a
+        structure changed size, or when a modified structure points to one that was not part of the parsed bank.
+        Banks parsed without `track_changes` are never patched.
+
+        Args:
+            bank_data (bytearray): The writable bank data the bank was parsed from.
+
+        Returns:
+            ranges (list[tuple[int, int]] | None): The sorted (start, end) byte ranges that were written, or `None`
+                if the bank has to be laid out again with `to_bytes`.
+        """
+        tracker = self._changes
+        if tracker is None or self._list_layout() != self._layout:
+            return None
+
+        patches = []
+        for node in tracker.dirty.values():
+            origin = self.origin_of(node)
+            size = node.packed_size()
+            if size != self._original_size(node, bank_data, origin):
+                return None
+
+            offsets = {}
+            for target in node.pointer_targets():
+                if target._tracker_ is not tracker:
+                    return None
+                offsets[id(target)] = self.origin_of(target)
+            patches.append((node, origin, offsets, size))
+
+        ranges = []
+        for node, origin, offsets, size in patches:
+            node.pack_into(bank_data, origin, offsets)
+            ranges.append((origin, origin + size))
+        tracker.clear()
+
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    def write_back(self, bank_data: bytearray, truncated: bool = False) -> tuple[bytearray | bytes, bytes]:
+        """
+        Writes the instrument bank back after editing it.
+
+        When the edits fit the original layout, they are patched into `bank_data` in place with `patch_into`, so
+        the cost depends on the number of changes rather than the size of the bank. Otherwise the bank is laid
+        out again with `to_bytes`, and changes are no longer tracked afterwards.
+
+        Args:
+            bank_data (bytearray): The writable bank data the bank was parsed from.
+            truncated (bool): Whether to return a truncated (0x08) table entry instead of a full (0x10) one.
+
+        Returns:
+            data (tuple[bytearray | bytes, bytes]): The binary instrument bank, which is `bank_data` itself when it
+                was patched, and its table entry.
+        """
+        if self.patch_into(bank_data) is None:
+            # Offsets in the new layout no longer match the offsets structures were parsed from
+            self._changes = None
+            self._layout = None
+            self._origins = None
+            return self.to_bytes(truncated)
+
+        table_entry = self._table_entry(
+            len(bank_data), self.metadata.num_instruments, self.metadata.num_drums, self.metadata.num_effects, truncated
+        )
+        return bank_data, table_entry
+
+    def to_columns(self) -> dict:
+        """
+        Exports the instrument bank as columnar tables of NumPy structured arrays. See `columns` for the tables.
+
+        Returns:
+            tables (dict[str, ndarray]): A structured array for each table and a flat array for each of
+                `columns.VALUE_ARRAYS`, by name.
+        """
+        # Imported here because the columns module builds on this one
+        from .columns import bank_columns
+        return bank_columns(self)
+
+    def key_tables(self, rebuild: bool = False):
+        """
+        Returns the tables of the `TunedSample` and playback rate ratio of every note of every instrument and drum,
+        indexed by list slot and MIDI note. See `keytables.KeyTables`.
+
+        The tables are built on first use and kept with the bank. Pass `rebuild` after changing the instruments,
+        drums, key regions or tunings of the bank.
+
+        Returns:
+            tables (KeyTables): The bank's note lookup tables.
+        """
+        if self._key_tables is None or rebuild:
+            # Imported here because NumPy is optional
+            from .keytables import KeyTables
+            instruments, drums, _ = self.list_slots()
+            self._key_tables = KeyTables(instruments, drums)
+        return self._key_tables
+
+    def _dict_parts(self) -> Iterator[tuple[str, Any]]:
+        """ Yields the (key, value) items of `to_dict`, with `structs` as an iterator of (offset, struct) items. """
+        layout = self.layout()
+        offsets = layout.offsets
+
+        def structs():
+            for node in sorted((node for nodes in layout.groups.values() for node in nodes), key=lambda node: offsets[id(node)]):
+                yield offsets[id(node)], {'type': type(node).__name__, 'fields': node.to_dict(offsets)}
+
+        yield 'metadata', self.metadata.to_dict()
+        yield 'instruments', [offsets[id(node)] if node is not None else None for node in layout.instruments]
+        yield 'drums', [offsets[id(node)] if node is not None else None for node in layout.drums]
+        yield 'effects', [effect.to_dict(offsets) if effect is not None else None for effect in layout.effects]
+        yield 'structs', structs()
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Converts the instrument bank into a dictionary of plain values that can be written as JSON.
+
+        Every structure stored in the bank is converted once, under `structs`, keyed by the offset `to_bytes`
+        places it at. The instrument and drum lists hold those offsets, and pointers within structures are given as
+        offsets too, so a structure shared by many instruments appears only once. Effects are stored in the effect
+        list itself, so they are converted in place.
+
+        Returns:
+            data (dict[str, Any]): The table entry metadata, the instrument, drum and effect lists, and the structures.
+        """
+        data = dict(self._dict_parts())
+        data['structs'] = dict(data['structs'])
+        return data
+
+    def write_json(self, fp: TextIO):
+        """
+        Writes the instrument bank as JSON, in the form returned by `to_dict`.
+
+        Structures are converted and written one at a time, each on its own line, so memory use does not grow with
+        the size of the bank and dumps of two banks can be compared with a line-based diff.
+
+        Args:
+            fp (TextIO): The text file to write to.
+        """
+        fp.write('{')
+        for i, (key, value) in enumerate(self._dict_parts()):
+            fp.write(f'{", " if i else ""}{json.dumps(key)}: ')
+            if key != 'structs':
+                fp.write(json.dumps(value))
+                continue
+            fp.write('{')
+            for j, (offset, node) in enumerate(value):
+                fp.write(f'{"," if j else ""}\n{json.dumps(str(offset))}: {json.dumps(node)}')
+            fp.write('\n}')
+        fp.write('}\n')
+
+    def __getstate__(self):
+        # Unpickled structures do not belong to a tracker, so unpickled banks are written back with `to_bytes`
+        state = self.__dict__.copy()
+        state['_changes'] = None
+        state['_layout'] = None
+        # Keyed by the `id` of structures, which unpickled structures do not keep
+        state['_origins'] = None
+        # Rebuilt on demand, and refers to structures of the bank by `id`
+        state['_key_tables'] = None
+        return state
+
     def __repr__(self):
-        ...
+        # Laid out like the repr of a structure, so samples and envelopes shared between instruments, drums and
+        # effects are written out once
+        items = [
+            ('metadata=', self.metadata),
+            ('instruments=', self.instruments),
+            ('drums=', self.drums),
+            ('effects=', self.effects),
+            ('instrument_indices=', self.instrument_indices),
+            ('drum_indices=', self.drum_indices),
+            ('effect_indices=', self.effect_indices),
+            ('drum_list_offset=', self.drum_list_offset),
+            ('effect_list_offset=', self.effect_list_offset),
+        ]
+        return nested_repr('Audiobank(', items, ')')
+
+class BankView:
+    """
+    Represents a lazily parsed Zelda64 instrument bank.
+
+    Only the table entry and the bank header are read up front. Instruments, drums and effects are decoded
+    from their list slot when requested, and their pointer fields are followed on first attribute access.
+    Structures are interned for the lifetime of the view, so requesting the same slot twice returns the
+    same object.
+
+    A view created by `from_file` keeps its bank file mapped until `close` is called, or until the end of a `with`
+    block using the view.
+
+    Views of banks from untrusted sources should be created with `strict`, which checks every list slot and
+    structure the way `Audiobank.from_bytes(strict=...)` does as it is decoded. Without it, envelopes are read
+    until their terminating opcode however long they are.
+
+    Attributes:
+        from_bytes (method): Creates a `BankView` over binary data without parsing it.
+        from_file (method): Creates a `BankView` over a memory-mapped bank file.
+        instrument (method): Returns the instrument in a given list slot.
+        drum (method): Returns the drum in a given list slot.
+        effect (method): Returns the effect in a given list slot.
+    """
+    def __init__(self, metadata: AudiobankEntry, bank_data: bytes, limits: ParseLimits | None = None):
+        self.metadata: AudiobankEntry = metadata
+        self.bank_data: bytes = bank_data
+        self._context = ParseContext(lazy=True, limits=limits)
+        self._context.charge(bank_data, 0, 0x08, 'Bank header')
+        self.drum_list_offset, self.effect_list_offset = struct.unpack_from('>2I', bank_data, 0)
+        if limits is not None:
+            _check_lists(self._context, bank_data, metadata, self.drum_list_offset, self.effect_list_offset)
+        self._mapping: mmap.mmap | None = None
+
+    @classmethod
+    def from_bytes(cls, table_entry: bytes, bank_data: bytes, strict: bool | ParseLimits = False):
+        """
+        Instantiates a lazy instrument bank view over binary data.
+
+        Args:
+            table_entry (bytes): Binary table entry data. Can be either truncated (0x08) or full (0x10) bytes long.
+            bank_data (bytes): Binary instrument bank data. The view keeps a reference to it.
+            strict (bool | ParseLimits): Whether to decode strictly, or the limits to decode with.
+
+        Returns:
+            object (BankView): An instrument bank view with nothing but its header parsed.
+        """
+        limits = ParseLimits() if strict is True else (strict or None)
+        return cls(_read_table_entry(table_entry), bank_data, limits)
+
+    @classmethod
+    def from_file(cls, entry_path: str | os.PathLike, bank_path: str | os.PathLike, strict: bool | ParseLimits = False):
+        """
+        Instantiates a lazy instrument bank view over a memory-mapped bank file.
+
+        Args:
+            entry_path (str | PathLike): Path to the binary table entry, either truncated (0x08) or full (0x10) bytes long.
+            bank_path (str | PathLike): Path to the binary instrument bank.
+            strict (bool | ParseLimits): Whether to decode strictly, or the limits to decode with.
+
+        Returns:
+            object (BankView): An instrument bank view with nothing but its header parsed.
+        """
+        with open(entry_path, 'rb') as e:
+            table_entry = e.read()
+
+        with open(bank_path, 'rb') as b:
+            mapping = mmap.mmap(b.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            view = cls.from_bytes(table_entry, mapping, strict)
+        except Exception:
+            mapping.close()
+            raise
+        view._mapping = mapping
+        return view
+
+    def close(self):
+        """
+        Releases the bank file mapped by `from_file`. Pointers that have not been resolved yet can no longer be followed.
+        """
+        if self._mapping is not None:
+            self._mapping.close()
+            self._mapping = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def _check_index(index: int, count: int, kind: str):
+        if not 0 <= index < count:
+            raise IndexError(f'{kind} index {index} out of range for a bank with {count} {kind}s')
+
+    def instrument(self, index: int) -> Instrument | None:
+        """
+        Returns the instrument in list slot `index`, or `None` if the slot is empty.
+        """
+        self._check_index(index, self.metadata.num_instruments, 'instrument')
+        instrument_offset = struct.unpack_from('>I', self.bank_data, 0x08 + (index * 4))[0]
+        if instrument_offset == 0:
+            return None
+        return self._context.resolve(Instrument, self.bank_data, instrument_offset)
+
+    def drum(self, index: int) -> Drum | None:
+        """
+        Returns the drum in list slot `index`, or `None` if the slot is empty.
+        """
+        self._check_index(index, self.metadata.num_drums, 'drum')
+        drum_offset = struct.unpack_from('>I', self.bank_data, self.drum_list_offset + (index * 4))[0]
+        if drum_offset == 0:
+            return None
+        return self._context.resolve(Drum, self.bank_data, drum_offset)
+
+    def effect(self, index: int) -> TunedSample | None:
+        """
+        Returns the effect in list slot `index`, or `None` if the slot is empty.
+        """
+        self._check_index(index, self.metadata.num_effects, 'effect')
+        offset = self.effect_list_offset + (8 * index)
+        if struct.unpack_from('>2I', self.bank_data, offset) == (0, 0):
+            return None
+        return self._context.resolve(TunedSample, self.bank_data, offset)
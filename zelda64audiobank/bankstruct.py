@@ -5,16 +5,33 @@ BankStruct
 Custom implementation of ctypes-styled class creation tailored to parsing Zelda64 instrument banks
 from their binary format.
 """
+import sys
 import struct
+import hashlib
 import inspect
+import array as std_array
+from enum import Enum
 from typing import Type, Any
 from dataclasses import dataclass
 
-from .helpers import safe_enum, make_property
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .helpers import make_property, make_enum_property
+
+# Typecodes of the standard library array type with the same item size as each struct format character
+_ARRAY_TYPECODES: dict[str, str] = {
+    'B': 'B', 'b': 'b', 'H': 'H', 'h': 'h', 'f': 'f',
+    'I': 'I' if std_array.array('I').itemsize == 4 else 'L',
+    'i': 'i' if std_array.array('i').itemsize == 4 else 'l',
+}
 
 class FieldType:
     size: int = 0
     signed: bool
+    format: str = ''
 
     @classmethod
     def from_bytes(cls, buffer: bytes, offset: int) -> Any:
@@ -24,6 +41,7 @@ class u8(FieldType):
     """ An unsigned 8-bit integer. """
     size: int = 1
     signed: bool = False
+    format: str = 'B'
 
     @classmethod
     def from_bytes(cls, buffer: bytes, offset: int):
@@ -33,6 +51,7 @@ class s8(FieldType):
     """ A signed 8-bit integer. """
     size: int = 1
     signed: bool = True
+    format: str = 'b'
 
     @classmethod
     def from_bytes(cls, buffer: bytes, offset: int):
@@ -42,6 +61,7 @@ class u16(FieldType):
     """ An unsigned 16-bit integer. """
     size: int = 2
     signed: bool = False
+    format: str = 'H'
 
     @classmethod
     def from_bytes(cls, buffer: bytes, offset: int):
@@ -51,6 +71,7 @@ class s16(FieldType):
     """ A signed 16-bit integer. """
     size: int = 2
     signed: bool = True
+    format: str = 'h'
 
     @classmethod
     def from_bytes(cls, buffer: bytes, offset: int):
@@ -60,6 +81,7 @@ class u32(FieldType):
     """ An unsigned 32-bit integer. """
     size: int = 4
     signed: bool = False
+    format: str = 'I'
 
     @classmethod
     def from_bytes(cls, buffer: bytes, offset: int):
@@ -69,6 +91,7 @@ class s32(FieldType):
     """ A signed 32-bit integer. """
     size: int = 4
     signed: bool = True
+    format: str = 'i'
 
     @classmethod
     def from_bytes(cls, buffer: bytes, offset: int):
@@ -78,6 +101,7 @@ class f32(FieldType):
     """ A 32-bit single-precision floating-point value. """
     size: int = 4
     signed: bool = True
+    format: str = 'f'
 
     @classmethod
     def from_bytes(cls, buffer: bytes, offset: int):
@@ -88,19 +112,32 @@ class pointer(FieldType):
     def __init__(self, struct_type: Type['BankStruct']):
         self.struct_type: Type['BankStruct'] = struct_type
         self.size: int = 4
+        self.format: str = 'I'
 
-    def from_bytes(self, buffer: bytes, offset: int):
+    def from_bytes(self, buffer: bytes, offset: int, context: 'ParseContext' = None):
         addr = struct.unpack_from('>I', buffer, offset)[0]
+        return self.resolve(buffer, addr, context)
+
+    def resolve(self, buffer: bytes, addr: int, context: 'ParseContext' = None):
+        """ Instantiates the structure located at `addr`, or returns `None` for a null pointer. """
         if addr == 0:
             return None
-        return self.struct_type.from_bytes(buffer, addr)
+        if context is None:
+            return self.struct_type.from_bytes(buffer, addr)
+        return context.resolve(self.struct_type, buffer, addr)
 
 class array(FieldType):
-    """ Represents a fixed-size array of field types. """
+    """
+    Represents a fixed-size array of primitive field types.
+
+    Arrays are decoded in a single call and stored compactly as an `array.array`, or as a NumPy array when
+    `array.use_numpy` is set.
+    """
+    use_numpy: bool = False
+
     def __init__(self, field_type: Type['FieldType'], length: int):
         self.field_type = field_type
         self.length = length
-        self.items = []
 
     @property
     def size(self):
@@ -110,28 +147,33 @@ class array(FieldType):
     def signed(self):
         return getattr(self.field_type, 'signed', False)
 
-    def from_bytes(self, buffer: bytes, offset: int):
-        self.items = []
-        for i in range(self.length):
-            item_offset = offset + i * self.field_type.size
-            item = self.field_type.from_bytes(buffer, item_offset)
-            self.items.append(item)
-        return self
-
-    def __iter__(self):
-        return iter(self.items)
-
-    def __getitem__(self, index):
-        return self.items[index]
-
-    def __len__(self):
-        return len(self.items)
-
-    def __repr__(self):
-        return repr(self.items)
+    @property
+    def format(self):
+        return f'{self.length}{self.field_type.format}'
 
-    def __str__(self):
-        return str(self.items)
+    def from_bytes(self, buffer: bytes, offset: int):
+        if self.use_numpy:
+            if np is None:
+                raise ImportError('NumPy is required when array.use_numpy is set')
+            # Copy into native byte order so the result does not keep the buffer alive
+            return np.frombuffer(buffer, dtype=f'>{self.field_type.format}', count=self.length, offset=offset).astype(f'={self.field_type.format}')
+
+        items = std_array.array(_ARRAY_TYPECODES[self.field_type.format])
+        with memoryview(buffer) as view, view.cast('B') as data:
+            items.frombytes(data[offset:offset + self.size])
+        if len(items) != self.length:
+            raise struct.error(f'array requires a buffer of at least {offset + self.size} bytes')
+        if sys.byteorder == 'little':
+            items.byteswap()
+        return items
+
+    def from_values(self, values: tuple):
+        """ Stores already unpacked values the same way `from_bytes` does. """
+        if self.use_numpy:
+            if np is None:
+                raise ImportError('NumPy is required when array.use_numpy is set')
+            return np.array(values, dtype=f'={self.field_type.format}')
+        return std_array.array(_ARRAY_TYPECODES[self.field_type.format], values)
 
 @dataclass
 class bitfield(FieldType):
@@ -147,6 +189,14 @@ class bitfield(FieldType):
     def signed(self):
         return self.field_type.signed
 
+    @property
+    def mask(self) -> int:
+        return (1 << self.bit_width) - 1
+
+    def shift(self, bit_cursor: int) -> int:
+        """ Returns the right shift that moves this bitfield to the bottom of its base value. """
+        return self.size * 8 - bit_cursor - self.bit_width
+
     def from_bytes(self, buffer: bytes, offset: int, bit_cursor: int):
         format = {
             1: '>B' if not self.signed else '>b',
@@ -158,9 +208,7 @@ class bitfield(FieldType):
             raise ValueError(f'Unsupported bitfield base size: {self.size}')
 
         bits = struct.unpack_from(format, buffer, offset)[0]
-        bit_shift = self.size * 8 - bit_cursor - self.bit_width
-        bit_mask = (1 << self.bit_width) - 1
-        bit_value = (bits >> bit_shift) & bit_mask
+        bit_value = (bits >> self.shift(bit_cursor)) & self.mask
 
         # Sign extension
         if self.signed and (bit_value & (1 << (self.bit_width - 1))):
@@ -168,29 +216,417 @@ class bitfield(FieldType):
 
         return bit_value
 
-class BankStruct:
+
+class BankFormatError(ValueError):
+    """ Raised by strict parsing when a bank is malformed. """
+
+class TruncatedBankError(BankFormatError):
+    """ A structure or list extends past the end of the bank data. """
+
+class PointerRangeError(BankFormatError):
+    """ A pointer or list offset points outside the bank data. """
+
+class PointerAlignmentError(BankFormatError):
+    """ A pointer is not aligned the way the game reads the structure it points to. """
+
+class PointerCycleError(BankFormatError):
+    """ A structure points back to a structure that is still being decoded. """
+
+class EnvelopeLengthError(BankFormatError):
+    """ An envelope has more points than allowed before its terminating opcode. """
+
+class WorkBudgetError(BankFormatError):
+    """ Decoding the bank read more bytes than its work budget allows. """
+
+@dataclass(frozen=True)
+class ParseLimits:
+    """
+    Limits enforced by strict parsing, which is meant for banks from untrusted sources.
+
+    Attributes:
+        max_envelope_points (int): Maximum number of points in an envelope, including the terminating opcode.
+        max_work_ratio (float): Maximum number of bytes decoded per byte of bank data. Shared structures are
+            decoded once, so well-formed banks stay below 1; overlapping structures, such as many envelopes
+            running into the same long run of points, are what exceed it.
+        check_alignment (bool): Whether pointers must be aligned to `BankStruct._pointer_align_`.
+    """
+    max_envelope_points: int = 256
+    max_work_ratio: float = 2.0
+    check_alignment: bool = True
+
+class ParseContext:
+    """
+    State shared by every structure decoded during a single parse of an instrument bank.
+
+    Structures are interned by (struct type, offset), so a structure that is referenced from several
+    places in the bank is only decoded once and every reference points to the same object.
+
+    When `lazy` is set, pointer fields are not followed while decoding. They are resolved on first
+    attribute access instead, and the result is memoized on the structure.
+
+    When `record_origins` is set, the offset every structure was decoded from is recorded in `origins`, keyed by
+    the `id` of the structure.
+
+    When `track_changes` is set, origins are recorded as well, and structures report later assignments to their
+    fields to the context's `ChangeTracker`.
+
+    When `limits` is set, parsing is strict: every structure is range-checked, alignment-checked and
+    cycle-checked before it is decoded, and the bytes decoded are charged against a work budget. Violations
+    raise a `BankFormatError`.
+    """
+    def __init__(self, lazy: bool = False, track_changes: bool = False, limits: ParseLimits | None = None, record_origins: bool = False):
+        self.interned: dict[tuple[Type['BankStruct'], int], 'BankStruct'] = {}
+        self.lazy: bool = lazy
+        self.tracker: ChangeTracker | None = ChangeTracker() if track_changes else None
+        self.record_origins: bool = record_origins or track_changes
+        # id -> (structure, offset); the structure is kept so its id cannot be reused by another object
+        self.origins: dict[int, tuple['BankStruct', int]] | None = {} if self.record_origins else None
+        self.limits: ParseLimits | None = limits
+        self.work: int = 0
+        self._budget: float | None = None
+        self._buffer_size: int = 0
+        self._active: set[tuple[Type['BankStruct'], int]] = set()
+
+    def resolve(self, struct_type: Type['BankStruct'], buffer: bytes, offset: int) -> 'BankStruct':
+        key = (struct_type, offset)
+        obj = self.interned.get(key)
+        if obj is None:
+            # Calling from_bytes directly keeps the strict checks off the path of regular parses
+            if self.limits is None:
+                obj = struct_type.from_bytes(buffer, offset, self)
+            else:
+                obj = self._checked_from_bytes(struct_type, buffer, offset)
+            self.interned[key] = obj
+        return obj
+
+    def decode(self, struct_type: Type['BankStruct'], buffer: bytes, offset: int) -> 'BankStruct':
+        """ Decodes a structure that is not reached through a pointer, such as an entry of the effect list. """
+        return self._from_bytes(struct_type, buffer, offset)
+
+    def _from_bytes(self, struct_type: Type['BankStruct'], buffer: bytes, offset: int) -> 'BankStruct':
+        if self.limits is None:
+            return struct_type.from_bytes(buffer, offset, self)
+        return self._checked_from_bytes(struct_type, buffer, offset)
+
+    def _checked_from_bytes(self, struct_type: Type['BankStruct'], buffer: bytes, offset: int) -> 'BankStruct':
+        name = struct_type.__name__
+        key = (struct_type, offset)
+        if key in self._active:
+            raise PointerCycleError(f'{name} at {hex(offset)} points back to itself')
+        if self.limits.check_alignment and offset % struct_type._pointer_align_:
+            raise PointerAlignmentError(f'{name} at {hex(offset)} is not aligned to {struct_type._pointer_align_} bytes')
+        if not 0 <= offset < self._size_of(buffer):
+            raise PointerRangeError(f'{name} at {hex(offset)} is outside of the bank data')
+        self.charge(buffer, offset, struct_type.size(), name)
+
+        self._active.add(key)
+        try:
+            return struct_type.from_bytes(buffer, offset, self)
+        finally:
+            self._active.discard(key)
+
+    def _size_of(self, buffer: bytes) -> int:
+        # A context only ever parses one bank, so its size and budget are worked out once
+        if self._budget is None:
+            self._buffer_size = memoryview(buffer).nbytes
+            self._budget = self.limits.max_work_ratio * max(self._buffer_size, 0x100)
+        return self._buffer_size
+
+    def charge(self, buffer: bytes, offset: int, size: int, what: str):
+        """
+        In strict mode, checks that `size` bytes at `offset` are within the bank data and charges them against the
+        work budget. Does nothing otherwise.
+        """
+        if self.limits is None:
+            return
+        nbytes = self._size_of(buffer)
+        if offset < 0 or size < 0 or offset + size > nbytes:
+            raise TruncatedBankError(f'{what} at {hex(offset)} extends past the end of the bank data ({hex(nbytes)} bytes)')
+
+        self.work += size
+        if self.work > self._budget:
+            raise WorkBudgetError(f'Decoding the bank exceeded its work budget of {int(self._budget)} bytes at {what} {hex(offset)}')
+
+    def track(self, obj: 'BankStruct', offset: int):
+        """ Records the offset a structure was decoded from and starts tracking its changes, if enabled. """
+        if self.record_origins:
+            self.origins[id(obj)] = (obj, offset)
+            if self.tracker is not None:
+                obj.__class__ = self.tracker.tracked_type(type(obj))
+
+class ChangeTracker:
+    """
+    Records the structures of one parsed bank that were modified after parsing.
+
+    Assigning to a field of a tracked structure marks it dirty. Edits made in place, such as changing an
+    array element, a bitfield container or the point list of an envelope, need `BankStruct.mark_dirty()`.
+    """
+    def __init__(self):
+        self.dirty: dict[int, 'BankStruct'] = {}
+        self._types: dict[type, type] = {}
+
+    def tracked_type(self, cls: Type['BankStruct']) -> Type['BankStruct']:
+        """
+        Returns the subclass that structures of type `cls` are switched to when this tracker starts tracking them.
+        It holds the tracker as a class attribute and only adds a `__setattr__` that reports changes, so tracked
+        structures take no more memory and structures parsed without change tracking keep plain, fast attribute
+        assignment.
+        """
+        cls = cls.__dict__.get('_untracked_type', cls)
+        tracked = self._types.get(cls)
+        if tracked is None:
+            tracked = type(cls)(cls.__name__, (cls,), {
+                '__slots__': (),
+                '__module__': cls.__module__,
+                '__qualname__': cls.__qualname__,
+                '__setattr__': _tracked_setattr,
+                '_untracked_type': cls,
+                '_tracker_': self,
+            })
+            self._types[cls] = tracked
+        return tracked
+
+    def mark(self, obj: 'BankStruct'):
+        self.dirty[id(obj)] = obj
+
+    def clear(self):
+        self.dirty.clear()
+
+def _tracked_setattr(self, name: str, value: Any):
+    object.__setattr__(self, name, value)
+    if name in self._tracked_slots_:
+        self.mark_dirty()
+
+def _restore_struct(cls: Type['BankStruct'], state: tuple) -> 'BankStruct':
+    return cls._new_(*state)
+
+# Public fields of each structure or bitfield container type: (public name, attribute, is pointer)
+_public_field_cache: dict[type, list[tuple[str, str, bool]]] = {}
+
+def public_fields(obj: Any) -> list[tuple[str, Any, bool]]:
+    """
+    Returns the (name, value, is pointer) of every field of a structure or bitfield container.
+
+    Fields stored under a raw name, such as `_time_or_opcode`, are reported through the property of the same name
+    without the underscore when there is one. Padding fields are left out.
+
+    Args:
+        obj (BankStruct | object): A structure, or a bitfield container such as `SampleFlags`.
+
+    Returns:
+        fields (list[tuple[str, Any, bool]]): The name, value and whether the field is a pointer, in field order.
+    """
+    cls = type(obj)
+    # Tracked structures share the fields of the type they were parsed as
+    cls = cls.__dict__.get('_untracked_type', cls)
+    fields = _public_field_cache.get(cls)
+    if fields is None:
+        if isinstance(obj, BankStruct):
+            names = [field[0] for field in cls._fields_] or cls._state_slots_
+            pointers = {name for name, _, _ in cls._pointers_}
+        else:
+            names = cls.__slots__
+            pointers = set()
+        fields = []
+        for name in names:
+            public = name.lstrip('_')
+            if public.startswith('pad'):
+                continue
+            fields.append((public, public if hasattr(cls, public) else name, name in pointers))
+        _public_field_cache[cls] = fields
+
+    values = []
+    for public, attr, is_pointer in fields:
+        try:
+            value = getattr(obj, attr)
+        except ValueError:
+            # An enum field holding a value the enum does not define
+            value = getattr(obj, f'_{public}_raw')
+        values.append((public, value, is_pointer))
+    return values
+
+def plain_value(value: Any, pending: list) -> Any:
+    """
+    Converts a field value into the plain value `BankStruct.to_dict` reports for it.
+
+    Enums become their name, arrays become lists and bitfield containers become dicts. A structure becomes an
+    empty dict, which is queued on `pending` along with the structure to be filled in by the caller.
+
+    Args:
+        value (Any): A field value, such as one returned by `public_fields`.
+        pending (list): Receives a (structure, dict) pair for every structure in the value.
+
+    Returns:
+        value (Any): The plain value.
+    """
+    if isinstance(value, Enum):
+        return value.name
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, BankStruct):
+        out = {}
+        pending.append((value, out))
+        return out
+    if np is not None and isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (list, tuple, std_array.array)):
+        return [plain_value(item, pending) for item in value]
+    # Bitfield containers such as `SampleFlags`
+    return {name: plain_value(item, pending) for name, item, _ in public_fields(value)}
+
+class _Text(str):
+    """ Text that `BankStruct.__repr__` writes as is. """
+
+def _repr_parts(value: Any, shown: set[int]) -> _Text | tuple[str, list[tuple[str, Any]], str]:
+    """
+    Splits a value for `BankStruct.__repr__` into its opening text, its (prefix, child) items and its closing text,
+    or returns the text of a value written on one line.
+    """
+    if isinstance(value, BankStruct):
+        if type(value).__repr__ is not BankStruct.__repr__:
+            return _Text(repr(value))
+        if id(value) in shown:
+            return _Text(f'<{type(value).__name__}, shown above>')
+        shown.add(id(value))
+        return f'{type(value).__name__}(', [(f'{name}=', item) for name, item, _ in public_fields(value)], ')'
+    if isinstance(value, Enum) or value is None or isinstance(value, (bool, int, float, str)):
+        return _Text(str(value))
+    if isinstance(value, (list, tuple, std_array.array)) or (np is not None and isinstance(value, np.ndarray)):
+        items = list(value)
+        if any(isinstance(item, BankStruct) for item in items):
+            return '[', [('', item) for item in items], ']'
+        if len(items) <= 8:
+            return _Text(f'[{", ".join(str(item) for item in items)}]')
+        rows = [_Text(', '.join(str(item) for item in items[i:i + 8]) + ',') for i in range(0, len(items), 8)]
+        return '[', [('', row) for row in rows], ']'
+    if type(value).__repr__ is not object.__repr__:
+        return _Text(repr(value))
+    # Bitfield containers without a repr of their own
+    return f'{type(value).__name__}(', [(f'{name}=', item) for name, item, _ in public_fields(value)], ')'
+
+def nested_repr(opening: str, items: list[tuple[str, Any]], closing: str, shown: set[int] = None) -> str:
+    """
+    Writes a repr in the layout of `BankStruct.__repr__`: the opening text, every (prefix, child) item on its own
+    lines indented one level deeper, and the closing text.
+
+    The text is written from an explicit stack of (depth, prefix, value) rather than by nesting the repr of every
+    child, which re-indents the same text once per level. Structures reached more than once are only written out
+    the first time.
+
+    Args:
+        opening (str): The first line, such as `'Instrument('`.
+        items (list[tuple[str, Any]]): The prefix, such as `'envelope='`, and value of every child.
+        closing (str): The last line.
+        shown (set[int]): The `id` of every structure already written out. Updated as children are written.
+
+    Returns:
+        text (str): The repr.
+    """
+    if shown is None:
+        shown = set()
+    lines = [opening]
+    pending: list[tuple[int, str, Any]] = [(0, '', _Text(closing))]
+    pending.extend((1, prefix, item) for prefix, item in reversed(items))
+    while pending:
+        depth, prefix, value = pending.pop()
+        indent = '  ' * depth
+        parts = value if isinstance(value, _Text) else _repr_parts(value, shown)
+        if isinstance(parts, _Text):
+            lines.extend(indent + line for line in (prefix + parts).split('\n'))
+            continue
+        opening, children, closing = parts
+        lines.append(indent + prefix + opening)
+        pending.append((depth, '', _Text(closing)))
+        pending.extend((depth + 1, child_prefix, child) for child_prefix, child in reversed(children))
+    return '\n'.join(lines)
+
+class BankStructMeta(type):
+    """
+    Metaclass of `BankStruct` that generates `__slots__` from `_fields_`, so structure instances do not carry a
+    `__dict__`. Bool and enum fields are stored in a `_<field>_raw` slot behind a property. Attributes that are
+    not fields can still be declared with `__slots__` in the class body.
+    """
+    def __new__(mcls, name: str, bases: tuple, namespace: dict, **kwargs):
+        inherited = set()
+        for base in bases:
+            for klass in base.__mro__:
+                inherited.update(getattr(klass, '__slots__', ()))
+
+        slots = list(namespace.get('__slots__', ()))
+        if '_fields_' in namespace:
+            raw_fields = set(mcls._inherited(namespace, bases, '_bool_fields_', [])) | set(mcls._inherited(namespace, bases, '_enum_fields_', {}))
+            for field in namespace['_fields_']:
+                # Grouped bitfields are stored in their container, loose bitfields in their own slot
+                field_name = field[0]
+                slot = f'_{field_name}_raw' if field_name in raw_fields else field_name
+                if slot not in inherited and slot not in slots:
+                    slots.append(slot)
+
+        namespace['__slots__'] = tuple(slots)
+        cls = super().__new__(mcls, name, bases, namespace, **kwargs)
+
+        # Every slot holding part of the structure's state, in a fixed order, for pickling and change tracking
+        cls._state_slots_ = tuple(
+            slot
+            for klass in reversed(cls.__mro__)
+            for slot in klass.__dict__.get('__slots__', ())
+            if slot != '_lazy_'
+        )
+        cls._tracked_slots_ = frozenset(cls._state_slots_)
+        return cls
+
+    @staticmethod
+    def _inherited(namespace: dict, bases: tuple, attr: str, default: Any) -> Any:
+        if attr in namespace:
+            return namespace[attr]
+        for base in bases:
+            if hasattr(base, attr):
+                return getattr(base, attr)
+        return default
+
+class BankStruct(metaclass=BankStructMeta):
     """ Represents a structure within a Zelda64 instrument bank. """
+    __slots__ = ('_lazy_',)
+
     _fields_: list[tuple[str, Any] | tuple[str, Any, int]] | list[tuple[str, Any, tuple[str, Any, int]]] = []
     _bool_fields_: list[str] = []
     _enum_fields_: dict[str, type] = {} # field name -> enum
     _align_: int = 1
+    _pointer_align_: int = 4    # Alignment strict parsing requires of pointers to the structure
+
+    # Compiled layout, built once per subclass from `_fields_` by `_compile_`
+    _format_: str = ''
+    _struct_: struct.Struct = struct.Struct('>')
+    _size_: int = 0
+    _num_values_: int = 0
+    _plain_: tuple = ()     # (attribute holding the raw value, value index)
+    _groups_: tuple = ()    # (name, container type, value index, ((subname, shift, mask, sign bit), ...), signed wrap)
+    _embedded_: tuple = ()  # (name, struct type, value index, relative offset)
+    _nested_: tuple = ()    # (name, struct type, relative offset) for structs with their own from_bytes
+    _pointers_: tuple = ()  # (name, value index, pointer)
+    _arrays_: tuple = ()    # (name, first value index, last value index, array)
+    _state_slots_: tuple = ()
+    _tracked_slots_: frozenset = frozenset()
+    _tracker_: 'ChangeTracker | None' = None  # Set on the subclasses created by `ChangeTracker.tracked_type`
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if '_untracked_type' in cls.__dict__:
+            # Tracked subclasses share the compiled layout of the type they track
+            return
+        cls._compile_()
+        cls._install_properties_()
 
-    @staticmethod
-    def _read_field(buffer: bytes, field_offset: int, field_type: Any) -> tuple[Any, int]:
-        # Embedded structure
-        if inspect.isclass(field_type) and issubclass(field_type, BankStruct):
-            value = field_type.from_bytes(buffer, field_offset)
-            size = field_type.size()
-        # Pointer
-        elif isinstance(field_type, pointer):
-            value = field_type.from_bytes(buffer, field_offset)
-            size = field_type.size
-        # Primitive
-        else:
-            value = field_type.from_bytes(buffer, field_offset)
-            size = field_type.size
+    @classmethod
+    def _install_properties_(cls):
+        # Public accessors for fields stored as raw values, installed once when the class is defined
+        for bool_field in cls._bool_fields_:
+            if bool_field not in cls.__dict__:
+                setattr(cls, bool_field, make_property(bool_field, bool))
 
-        return value, size
+        for enum_field, enum_type in cls._enum_fields_.items():
+            if enum_field not in cls.__dict__:
+                setattr(cls, enum_field, make_enum_property(enum_field, enum_type))
 
     @staticmethod
     def _align_to(offset: int, align: int) -> int:
@@ -198,110 +634,375 @@ class BankStruct:
             return offset
         return (offset + align -1) & ~(align -1) # (offset + align - 1) // align * align
 
+    @staticmethod
+    def _is_struct_type(field_type: Any) -> bool:
+        return inspect.isclass(field_type) and issubclass(field_type, BankStruct)
+
     @classmethod
-    def from_bytes(cls, buffer: bytes, struct_offset: int = 0):
-        obj = cls.__new__(cls)
-        field_offset = struct_offset
+    def _compile_(cls):
+        """
+        Compiles `_fields_` into a single struct format and the tables `_from_values` uses to turn the
+        unpacked values back into attributes. Runs once, when the subclass is defined.
+        """
+        formats = []
+        plain, groups, embedded, nested, pointers, arrays = [], [], [], [], [], []
+        field_offset = 0
+        value_index = 0
+
+        # Loose bitfields of the same base type are packed into one base value
+        loose_type = None
+        loose_fields = None
         bit_cursor = 0
-        last_bitfield_type = None
+
+        def close_loose():
+            nonlocal loose_type, loose_fields, bit_cursor, field_offset, value_index
+            if loose_type is not None:
+                groups.append((None, None, value_index, tuple(loose_fields), cls._signed_wrap(loose_type)))
+                formats.append(loose_type.format)
+                field_offset += loose_type.size
+                value_index += 1
+            loose_type = None
+            loose_fields = None
+            bit_cursor = 0
 
         for field in cls._fields_:
             match len(field):
                 case 2:
+                    close_loose()
                     name, field_type = field
 
-                    # Reset bitfield tracking
-                    bit_cursor = 0
-                    last_bitfield_type = None
-
-                    field_offset = cls._align_to(field_offset, cls._align_)
-                    value, size = cls._read_field(buffer, field_offset, field_type)
-                    setattr(obj, name, value)
-                    field_offset += size
+                    aligned = cls._align_to(field_offset, cls._align_)
+                    if aligned != field_offset:
+                        formats.append(f'{aligned - field_offset}x')
+                        field_offset = aligned
+
+                    # Embedded structure
+                    if cls._is_struct_type(field_type):
+                        if field_type.from_bytes.__func__ is BankStruct.from_bytes.__func__:
+                            embedded.append((name, field_type, value_index, field_offset))
+                            formats.append(field_type._format_)
+                            value_index += field_type._num_values_
+                        else:
+                            nested.append((name, field_type, field_offset))
+                            formats.append(f'{field_type.size()}x')
+                        field_offset += field_type.size()
+                    # Pointer
+                    elif isinstance(field_type, pointer):
+                        pointers.append((name, value_index, field_type))
+                        formats.append(field_type.format)
+                        field_offset += field_type.size
+                        value_index += 1
+                    # Array of primitives
+                    elif isinstance(field_type, array):
+                        arrays.append((name, value_index, value_index + field_type.length, field_type))
+                        formats.append(field_type.format)
+                        field_offset += field_type.size
+                        value_index += field_type.length
+                    # Primitive
+                    else:
+                        plain.append((name, value_index))
+                        formats.append(field_type.format)
+                        field_offset += field_type.size
+                        value_index += 1
 
                 case 3:
-                    name, container_type, subfields = field
-                    if isinstance(subfields, list):
-                        values = {}
+                    if isinstance(field[2], list):
+                        close_loose()
+                        name, container_type, subfields = field
                         base_type = subfields[0][1]
-                        bit_cursor = 0
+                        cursor = 0
+                        compiled = []
                         for subname, sub_type, sub_bits in subfields:
                             assert sub_type == base_type, "Grouped bitfields must use the same base type."
-                            bitfield_type = bitfield(sub_type, sub_bits)
-                            bitfield_value = bitfield_type.from_bytes(buffer, field_offset, bit_cursor)
-                            values[subname] = bitfield_value
-                            bit_cursor += sub_bits
+                            compiled.append(cls._compile_bitfield(subname, bitfield(sub_type, sub_bits), cursor))
+                            cursor += sub_bits
 
-                        setattr(obj, name, container_type(**values))
+                        groups.append((name, container_type, value_index, tuple(compiled), cls._signed_wrap(base_type)))
+                        formats.append(base_type.format)
                         field_offset += base_type.size
-                        bit_cursor = 0
-                        last_bitfield_type = None
+                        value_index += 1
                     else:
                         name, base_type, bit_width = field
-                        if last_bitfield_type != base_type:
-                            bit_cursor = 0
-                            last_bitfield_type = base_type
-
-                        bitfield_type = bitfield(base_type, bit_width)
-                        bitfield_value = bitfield_type.from_bytes(buffer, field_offset, bit_cursor)
-                        setattr(obj, name, bitfield_value)
+                        if loose_type is not base_type or bit_cursor + bit_width > base_type.size * 8:
+                            close_loose()
+                            loose_type = base_type
+                            loose_fields = []
 
+                        loose_fields.append(cls._compile_bitfield(name, bitfield(base_type, bit_width), bit_cursor))
                         bit_cursor += bit_width
                         if bit_cursor >= base_type.size * 8:
-                            field_offset += base_type.size
-                            bit_cursor = 0
-                            last_bitfield_type = None
+                            close_loose()
+
+        close_loose()
+
+        cls._format_ = ''.join(formats)
+        cls._struct_ = struct.Struct('>' + cls._format_)
+        cls._size_ = cls._struct_.size
+        cls._num_values_ = value_index
+        raw_fields = set(cls._bool_fields_) | set(cls._enum_fields_)
+        cls._plain_ = tuple((f'_{name}_raw' if name in raw_fields else name, index) for name, index in plain)
+        cls._groups_ = tuple(groups)
+        cls._embedded_ = tuple(embedded)
+        cls._nested_ = tuple(nested)
+        cls._pointers_ = tuple(pointers)
+        cls._arrays_ = tuple(arrays)
 
-        for bool_field in getattr(cls, '_bool_fields_', []):
-            raw_value = getattr(obj, bool_field)
-            setattr(obj, f'_{bool_field}_raw', raw_value)
+    @staticmethod
+    def _signed_wrap(base_type: Type[FieldType]) -> int:
+        # Packed bitfields are built unsigned and wrapped back into range for signed base types
+        return (1 << (base_type.size * 8)) if base_type.signed else 0
 
-            if not hasattr(cls, bool_field):
-                setattr(cls, bool_field, make_property(bool_field, bool))
+    @staticmethod
+    def _compile_bitfield(name: str, field: bitfield, bit_cursor: int) -> tuple[str, int, int, int]:
+        sign_bit = (1 << (field.bit_width - 1)) if field.signed else 0
+        return name, field.shift(bit_cursor), field.mask, sign_bit
+
+    @classmethod
+    def from_bytes(cls, buffer: bytes, struct_offset: int = 0, context: ParseContext = None):
+        values = cls._struct_.unpack_from(buffer, struct_offset)
+        return cls._from_values(buffer, struct_offset, values, 0, context)
+
+    @classmethod
+    def _from_values(cls, buffer: bytes, struct_offset: int, values: tuple, base: int, context: ParseContext = None):
+        obj = cls.__new__(cls)
+
+        for attr, index in cls._plain_:
+            setattr(obj, attr, values[base + index])
+
+        for name, container_type, index, subfields, _ in cls._groups_:
+            bits = values[base + index]
+            fields = {}
+            for subname, shift, mask, sign_bit in subfields:
+                bit_value = (bits >> shift) & mask
+                # Sign extension
+                if bit_value & sign_bit:
+                    bit_value -= mask + 1
+                fields[subname] = bit_value
+
+            if container_type is None:
+                for subname, bit_value in fields.items():
+                    setattr(obj, subname, bit_value)
+            else:
+                setattr(obj, name, container_type(**fields))
 
-        for enum_field, enum_type in getattr(cls, '_enum_fields_', {}).items():
-            raw_value = getattr(obj, enum_field)
-            setattr(obj, f'_{enum_field}_raw', raw_value)
+        for name, struct_type, index, field_offset in cls._embedded_:
+            setattr(obj, name, struct_type._from_values(buffer, struct_offset + field_offset, values, base + index, context))
+
+        for name, struct_type, field_offset in cls._nested_:
+            setattr(obj, name, struct_type.from_bytes(buffer, struct_offset + field_offset, context))
+
+        for name, start, stop, field_type in cls._arrays_:
+            setattr(obj, name, field_type.from_values(values[base + start:base + stop]))
+
+        if context is not None and context.lazy:
+            if cls._pointers_:
+                obj._lazy_ = (buffer, context, {name: (field_type, values[base + index]) for name, index, field_type in cls._pointers_})
+        else:
+            for name, index, field_type in cls._pointers_:
+                setattr(obj, name, field_type.resolve(buffer, values[base + index], context))
+
+        if context is not None and context.record_origins:
+            context.track(obj, struct_offset)
 
-            if not hasattr(cls, enum_field):
-                transform = (lambda t: (lambda val: safe_enum(t, val)))(enum_type)
-                setattr(cls, enum_field, make_property(enum_field, transform))
         return obj
 
     @classmethod
     def size(cls):
-        size = 0
-        for f in cls._fields_:
-            match len(f):
-                case 2:
-                    _, field_type = f
+        return cls._size_
+
+    def packed_size(self) -> int:
+        """ Returns the number of bytes this structure occupies in binary form. """
+        return self._size_
+
+    def pointer_targets(self):
+        """ Yields every structure this structure points to, including through embedded structures. """
+        cls = type(self)
+        for name, _, _ in cls._pointers_:
+            target = getattr(self, name)
+            if target is not None:
+                yield target
+        for name, _, _, _ in cls._embedded_:
+            yield from getattr(self, name).pointer_targets()
+        for name, _, _ in cls._nested_:
+            yield from getattr(self, name).pointer_targets()
+
+    def _pointer_offset(self, target: 'BankStruct', offsets: dict[int, int]) -> int:
+        if target is None:
+            return 0
+        try:
+            return offsets[id(target)]
+        except KeyError:
+            raise ValueError(f'{type(target).__name__} referenced by {type(self).__name__} has not been given an offset') from None
+
+    def _to_values(self, values: list, base: int, offsets: dict[int, int]):
+        cls = type(self)
+
+        for attr, index in cls._plain_:
+            values[base + index] = getattr(self, attr)
+
+        for name, container_type, index, subfields, signed_wrap in cls._groups_:
+            source = self if container_type is None else getattr(self, name)
+            bits = 0
+            for subname, shift, mask, _ in subfields:
+                bits |= (int(getattr(source, subname)) & mask) << shift
+            if signed_wrap and bits >= signed_wrap >> 1:
+                bits -= signed_wrap
+            values[base + index] = bits
+
+        for name, _, index, _ in cls._embedded_:
+            getattr(self, name)._to_values(values, base + index, offsets)
+
+        for name, start, stop, _ in cls._arrays_:
+            items = getattr(self, name)
+            if len(items) != stop - start:
+                raise ValueError(f'{cls.__name__}.{name} must hold {stop - start} items, but holds {len(items)}')
+            values[base + start:base + stop] = items
+
+        for name, index, _ in cls._pointers_:
+            values[base + index] = self._pointer_offset(getattr(self, name), offsets)
+
+    def pack_into(self, buffer: bytearray, offset: int, offsets: dict[int, int] = None):
+        """
+        Writes this structure into a writable buffer.
+
+        Args:
+            buffer (bytearray): The buffer to write into.
+            offset (int): Where in the buffer to write the structure.
+            offsets (dict[int, int]): Maps the `id` of every structure this structure points to onto its offset.
+        """
+        if offsets is None:
+            offsets = {}
+        values = [0] * self._num_values_
+        self._to_values(values, 0, offsets)
+        self._struct_.pack_into(buffer, offset, *values)
+
+        for name, _, field_offset in type(self)._nested_:
+            getattr(self, name).pack_into(buffer, offset + field_offset, offsets)
+
+    def to_bytes(self, offsets: dict[int, int] = None) -> bytes:
+        """
+        Converts this structure into binary data.
+
+        Args:
+            offsets (dict[int, int]): Maps the `id` of every structure this structure points to onto its offset.
+
+        Returns:
+            data (bytes): The binary structure.
+        """
+        buffer = bytearray(self.packed_size())
+        self.pack_into(buffer, 0, offsets)
+        return bytes(buffer)
+
+    def content_hash(self, memo: dict[int, bytes] = None) -> bytes:
+        """
+        Returns a digest of this structure's content, including every structure it points to.
+
+        Hashes are computed bottom-up: a structure's digest covers its type name, its own binary form with each
+        pointer reduced to whether it is null, and the digests of its pointer targets. Two structures have the
+        same digest when they would serialize to the same bytes wherever they are placed, so identical samples or
+        envelopes from different banks match, and comparing digests replaces comparing whole structure graphs.
+
+        Args:
+            memo (dict[int, bytes]): Digests already computed, by structure `id`. Pass the same dictionary when
+                hashing many structures of one bank, so that shared structures are only hashed once.
+
+        Returns:
+            digest (bytes): A 16-byte BLAKE2b digest.
+        """
+        if memo is None:
+            memo = {}
+        digest = memo.get(id(self))
+        if digest is not None:
+            return digest
+
+        targets = list(self.pointer_targets())
+        h = hashlib.blake2b(type(self).__name__.encode(), digest_size=16)
+        h.update(self.to_bytes({id(target): 1 for target in targets}))
+        for target in targets:
+            h.update(target.content_hash(memo))
+
+        digest = memo[id(self)] = h.digest()
+        return digest
 
-                    if inspect.isclass(field_type) and issubclass(field_type, BankStruct):
-                        size += field_type.size()
-                    elif isinstance(field_type, pointer):
-                        size += 4
-                    elif isinstance(field_type, array):
-                        size += field_type.size
-                    else:
-                        size += field_type.size
+    @classmethod
+    def _new_(cls, *state):
+        """ Creates a structure from its slot values, in `_state_slots_` order. """
+        obj = cls.__new__(cls)
+        for slot, value in zip(cls._state_slots_, state):
+            setattr(obj, slot, value)
+        return obj
 
-                case 3:
-                    if isinstance(f[2], list):
-                        _, _, subfields = f
-                        size += subfields[0][1].size
-                    else:
-                        pass
-        return size
+    def mark_dirty(self):
+        """
+        Marks this structure as modified since it was parsed. Assigning to a field does this automatically; in
+        place edits, such as changing an array element or a bitfield container, need an explicit call.
+        """
+        tracker = self._tracker_
+        if tracker is not None:
+            tracker.mark(self)
+
+    def __reduce_ex__(self, protocol):
+        # Pickle as the class and a flat tuple of slot values. This is smaller than the default slot state and
+        # loads without a failed `__setstate__` lookup going through `__getattr__` for every structure. Pointers
+        # that a lazy parse has not resolved yet are resolved here. Unpickled structures are not tracked.
+        cls = type(self)
+        state = tuple(getattr(self, slot) for slot in cls._state_slots_)
+        return _restore_struct, (cls.__dict__.get('_untracked_type', cls), state)
+
+    def __getattr__(self, name: str):
+        # Only reached when regular attribute lookup fails, which for structures decoded with a lazy
+        # ParseContext means a pointer field that has not been resolved yet.
+        try:
+            buffer, context, pending = object.__getattribute__(self, '_lazy_')
+        except AttributeError:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'") from None
+
+        if name not in pending:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+        field_type, addr = pending.pop(name)
+        value = field_type.resolve(buffer, addr, context)
+        object.__setattr__(self, name, value)
+        if not pending:
+            del self._lazy_
+        return value
+
+    def to_dict(self, offsets: dict[int, int] = None) -> dict[str, Any]:
+        """
+        Converts this structure into a dictionary of plain values that can be written as JSON.
+
+        Embedded structures and bitfield containers become nested dictionaries, arrays become lists and enum values
+        become their names. Pointers become the offset given for their target in `offsets`, or, without `offsets`,
+        the dictionary of their target; a structure reached through several pointers is converted once and the
+        same dictionary is used for every reference. The conversion does not recurse, so it is not limited by the
+        depth of the structure graph.
+
+        Args:
+            offsets (dict[int, int]): Maps the `id` of every structure this structure points to onto its offset.
+
+        Returns:
+            data (dict[str, Any]): The fields of the structure by name.
+        """
+        root = {}
+        converted: dict[int, dict] = {id(self): root}
+        pending = [(self, root)]
+        while pending:
+            node, out = pending.pop()
+            for name, value, is_pointer in public_fields(node):
+                if not is_pointer:
+                    out[name] = plain_value(value, pending)
+                elif value is None:
+                    out[name] = None
+                elif offsets is not None:
+                    out[name] = node._pointer_offset(value, offsets)
+                else:
+                    target = converted.get(id(value))
+                    if target is None:
+                        target = converted[id(value)] = {}
+                        pending.append((value, target))
+                    out[name] = target
+        return root
 
     def __repr__(self):
-        lines = [f'{type(self).__name__}(']
-        for field in self._fields_:
-            name = field[0]
-            value = getattr(self, name)
-            if isinstance(value, BankStruct):
-                value_repr = repr(value).replace('\n', '\n  ')
-                lines.append(f'  {name}={value_repr}')
-            else:
-                lines.append(f'  {name}={value}')
-        lines.append(')')
-        return '\n'.join(lines)
+        items = [(f'{name}=', value) for name, value, _ in public_fields(self)]
+        return nested_repr(f'{type(self).__name__}(', items, ')', {id(self)})
@@ -0,0 +1,596 @@
+"""
+Cache
+=====
+
+Caches of parsed instrument banks, keyed by the content of the table entry and bank data.
+"""
+import hashlib
+import os
+import re
+import struct
+import sys
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from enum import Enum
+from itertools import accumulate, repeat
+from typing import Any, Callable, Iterable, Iterator, Type
+
+from . import __version__
+from .audiobank import Audiobank
+from .bankstruct import BankStruct, FieldType, array, s32, u32
+from .structures.drum import Drum
+from .structures.envelope import Envelope, EnvelopePoint
+from .structures.instrument import Instrument
+from .structures.metadata import AudiobankEntry
+from .structures.sample import Sample
+from .structures.tuned_sample import TunedSample
+from .structures.vadpcm import VadpcmBook, VadpcmLoop
+
+# Bumped whenever the stored form of a bank changes without a change of library version
+_CACHE_FORMAT = 2
+
+def bank_digest(table_entry: bytes, bank_data: bytes) -> str:
+    """
+    Returns the content digest of an (entry, data) pair.
+
+    The digest covers the library version, so banks parsed by a different version never match.
+
+    Args:
+        table_entry (bytes): Binary table entry data.
+        bank_data (bytes): Binary instrument bank data.
+
+    Returns:
+        digest (str): A hexadecimal BLAKE2b digest.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f'{__version__}:{_CACHE_FORMAT}:'.encode())
+    h.update(memoryview(table_entry).nbytes.to_bytes(4, 'big'))
+    h.update(table_entry)
+    h.update(bank_data)
+    return h.hexdigest()
+
+# Structure types stored as rows of their own table, in the order of the tables in a cached bank. Structures
+# embedded in another one are stored in the row of the structure they are embedded in instead.
+_NODE_TYPES: tuple[Type[BankStruct], ...] = (
+    AudiobankEntry, Instrument, Drum, TunedSample, Sample, VadpcmLoop, VadpcmBook, Envelope, EnvelopePoint,
+)
+
+_MAGIC = b'Z64B'
+# Magic, metadata, drum list offset and effect list offset
+_HEADER = struct.Struct('>4s3I')
+_COUNT = struct.Struct('>I')
+
+# (kind, slot, extra) of each column of a structure type
+_Column = tuple[str, str, Any]
+
+# Row struct, columns and item types of the flat arrays of each structure type
+_schemas: dict[type, tuple[struct.Struct, tuple[_Column, ...], tuple[Type[FieldType], ...]]] = {}
+
+def _bitfield_format(mask: int, sign_bit: int) -> str:
+    # The smallest format holding every value of a bitfield
+    width = mask.bit_length()
+    fmt = 'b' if width <= 8 else 'h' if width <= 16 else 'i'
+    return fmt if sign_bit else fmt.upper()
+
+def _schema(cls: Type[BankStruct]) -> tuple[struct.Struct, tuple[_Column, ...], tuple[Type[FieldType], ...]]:
+    """
+    Returns how the slots of a structure type are stored, derived from its compiled layout.
+
+    Numbers keep the format they have in the bank, and bitfields are stored one per column. Embedded structures
+    add their columns to the row, and references to other structures are stored as the number of the structure
+    in the file, 0 being `None`. Arrays and lists of structures store their length in the row and their items in a
+    flat array after the table, one per such column.
+    """
+    schema = _schemas.get(cls)
+    if schema is not None:
+        return schema
+
+    values = [char for count, char in re.findall(r'(\d*)(\D)', cls._format_) if char != 'x' for _ in range(int(count or 1))]
+    row = []
+    columns = []
+    flat_types = []
+    for attr, index in cls._plain_:
+        columns.append(('value', attr, None))
+        row.append(values[index])
+    for name, container_type, _, subfields, _ in cls._groups_:
+        if container_type is None:
+            for subname, _, mask, sign_bit in subfields:
+                columns.append(('value', subname, None))
+                row.append(_bitfield_format(mask, sign_bit))
+        else:
+            columns.append(('container', name, (container_type, tuple(subname for subname, *_ in subfields))))
+            row.extend(_bitfield_format(mask, sign_bit) for _, _, mask, sign_bit in subfields)
+    for name, struct_type, *_ in cls._embedded_ + cls._nested_:
+        embedded_row, embedded_columns, embedded_flat_types = _schema(struct_type)
+        columns.append(('embedded', name, (struct_type, embedded_columns)))
+        row.append(embedded_row.format.lstrip('>'))
+        flat_types.extend(embedded_flat_types)
+    for name, *_ in cls._pointers_:
+        columns.append(('ref', name, None))
+        row.append('I')
+    for name, _, _, field_type in cls._arrays_:
+        columns.append(('array', name, None))
+        row.append('I')
+        flat_types.append(field_type.field_type)
+    # Slots outside of the compiled layout, such as the points of an envelope, hold lists of structures
+    stored = {slot for _, slot, _ in columns} | {subname for _, _, _, subfields, _ in cls._groups_ for subname, *_ in subfields}
+    for slot in cls._state_slots_:
+        if slot not in stored:
+            columns.append(('list', slot, None))
+            row.append('I')
+            flat_types.append(u32)
+
+    schema = _schemas[cls] = (struct.Struct('>' + ''.join(row)), tuple(columns), tuple(flat_types))
+    return schema
+
+def _references(obj: BankStruct, columns: tuple[_Column, ...]) -> Iterator[BankStruct | None]:
+    # Every structure a structure refers to, including from the structures embedded in it
+    for kind, slot, extra in columns:
+        if kind == 'ref':
+            yield getattr(obj, slot)
+        elif kind == 'list':
+            yield from getattr(obj, slot)
+        elif kind == 'embedded':
+            yield from _references(getattr(obj, slot), extra[1])
+
+def _store(obj: BankStruct, columns: tuple[_Column, ...], values: list, flats: Iterator[list], numbers: dict[int, int]):
+    # Appends the row values of a structure, and the items of its arrays and lists to their flat arrays
+    for kind, slot, extra in columns:
+        value = getattr(obj, slot)
+        if kind == 'value':
+            values.append(value)
+        elif kind == 'ref':
+            values.append(0 if value is None else numbers[id(value)])
+        elif kind == 'container':
+            values.extend(int(getattr(value, name)) for name in extra[1])
+        elif kind == 'embedded':
+            _store(value, extra[1], values, flats, numbers)
+        else:
+            values.append(len(value))
+            next(flats).extend(value if kind == 'array' else (numbers[id(item)] for item in value))
+
+def _assign(objs: list, slot: str, values: Iterable):
+    # Sets one slot of every structure in a table without a Python-level loop
+    deque(map(setattr, objs, repeat(slot), values), maxlen=0)
+
+def _fill(objs: list, columns: tuple[_Column, ...], values: list[tuple], position: int, flats: Iterator, node: Callable) -> int:
+    # Fills in the slots of the structures of a table from its value columns, returning the next column
+    for kind, slot, extra in columns:
+        if kind == 'value':
+            column = values[position]
+            position += 1
+        elif kind == 'ref':
+            column = map(node, values[position])
+            position += 1
+        elif kind == 'container':
+            container_type, names = extra
+            column = [container_type(**dict(zip(names, fields))) for fields in zip(*values[position:position + len(names)])]
+            position += len(names)
+        elif kind == 'embedded':
+            struct_type, embedded_columns = extra
+            column = list(map(struct_type.__new__, repeat(struct_type, len(objs))))
+            position = _fill(column, embedded_columns, values, position, flats, node)
+        else:
+            bounds = list(accumulate(values[position], initial=0))
+            position += 1
+            column = map(next(flats).__getitem__, map(slice, bounds[:-1], bounds[1:]))
+            if kind == 'list':
+                column = [list(map(node, items)) for items in column]
+        _assign(objs, slot, column)
+    return position
+
+def _dump_bank(bank: Audiobank) -> bytes:
+    """
+    Returns the cached form of a parsed bank.
+
+    Structures are stored in one table per type and numbered from 1 in table order. Every structure is stored
+    once, however many others refer to it, so shared structures are shared again after loading.
+    """
+    tables: dict[type, list[BankStruct]] = {cls: [] for cls in _NODE_TYPES}
+    seen = set()
+    stack = [bank.metadata, *bank.instruments, *bank.drums, *bank.effects]
+    while stack:
+        obj = stack.pop()
+        if obj is None or id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        # Tracked structures are stored as the type they were parsed as
+        cls = type(obj)
+        cls = cls.__dict__.get('_untracked_type', cls)
+        if cls not in tables:
+            raise TypeError(f'{cls.__name__} structures cannot be cached')
+        tables[cls].append(obj)
+        stack.extend(_references(obj, _schema(cls)[1]))
+
+    numbers = {id(obj): number for number, obj in enumerate((obj for cls in _NODE_TYPES for obj in tables[cls]), 1)}
+
+    def pack_items(items: list, fmt: str) -> bytes:
+        return _COUNT.pack(len(items)) + struct.pack(f'>{len(items)}{fmt}', *items)
+
+    out = bytearray(_HEADER.pack(_MAGIC, numbers.get(id(bank.metadata), 0), bank.drum_list_offset, bank.effect_list_offset))
+    for items in (bank.instruments, bank.drums, bank.effects):
+        out += pack_items([0 if obj is None else numbers[id(obj)] for obj in items], 'I')
+    for indices in (bank.instrument_indices, bank.drum_indices, bank.effect_indices):
+        out += pack_items(indices, 'i')
+
+    for cls in _NODE_TYPES:
+        row, columns, flat_types = _schema(cls)
+        flats = [[] for _ in flat_types]
+        out += _COUNT.pack(len(tables[cls]))
+        for obj in tables[cls]:
+            values = []
+            _store(obj, columns, values, iter(flats), numbers)
+            out += row.pack(*values)
+        for items, item_type in zip(flats, flat_types):
+            out += pack_items(items, item_type.format)
+
+    return bytes(out)
+
+def _load_bank(data: bytes) -> Audiobank:
+    """
+    Loads a bank from its cached form.
+
+    Every structure is created up front, and then each slot is filled in for a whole table at a time, so references
+    can point to structures in any table.
+
+    Raises:
+        ValueError: If the data is not a cached bank.
+        struct.error: If the data is truncated.
+        IndexError: If a structure refers to a structure that is not in the data.
+    """
+    magic, metadata, drum_list_offset, effect_list_offset = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC:
+        raise ValueError('Data is not a cached instrument bank')
+    offset = _HEADER.size
+
+    def read_items(item_type: Type[FieldType]):
+        nonlocal offset
+        (count,) = _COUNT.unpack_from(data, offset)
+        items = array(item_type, count)
+        offset += _COUNT.size + items.size
+        return items.from_bytes(data, offset - items.size)
+
+    lists = [read_items(u32) for _ in range(3)] + [read_items(s32) for _ in range(3)]
+
+    nodes = [None]
+    tables = []
+    for cls in _NODE_TYPES:
+        row, columns, flat_types = _schema(cls)
+        (count,) = _COUNT.unpack_from(data, offset)
+        offset += _COUNT.size
+        table = data[offset:offset + count * row.size]
+        if len(table) != count * row.size:
+            raise struct.error('Cached bank is truncated')
+        offset += len(table)
+        objs = list(map(cls.__new__, repeat(cls, count)))
+        # One tuple per value of the row, holding that value for every structure
+        values = list(zip(*row.iter_unpack(table)))
+        flats = [read_items(item_type) for item_type in flat_types]
+        tables.append((objs, columns, values, flats))
+        nodes.extend(objs)
+
+    node = nodes.__getitem__
+    for objs, columns, values, flats in tables:
+        if objs:
+            _fill(objs, columns, values, 0, iter(flats), node)
+
+    bank = Audiobank()
+    bank.metadata = nodes[metadata]
+    bank.instruments, bank.drums, bank.effects = (list(map(node, items)) for items in lists[:3])
+    bank.instrument_indices, bank.drum_indices, bank.effect_indices = (items.tolist() for items in lists[3:])
+    bank.drum_list_offset = drum_list_offset
+    bank.effect_list_offset = effect_list_offset
+    return bank
+
+class DiskCache:
+    """
+    A persistent cache of parsed instrument banks in a directory.
+
+    Each bank is stored as one table per structure type holding the decoded fields of every structure once, so
+    structures shared between instruments, drums and effects are still shared after loading. A cached bank is about
+    the size of its bank data and loads two to three times faster than parsing it again, since a whole table is
+    unpacked at a time. Loading only ever creates the structures of a bank, so a shared directory cannot be used to
+    run code, and a file that cannot be read is treated as a miss. Files are written to a temporary name and renamed
+    into place, so several processes can share one directory: readers only ever see complete files, and a file
+    evicted by another process is simply a miss. Once the directory grows past `max_size` bytes, the least recently
+    used files are deleted.
+
+    Each cache keeps a running total of the size of the directory, so a write does not scan it. Files written by
+    other processes are only counted once the total passes `max_size` and the directory is scanned before evicting.
+
+    Attributes:
+        load (method): Returns a cached bank, or parses and caches it.
+        get (method): Returns a cached bank, or `None`.
+        put (method): Stores a parsed bank.
+        clear (method): Deletes every cached bank.
+    """
+    _SUFFIX = '.bank'
+
+    def __init__(self, directory: str | os.PathLike, max_size: int = 256 * 1024 * 1024):
+        self.directory: str = os.fspath(directory)
+        self.max_size: int = max_size
+        os.makedirs(self.directory, exist_ok=True)
+        # Size of the cached files in bytes, scanned on the first write and then kept up to date by this instance
+        self._size: int | None = None
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest + self._SUFFIX)
+
+    def load(self, table_entry: bytes, bank_data: bytes) -> Audiobank:
+        """
+        Returns the cached bank for an (entry, data) pair, parsing and caching it on a miss.
+
+        Args:
+            table_entry (bytes): Binary table entry data. Can be either truncated (0x08) or full (0x10) bytes long.
+            bank_data (bytes): Binary instrument bank data.
+
+        Returns:
+            object (Audiobank): The parsed instrument bank.
+        """
+        digest = bank_digest(table_entry, bank_data)
+        bank = self._read(digest)
+        if bank is None:
+            bank = Audiobank.from_bytes(table_entry, bank_data)
+            self._write(digest, bank)
+        return bank
+
+    def get(self, table_entry: bytes, bank_data: bytes) -> Audiobank | None:
+        """ Returns the cached bank for an (entry, data) pair, or `None` if it is not cached. """
+        return self._read(bank_digest(table_entry, bank_data))
+
+    def put(self, table_entry: bytes, bank_data: bytes, bank: Audiobank):
+        """ Stores the bank parsed from an (entry, data) pair. """
+        self._write(bank_digest(table_entry, bank_data), bank)
+
+    def clear(self):
+        """ Deletes every cached bank. """
+        for path, _, _ in self._files():
+            self._remove(path)
+        self._size = 0
+
+    def _read(self, digest: str) -> Audiobank | None:
+        path = self._path(digest)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        try:
+            bank = _load_bank(data)
+        except Exception:
+            # A file this version cannot read is treated as a miss and replaced by the next write
+            self._discard(path)
+            return None
+
+        # The access time is used for eviction, and may not be updated by the file system itself
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return bank
+
+    def _write(self, digest: str, bank: Audiobank):
+        # Statistics describe the parse that produced the bank, not a later load, so they are not stored
+        data = _dump_bank(bank)
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            size = len(data)
+            replaced = self._file_size(path)
+            os.replace(temp_path, path)
+        except BaseException:
+            self._remove(temp_path)
+            raise
+
+        if self._size is None:
+            self._size = sum(size for _, _, size in self._files())
+        else:
+            self._size += size - replaced
+        # The directory is only scanned again once the tracked size passes the limit
+        if self._size > self.max_size:
+            self._evict()
+
+    def _files(self) -> list[tuple[str, float, int]]:
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(self._SUFFIX):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((path, max(st.st_atime, st.st_mtime), st.st_size))
+        return files
+
+    def _evict(self):
+        # Scanning picks up files written and evicted by other processes sharing the directory
+        files = self._files()
+        total = sum(size for _, _, size in files)
+        if total > self.max_size:
+            # Evict down to 90% of the limit, so the next scan is only due after another 10% has been written
+            for path, _, size in sorted(files, key=lambda file: file[1]):
+                if total <= self.max_size * 0.9:
+                    break
+                self._remove(path)
+                total -= size
+        self._size = total
+
+    @staticmethod
+    def _file_size(path: str) -> int:
+        try:
+            return os.stat(path).st_size
+        except OSError:
+            return 0
+
+    def _discard(self, path: str):
+        # Removes a cached file, keeping the tracked size up to date
+        size = self._file_size(path)
+        self._remove(path)
+        if self._size is not None:
+            self._size -= size
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def estimate_size(bank: Audiobank) -> int:
+    """
+    Estimates the memory used by a parsed bank, counting every shared structure once.
+
+    Args:
+        bank (Audiobank): The parsed instrument bank.
+
+    Returns:
+        size (int): The estimated size in bytes.
+    """
+    size = sys.getsizeof(bank)
+    seen = set()
+    stack = [bank.metadata, bank.instruments, bank.drums, bank.effects, bank.instrument_indices, bank.drum_indices, bank.effect_indices]
+
+    while stack:
+        value = stack.pop()
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        size += sys.getsizeof(value)
+
+        if isinstance(value, BankStruct):
+            stack.extend(getattr(value, slot) for slot in value._state_slots_)
+        elif isinstance(value, list):
+            stack.extend(value)
+        elif not isinstance(value, (int, float, Enum)):
+            # Bitfield containers such as `SampleFlags`
+            stack.extend(getattr(value, slot) for slot in getattr(value, '__slots__', ()) if hasattr(value, slot))
+            stack.extend(getattr(value, '__dict__', {}).values())
+
+    return size
+
+@dataclass
+class CacheStats:
+    """
+    Usage statistics of a `BankCache`.
+
+    Attributes:
+        hits (int): Number of lookups that found a cached bank.
+        misses (int): Number of lookups that did not.
+        evictions (int): Number of banks evicted to stay within the memory budget.
+        entries (int): Number of banks currently cached.
+        size (int): Estimated memory used by the cached banks, in bytes.
+    """
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    size: int = 0
+
+class BankCache:
+    """
+    An in-memory cache of parsed instrument banks, bounded by an estimated memory budget.
+
+    Banks are keyed by the content digest of their (entry, data) pair and evicted least recently used first
+    once the budget is exceeded. A bank larger than the whole budget is returned but not cached. The cache can
+    be shared between threads; banks are parsed outside the lock, so a slow parse does not block other lookups.
+
+    Cached banks are shared between every caller that loads them and should not be modified.
+
+    Attributes:
+        load (method): Returns a cached bank, or parses and caches it.
+        get (method): Returns a cached bank, or `None`.
+        put (method): Stores a parsed bank.
+        clear (method): Removes every cached bank.
+        stats (method): Returns the cache's usage statistics.
+    """
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes: int = max_bytes
+        self._banks: OrderedDict[str, tuple[Audiobank, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def __len__(self):
+        return len(self._banks)
+
+    def load(self, table_entry: bytes, bank_data: bytes) -> Audiobank:
+        """
+        Returns the cached bank for an (entry, data) pair, parsing and caching it on a miss.
+
+        Args:
+            table_entry (bytes): Binary table entry data. Can be either truncated (0x08) or full (0x10) bytes long.
+            bank_data (bytes): Binary instrument bank data.
+
+        Returns:
+            object (Audiobank): The parsed instrument bank.
+        """
+        digest = bank_digest(table_entry, bank_data)
+        bank = self._get(digest)
+        if bank is None:
+            bank = Audiobank.from_bytes(table_entry, bank_data)
+            bank = self._put(digest, bank)
+        return bank
+
+    def get(self, table_entry: bytes, bank_data: bytes) -> Audiobank | None:
+        """ Returns the cached bank for an (entry, data) pair, or `None` if it is not cached. """
+        return self._get(bank_digest(table_entry, bank_data))
+
+    def put(self, table_entry: bytes, bank_data: bytes, bank: Audiobank):
+        """ Stores the bank parsed from an (entry, data) pair. """
+        self._put(bank_digest(table_entry, bank_data), bank, replace=True)
+
+    def clear(self):
+        """ Removes every cached bank. Statistics are kept. """
+        with self._lock:
+            self._banks.clear()
+            self._size = 0
+
+    def stats(self) -> CacheStats:
+        """ Returns the cache's usage statistics. """
+        with self._lock:
+            return CacheStats(self._hits, self._misses, self._evictions, len(self._banks), self._size)
+
+    def _get(self, digest: str) -> Audiobank | None:
+        with self._lock:
+            entry = self._banks.get(digest)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._banks.move_to_end(digest)
+            self._hits += 1
+            return entry[0]
+
+    def _put(self, digest: str, bank: Audiobank, replace: bool = False) -> Audiobank:
+        size = estimate_size(bank)
+
+        with self._lock:
+            entry = self._banks.get(digest)
+            if entry is not None:
+                if not replace:
+                    # Another thread parsed the same bank first, so keep returning a single object
+                    self._banks.move_to_end(digest)
+                    return entry[0]
+                del self._banks[digest]
+                self._size -= entry[1]
+
+            if size > self.max_bytes:
+                return bank
+
+            self._banks[digest] = (bank, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._banks.popitem(last=False)
+                self._size -= evicted_size
+                self._evictions += 1
+
+        return bank
@@ -0,0 +1,365 @@
+"""
+Columns
+=====
+
+Exports instrument banks as struct-of-arrays tables of NumPy structured arrays, for analytics over many banks
+without walking parsed structures.
+
+Every table has a `bank` column holding the position of the bank in the corpus (0 for a single bank) and an
+`offset` column holding the offset of the row's structure in its bank. Pointers are stored as the offset of the
+structure they point to, or 0 for a null pointer, so tables are joined on (`bank`, `offset`):
+
+    ===============  ===============================================================================
+    Table            Rows
+    ===============  ===============================================================================
+    instruments      One per non-empty instrument list slot.
+    drums            One per non-empty drum list slot.
+    effects          One per non-empty effect list slot. `offset` is the offset of the list entry.
+    samples          One per sample, however many tuned samples point to it.
+    envelopes        One per envelope point, including the terminating opcode, numbered by `point`.
+    loops            One per loop.
+    books            One per codebook.
+    ===============  ===============================================================================
+
+The variable-length arrays of loops and codebooks are stored once per bank in flat int16 arrays, and each row
+gives the start and length of its values:
+
+    =================  ==========================================================================================
+    Array              Values
+    =================  ==========================================================================================
+    loop_predictors    The predictor state of each loop, at `predictor_start` in `loops`, `predictor_count`
+                       values long (16 for loops with a state, 0 otherwise).
+    book_coefficients  The coefficients of each codebook, at `coefficient_start` in `books`, `coefficient_count`
+                       values long, in the order of `VadpcmBook.predictors`.
+    =================  ==========================================================================================
+
+The values of a row are `array[start:start + count]`. In corpus tables the starts index the concatenated arrays.
+
+Tables are read straight from the binary data with vectorized gathers, so no structures are created. Sample
+flags are split into one column per bitfield, and enum fields hold their raw values.
+
+Requires NumPy.
+"""
+import struct
+from typing import Iterable
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .audiobank import Audiobank, _read_table_entry
+from .bankstruct import BankFormatError, EnvelopeLengthError, ParseContext, ParseLimits, TruncatedBankError
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('NumPy is required to export columns')
+
+# Binary layouts of the fixed-size structures, as they are stored in the bank
+_RAW_DTYPES: dict[str, list[tuple[str, str]]] = {
+    'instrument': [
+        ('is_relocated', 'u1'), ('low_key_region', 'u1'), ('high_key_region', 'u1'), ('decay_index', 'u1'),
+        ('envelope', '>u4'),
+        ('low_sample', '>u4'), ('low_tuning', '>f4'),
+        ('prim_sample', '>u4'), ('prim_tuning', '>f4'),
+        ('high_sample', '>u4'), ('high_tuning', '>f4'),
+    ],
+    'drum': [
+        ('decay_index', 'u1'), ('pan', 'u1'), ('is_relocated', 'u1'), ('_pad', 'u1'),
+        ('sample', '>u4'), ('tuning', '>f4'), ('envelope', '>u4'),
+    ],
+    'tuned_sample': [('sample', '>u4'), ('tuning', '>f4')],
+    'sample': [('flags', '>u4'), ('sample_addr', '>u4'), ('loop', '>u4'), ('book', '>u4')],
+    'loop': [('loop_start', '>u4'), ('loop_end', '>u4'), ('loop_count', '>u4'), ('num_samples', '>u4')],
+    'book': [('order', '>i4'), ('num_predictors', '>i4')],
+}
+
+# Columns of each exported table, in native byte order
+_KEY = [('bank', 'i4'), ('offset', 'u4')]
+TABLE_DTYPES: dict[str, list[tuple[str, str]]] = {
+    'instruments': _KEY + [
+        ('index', 'u1'), ('is_relocated', '?'), ('low_key_region', 'u1'), ('high_key_region', 'u1'),
+        ('decay_index', 'u1'), ('envelope', 'u4'),
+        ('low_sample', 'u4'), ('low_tuning', 'f4'),
+        ('prim_sample', 'u4'), ('prim_tuning', 'f4'),
+        ('high_sample', 'u4'), ('high_tuning', 'f4'),
+    ],
+    'drums': _KEY + [
+        ('index', 'u1'), ('decay_index', 'u1'), ('pan', 'u1'), ('is_relocated', '?'),
+        ('sample', 'u4'), ('tuning', 'f4'), ('envelope', 'u4'),
+    ],
+    'effects': _KEY + [('index', 'u2'), ('sample', 'u4'), ('tuning', 'f4')],
+    'samples': _KEY + [
+        ('unk_0', 'u1'), ('codec', 'u1'), ('medium', 'u1'), ('is_cached', '?'), ('is_relocated', '?'),
+        ('size', 'u4'), ('sample_addr', 'u4'), ('loop', 'u4'), ('book', 'u4'),
+    ],
+    'envelopes': _KEY + [('point', 'u2'), ('time_or_opcode', 'i2'), ('amp_or_index', 'i2')],
+    'loops': _KEY + [
+        ('loop_start', 'u4'), ('loop_end', 'u4'), ('loop_count', 'u4'), ('num_samples', 'u4'), ('has_predictors', '?'),
+        ('predictor_start', 'u4'), ('predictor_count', 'u4'),
+    ],
+    'books': _KEY + [('order', 'i4'), ('num_predictors', 'i4'), ('coefficient_start', 'u4'), ('coefficient_count', 'u4')],
+}
+
+# Flat value arrays: array name -> (table, start column, count column, dtype)
+VALUE_ARRAYS: dict[str, tuple[str, str, str, str]] = {
+    'loop_predictors': ('loops', 'predictor_start', 'predictor_count', 'i2'),
+    'book_coefficients': ('books', 'coefficient_start', 'coefficient_count', 'i2'),
+}
+
+# Sample flag bitfields: (column, shift, mask), most significant bits first
+_SAMPLE_FLAGS = [
+    ('unk_0', 31, 0x1),
+    ('codec', 28, 0x7),
+    ('medium', 26, 0x3),
+    ('is_cached', 25, 0x1),
+    ('is_relocated', 24, 0x1),
+    ('size', 0, 0xFFFFFF),
+]
+
+def _gather(data: 'np.ndarray', offsets: 'np.ndarray', layout: str) -> 'np.ndarray':
+    """ Reads one record of a fixed-size layout at each offset. """
+    dtype = np.dtype(_RAW_DTYPES[layout])
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if len(offsets) and offsets.max() + dtype.itemsize > len(data):
+        raise TruncatedBankError(f'A {layout} structure at {hex(int(offsets.max()))} extends past the end of the bank data')
+    rows = data[offsets[:, None] + np.arange(dtype.itemsize)]
+    return rows.view(dtype).reshape(len(offsets))
+
+def _ragged(data: 'np.ndarray', starts: 'np.ndarray', counts: 'np.ndarray', layout: str) -> tuple['np.ndarray', 'np.ndarray']:
+    """
+    Reads `counts[i]` big-endian int16 values at each offset `starts[i]`.
+
+    Returns:
+        first (ndarray): Index of the first value of each run in `values`.
+        values (ndarray): Every run, one after the other.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    ends = starts + (2 * counts)
+    if len(starts) and ends.max() > len(data):
+        last = int(np.argmax(ends))
+        raise TruncatedBankError(f'A {layout} structure at {hex(int(starts[last]))} extends past the end of the bank data')
+
+    first = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+    total = int(counts.sum())
+    positions = np.repeat(starts - (2 * first), counts) + (2 * np.arange(total))
+    values = data[positions[:, None] + np.arange(2)].view('>i2').reshape(total).astype(np.int16)
+    return first, values
+
+def _table(name: str, rows: int, **columns) -> 'np.ndarray':
+    table = np.zeros(rows, dtype=TABLE_DTYPES[name])
+    for column, values in columns.items():
+        table[column] = values
+    return table
+
+def _targets(*pointers: 'np.ndarray') -> 'np.ndarray':
+    """ Returns the sorted, unique, non-null offsets among several pointer columns. """
+    offsets = np.unique(np.concatenate([np.asarray(p, dtype=np.int64) for p in pointers]))
+    return offsets[offsets != 0]
+
+def _envelope_points(bank_data: bytes, offsets: 'np.ndarray', context: ParseContext) -> tuple[list[int], list[int], list[int], list[int]]:
+    # Envelopes end at their first opcode, so their length is only known by reading them. In strict mode, points
+    # are charged against the same work budget as a strict parse, which bounds overlapping envelopes.
+    limits = context.limits
+    owners, points, times, amps = [], [], [], []
+    for offset in offsets.tolist():
+        point = 0
+        while True:
+            if limits is not None:
+                if point >= limits.max_envelope_points:
+                    raise EnvelopeLengthError(f'Envelope at {hex(offset)} has no opcode within {limits.max_envelope_points} points')
+                context.charge(bank_data, offset + (point * 4), 4, 'EnvelopePoint')
+            time, amp = struct.unpack_from('>2h', bank_data, offset + (point * 4))
+            owners.append(offset)
+            points.append(point)
+            times.append(time)
+            amps.append(amp)
+            point += 1
+            if time <= 0:
+                break
+    return owners, points, times, amps
+
+def columns_from_bytes(table_entry: bytes, bank_data: bytes, strict: bool | ParseLimits = False) -> dict[str, 'np.ndarray']:
+    """
+    Exports one instrument bank as columnar tables, read straight from its binary data.
+
+    Lists, fixed-size structures, loop states and codebooks are always range-checked. Envelopes are read until
+    their terminating opcode, however long they are, unless `strict` is set, which applies the envelope length
+    limit, codebook checks and work budget of `Audiobank.from_bytes(strict=...)`. Banks from untrusted sources
+    should be read with `strict`.
+
+    Args:
+        table_entry (bytes): Binary table entry data. Can be either truncated (0x08) or full (0x10) bytes long.
+        bank_data (bytes): Binary instrument bank data.
+        strict (bool | ParseLimits): Whether to read strictly, or the limits to read with.
+
+    Returns:
+        tables (dict[str, ndarray]): A structured array for each table and a flat array for each of `VALUE_ARRAYS`,
+            by name.
+    """
+    _require_numpy()
+    limits = ParseLimits() if strict is True else (strict or None)
+    # Variable-length data is charged against the work budget of a strict parse
+    context = ParseContext(limits=limits)
+    metadata = _read_table_entry(table_entry)
+    data = np.frombuffer(bank_data, dtype=np.uint8)
+    drum_list_offset, effect_list_offset = struct.unpack_from('>2I', bank_data, 0)
+
+    def read_list(list_offset: int, count: int, kind: str) -> 'np.ndarray':
+        if list_offset + (4 * count) > len(data):
+            raise TruncatedBankError(f'{kind} list at {hex(list_offset)} extends past the end of the bank data ({hex(len(data))} bytes)')
+        return np.frombuffer(bank_data, dtype='>u4', count=count, offset=list_offset).astype(np.uint32)
+
+    # Instruments
+    instrument_list = read_list(0x08, metadata.num_instruments, 'Instrument')
+    instrument_indices = np.flatnonzero(instrument_list)
+    instrument_offsets = instrument_list[instrument_indices]
+    raw = _gather(data, instrument_offsets, 'instrument')
+    instruments = _table(
+        'instruments', len(raw), offset=instrument_offsets, index=instrument_indices,
+        **{name: raw[name] for name, _ in _RAW_DTYPES['instrument']}
+    )
+
+    # Drums
+    drum_list = read_list(drum_list_offset, metadata.num_drums, 'Drum')
+    drum_indices = np.flatnonzero(drum_list)
+    drum_offsets = drum_list[drum_indices]
+    raw = _gather(data, drum_offsets, 'drum')
+    drums = _table(
+        'drums', len(raw), offset=drum_offsets, index=drum_indices,
+        **{name: raw[name] for name, _ in _RAW_DTYPES['drum'] if name != '_pad'}
+    )
+
+    # Effects are stored in their list, and a slot of all zeroes is empty
+    entry_offsets = effect_list_offset + (8 * np.arange(metadata.num_effects, dtype=np.int64))
+    raw = _gather(data, entry_offsets, 'tuned_sample')
+    effect_indices = np.flatnonzero((raw['sample'] != 0) | (raw['tuning'].view('>u4') != 0))
+    raw = raw[effect_indices]
+    effects = _table(
+        'effects', len(raw), offset=entry_offsets[effect_indices], index=effect_indices,
+        sample=raw['sample'], tuning=raw['tuning']
+    )
+
+    # Samples, and the loops and books they point to
+    sample_offsets = _targets(
+        instruments['low_sample'], instruments['prim_sample'], instruments['high_sample'],
+        drums['sample'], effects['sample']
+    )
+    raw = _gather(data, sample_offsets, 'sample')
+    samples = _table(
+        'samples', len(raw), offset=sample_offsets,
+        sample_addr=raw['sample_addr'], loop=raw['loop'], book=raw['book'],
+        **{name: (raw['flags'] >> shift) & mask for name, shift, mask in _SAMPLE_FLAGS}
+    )
+
+    loop_offsets = _targets(samples['loop'])
+    raw = _gather(data, loop_offsets, 'loop')
+    # The predictor state is only present for looped samples
+    predictor_counts = np.where(raw['loop_start'] != 0, 16, 0)
+    predictor_starts, loop_predictors = _ragged(data, loop_offsets + 0x10, predictor_counts, 'loop')
+    loops = _table(
+        'loops', len(raw), offset=loop_offsets, has_predictors=raw['loop_start'] != 0,
+        predictor_start=predictor_starts, predictor_count=predictor_counts,
+        **{name: raw[name] for name, _ in _RAW_DTYPES['loop']}
+    )
+
+    book_offsets = _targets(samples['book'])
+    raw = _gather(data, book_offsets, 'book')
+    order = raw['order'].astype(np.int64)
+    num_predictors = raw['num_predictors'].astype(np.int64)
+    if limits is not None and len(raw) and (order.min() <= 0 or num_predictors.min() <= 0):
+        bad = int(np.argmax((order <= 0) | (num_predictors <= 0)))
+        raise BankFormatError(f'VadpcmBook at {hex(int(book_offsets[bad]))} has order {order[bad]} and {num_predictors[bad]} predictors')
+    coefficient_counts = 8 * np.maximum(order, 0) * np.maximum(num_predictors, 0)
+    if limits is not None:
+        for offset, count in zip(book_offsets.tolist(), coefficient_counts.tolist()):
+            context.charge(bank_data, offset + 0x08, 2 * count, 'VadpcmBook')
+    coefficient_starts, book_coefficients = _ragged(data, book_offsets + 0x08, coefficient_counts, 'book')
+    books = _table(
+        'books', len(raw), offset=book_offsets, order=raw['order'], num_predictors=raw['num_predictors'],
+        coefficient_start=coefficient_starts, coefficient_count=coefficient_counts,
+    )
+
+    # Envelopes
+    owners, points, times, amps = _envelope_points(bank_data, _targets(instruments['envelope'], drums['envelope']), context)
+    envelopes = _table('envelopes', len(owners), offset=owners, point=points, time_or_opcode=times, amp_or_index=amps)
+
+    return {
+        'instruments': instruments,
+        'drums': drums,
+        'effects': effects,
+        'samples': samples,
+        'envelopes': envelopes,
+        'loops': loops,
+        'books': books,
+        'loop_predictors': loop_predictors,
+        'book_coefficients': book_coefficients,
+    }
+
+def bank_columns(bank: Audiobank) -> dict[str, 'np.ndarray']:
+    """
+    Exports a parsed instrument bank as columnar tables.
+
+    The bank is serialized with `Audiobank.to_bytes` first, so edits are included and the offsets are those of
+    the serialized layout rather than of the data the bank was parsed from.
+
+    Args:
+        bank (Audiobank): The parsed instrument bank.
+
+    Returns:
+        tables (dict[str, ndarray]): A structured array for each table and a flat array for each of `VALUE_ARRAYS`,
+            by name.
+    """
+    bank_data, table_entry = bank.to_bytes()
+    return columns_from_bytes(table_entry, bank_data)
+
+def corpus_columns(banks: Iterable[Audiobank | tuple[bytes, bytes]], strict: bool | ParseLimits = False) -> dict[str, 'np.ndarray']:
+    """
+    Exports many instrument banks as one set of columnar tables.
+
+    Banks given as (table entry, bank data) pairs are read straight from their binary data without being
+    parsed, which is much faster than parsing them first. The `bank` column of every row holds the position of
+    its bank in `banks`.
+
+    Example::
+
+        tables = corpus_columns(zip(table_entries, bank_datas))
+        samples = tables['samples']
+        codecs = np.bincount(samples['codec'], minlength=8)
+
+    Args:
+        banks (Iterable[Audiobank | tuple[bytes, bytes]]): Parsed banks or (table entry, bank data) pairs.
+        strict (bool | ParseLimits): Whether to read the envelopes of (table entry, bank data) pairs strictly, or
+            the limits to read them with. See `columns_from_bytes`.
+
+    Returns:
+        tables (dict[str, ndarray]): A structured array for each table and a flat array for each of `VALUE_ARRAYS`,
+            by name.
+    """
+    _require_numpy()
+    parts: dict[str, list['np.ndarray']] = {name: [] for name in TABLE_DTYPES}
+    values: dict[str, list['np.ndarray']] = {name: [] for name in VALUE_ARRAYS}
+    num_values = dict.fromkeys(VALUE_ARRAYS, 0)
+    for bank_index, bank in enumerate(banks):
+        if isinstance(bank, Audiobank):
+            tables = bank_columns(bank)
+        else:
+            tables = columns_from_bytes(*bank, strict=strict)
+        for name, (table_name, start, _, _) in VALUE_ARRAYS.items():
+            # Starts index the concatenated value array
+            tables[table_name][start] += num_values[name]
+            num_values[name] += len(tables[name])
+            values[name].append(tables[name])
+        for name in TABLE_DTYPES:
+            table = tables[name]
+            table['bank'] = bank_index
+            parts[name].append(table)
+
+    result = {
+        name: np.concatenate(tables) if tables else np.zeros(0, dtype=TABLE_DTYPES[name])
+        for name, tables in parts.items()
+    }
+    for name, (_, _, _, dtype) in VALUE_ARRAYS.items():
+        result[name] = np.concatenate(values[name]) if values[name] else np.zeros(0, dtype=dtype)
+    return result
@@ -0,0 +1,250 @@
+"""
+Decoder
+=====
+
+Decodes audio sample data into signed 16-bit PCM.
+
+VADPCM decoding follows the game's ADPCM decode step: every frame starts with a header byte holding a scale
+shift and a predictor index, followed by 16 residuals that are 4-bit (ADPCM) or 2-bit (SMALL_ADPCM). Each half
+of a frame is predicted from the last `order` output samples and the residuals with the chosen predictor of the
+codebook. The residual part of the prediction does not depend on earlier output, so it is computed for every
+frame at once; only the short dependency on the previous outputs is carried from one half-frame to the next.
+
+Like the RSP, which places a residual in the top bits of a 16-bit lane and shifts it back down, scale shifts
+saturate at 12 for 4-bit residuals and at 14 for 2-bit residuals instead of overflowing.
+
+Requires NumPy.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .constants import AudioSampleCodec
+from .samplebank import SampleBanks
+from .structures.sample import Sample
+from .structures.vadpcm import VadpcmBook
+
+# Frame sizes in bytes: one header byte plus 16 residuals
+_FRAME_SIZES: dict[AudioSampleCodec, int] = {
+    AudioSampleCodec.ADPCM: 9,
+    AudioSampleCodec.SMALL_ADPCM: 5,
+}
+
+# Largest scale shift of each codec, past which the RSP saturates
+_MAX_SHIFTS: dict[AudioSampleCodec, int] = {
+    AudioSampleCodec.ADPCM: 12,
+    AudioSampleCodec.SMALL_ADPCM: 14,
+}
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('NumPy is required to decode audio samples')
+
+def _expand_book(book: VadpcmBook) -> tuple['np.ndarray', 'np.ndarray']:
+    """
+    Expands a codebook into the two matrices used by each predictor.
+
+    Returns:
+        history (ndarray): (num_predictors, 8, order) weights applied to the previous `order` output samples.
+        residual (ndarray): (num_predictors, 8, 8) lower-triangular weights applied to the eight residuals.
+    """
+    order = book.header.order
+    num_predictors = book.header.num_predictors
+    coefficients = np.asarray(book.predictors, dtype=np.int64).reshape(num_predictors, order, 8)
+
+    # Row `o` of a predictor weighs the output sample `order - o` positions back
+    history = coefficients.transpose(0, 2, 1).copy()
+
+    # Residual k feeds output j (k < j) through the last row of the predictor, shifted by j - k - 1
+    residual = np.zeros((num_predictors, 8, 8), dtype=np.int64)
+    for j in range(8):
+        residual[:, j, j] = 1 << 11
+        for k in range(j):
+            residual[:, j, k] = coefficients[:, order - 1, j - k - 1]
+
+    return history, residual
+
+def _unpack_residuals(frames: 'np.ndarray', codec: AudioSampleCodec) -> 'np.ndarray':
+    body = frames[:, 1:].astype(np.int64)
+
+    if codec == AudioSampleCodec.ADPCM:
+        codes = np.stack((body >> 4, body & 0xF), axis=-1).reshape(len(frames), 16)
+        codes = np.where(codes >= 8, codes - 16, codes)
+    else:
+        codes = np.stack((body >> 6, (body >> 4) & 0x3, (body >> 2) & 0x3, body & 0x3), axis=-1).reshape(len(frames), 16)
+        codes = np.where(codes >= 2, codes - 4, codes)
+
+    shifts = np.minimum(frames[:, :1].astype(np.int64) >> 4, _MAX_SHIFTS[codec])
+    return codes << shifts
+
+def _prepare(data: bytes, book: VadpcmBook, codec: AudioSampleCodec, order: int) -> tuple['np.ndarray', 'np.ndarray']:
+    """
+    Computes everything that does not depend on earlier output for each half-frame of one sample.
+
+    Returns:
+        partial (ndarray): (half-frames, 8) residual contribution to each output sample.
+        weights (ndarray): (half-frames, 8, order) weights applied to the previous `order` output samples.
+    """
+    if codec not in _FRAME_SIZES:
+        raise ValueError(f'Codec {codec} is not a VADPCM codec')
+    if not 0 < book.header.order <= 8:
+        raise ValueError(f'Unsupported codebook order: {book.header.order}')
+
+    frame_size = _FRAME_SIZES[codec]
+    num_frames = memoryview(data).nbytes // frame_size
+    frames = np.frombuffer(data, dtype=np.uint8, count=num_frames * frame_size).reshape(num_frames, frame_size)
+
+    history, residual = _expand_book(book)
+    # Books of a lower order than the rest of the batch ignore the oldest samples
+    history = np.concatenate((np.zeros(history.shape[:2] + (order - book.header.order,), dtype=np.int64), history), axis=2)
+
+    predictor_indices = np.repeat(frames[:, 0] & 0xF, 2)
+    if num_frames and predictor_indices.max() >= book.header.num_predictors:
+        raise ValueError(f'Sample data uses predictor {predictor_indices.max()}, but the codebook only has {book.header.num_predictors}')
+
+    residuals = _unpack_residuals(frames, codec).reshape(num_frames * 2, 8)
+    partial = np.einsum('hjk,hk->hj', residual[predictor_indices], residuals)
+    return partial, history[predictor_indices]
+
+def decode_vadpcm_batch(samples: list[tuple[bytes, VadpcmBook, AudioSampleCodec]]) -> list['np.ndarray']:
+    """
+    Decodes several VADPCM-compressed samples at once.
+
+    The part of the prediction that depends on earlier output is run for every sample in lockstep, one
+    half-frame at a time, so decoding a whole sample bank costs about as much as decoding its longest sample.
+
+    Args:
+        samples (list[tuple[bytes, VadpcmBook, AudioSampleCodec]]): The compressed data, codebook and codec
+            (`ADPCM` or `SMALL_ADPCM`) of each sample. Any trailing partial frame is ignored.
+
+    Returns:
+        pcm (list[ndarray]): Signed 16-bit PCM for each sample, 16 samples per frame.
+    """
+    _require_numpy()
+    if not samples:
+        return []
+
+    order = max(book.header.order for _, book, _ in samples)
+    prepared = [_prepare(data, book, codec, order) for data, book, codec in samples]
+
+    # Lay the half-frames out step-major, longest samples first, so the samples still decoding at any
+    # step are a contiguous prefix of that step's rows
+    lengths = np.array([len(partial) for partial, _ in prepared], dtype=np.int64)
+    by_length = np.argsort(-lengths, kind='stable')
+    num_steps = int(lengths.max())
+    active = len(samples) - np.cumsum(np.bincount(lengths, minlength=num_steps + 1))[:num_steps]
+    step_starts = np.concatenate(([0], np.cumsum(active)))
+
+    total = int(step_starts[-1])
+    partial = np.empty((total, 8), dtype=np.int64)
+    weights = np.empty((order, total, 8), dtype=np.int64)
+    rows = []
+    for rank, i in enumerate(by_length.tolist()):
+        sample_rows = step_starts[:lengths[i]] + rank
+        sample_partial, sample_weights = prepared[i]
+        partial[sample_rows] = sample_partial
+        weights[:, sample_rows] = sample_weights.transpose(2, 0, 1)
+        rows.append((i, sample_rows))
+
+    # `out` doubles as the accumulator of each step
+    out = partial
+    previous = np.zeros((order, len(samples), 1), dtype=np.int64)
+    bounds = step_starts.tolist()
+    for step in range(num_steps):
+        start, stop = bounds[step], bounds[step + 1]
+        count = stop - start
+        acc = out[start:stop]
+        for o in range(order):
+            acc += weights[o, start:stop] * previous[o, :count]
+        acc >>= 11
+        np.maximum(acc, -0x8000, out=acc)
+        np.minimum(acc, 0x7FFF, out=acc)
+        previous[:, :count, 0] = acc[:, 8 - order:].T
+
+    result = [None] * len(samples)
+    for i, sample_rows in rows:
+        result[i] = out[sample_rows].astype(np.int16).reshape(-1)
+    return result
+
+def decode_vadpcm(data: bytes, book: VadpcmBook, codec: AudioSampleCodec = AudioSampleCodec.ADPCM) -> 'np.ndarray':
+    """
+    Decodes VADPCM-compressed sample data.
+
+    Args:
+        data (bytes): The compressed sample data. Any trailing partial frame is ignored.
+        book (VadpcmBook): The codebook the sample was encoded with.
+        codec (AudioSampleCodec): Either `ADPCM` (4-bit) or `SMALL_ADPCM` (2-bit).
+
+    Returns:
+        pcm (ndarray): Signed 16-bit PCM, 16 samples per frame.
+    """
+    return decode_vadpcm_batch([(data, book, codec)])[0]
+
+def _sample_data(sample: Sample, sample_bank: 'bytes | SampleBanks') -> memoryview:
+    if isinstance(sample_bank, SampleBanks):
+        return sample.data(sample_bank)
+    start = sample.sample_addr
+    size = sample.flags.size
+    with memoryview(sample_bank) as view:
+        data = view.cast('B')[start:start + size]
+    if data.nbytes != size:
+        raise ValueError(f'Sample at {hex(start)} with size {hex(size)} extends past the end of the sample bank')
+    return data
+
+def decode_samples(samples: list[Sample], sample_bank: 'bytes | SampleBanks') -> list['np.ndarray']:
+    """
+    Decodes several audio samples from the same sample bank into signed 16-bit PCM.
+
+    VADPCM samples are decoded together with `decode_vadpcm_batch`, each with its own codebook.
+
+    Args:
+        samples (list[Sample]): The samples to decode.
+        sample_bank (bytes | SampleBanks): The raw sample bank the samples' addresses point into, or the sample
+            banks of their instrument bank.
+
+    Returns:
+        pcm (list[ndarray]): Signed 16-bit PCM for each sample.
+    """
+    _require_numpy()
+    result = [None] * len(samples)
+    vadpcm = []
+
+    for i, sample in enumerate(samples):
+        data = _sample_data(sample, sample_bank)
+        match sample.flags.codec:
+            case AudioSampleCodec.ADPCM | AudioSampleCodec.SMALL_ADPCM:
+                if sample.book is None:
+                    raise ValueError('VADPCM samples require a codebook')
+                vadpcm.append((i, (data, sample.book, sample.flags.codec)))
+            case AudioSampleCodec.S16 | AudioSampleCodec.S16_INMEM:
+                result[i] = np.frombuffer(data, dtype='>i2', count=data.nbytes // 2).astype(np.int16)
+            case AudioSampleCodec.S8:
+                result[i] = np.frombuffer(data, dtype=np.int8).astype(np.int16) << 8
+            case codec:
+                raise ValueError(f'Decoding {codec} samples is not supported')
+
+    decoded = decode_vadpcm_batch([item for _, item in vadpcm])
+    for (i, _), pcm in zip(vadpcm, decoded):
+        result[i] = pcm
+
+    return result
+
+def decode_sample(sample: Sample, sample_bank: 'bytes | SampleBanks', book: VadpcmBook = None) -> 'np.ndarray':
+    """
+    Decodes an audio sample into signed 16-bit PCM.
+
+    Args:
+        sample (Sample): The sample to decode.
+        sample_bank (bytes | SampleBanks): The raw sample bank the sample's address points into, or the sample
+            banks of its instrument bank.
+        book (VadpcmBook): The codebook to decode VADPCM samples with. Defaults to the sample's own codebook.
+
+    Returns:
+        pcm (ndarray): Signed 16-bit PCM.
+    """
+    _require_numpy()
+    codec = sample.flags.codec
+    if book is not None and codec in _FRAME_SIZES:
+        return decode_vadpcm(_sample_data(sample, sample_bank), book, codec)
+    return decode_samples([sample], sample_bank)[0]
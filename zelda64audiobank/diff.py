@@ -0,0 +1,215 @@
+"""
+Diff
+=====
+
+Compares two instrument banks structure by structure, using `BankStruct.content_hash`.
+"""
+from dataclasses import dataclass, field
+from typing import Any
+
+from .audiobank import Audiobank, BankLayout
+from .bankstruct import BankStruct, plain_value, public_fields
+
+@dataclass
+class Change:
+    """
+    One difference between two banks.
+
+    Attributes:
+        path (str): Where the difference is, such as `instruments[3].envelope.points[1].amp_or_index`.
+        kind (str): `changed` for a field, or `added` or `removed` for a structure, list slot or list element.
+        type_name (str): Type of the structure holding the field, or of the structure added or removed.
+        old (Any): The old value of the field, or the removed structure.
+        new (Any): The new value of the field, or the added structure.
+        old_offset (int | None): Offset of the structure in the old bank, if it has one.
+        new_offset (int | None): Offset of the structure in the new bank, if it has one.
+    """
+    path: str
+    kind: str
+    type_name: str
+    old: Any = None
+    new: Any = None
+    old_offset: int | None = None
+    new_offset: int | None = None
+
+    def __str__(self):
+        offsets = f'{_hex(self.old_offset)} -> {_hex(self.new_offset)}'
+        if self.kind == 'changed':
+            return f'{self.path}: {self.old!r} -> {self.new!r}  ({self.type_name} at {offsets})'
+        return f'{self.path}: {self.kind} {self.type_name}  (at {offsets})'
+
+def _hex(offset: int | None) -> str:
+    return '-' if offset is None else hex(offset)
+
+@dataclass
+class BankDiff:
+    """
+    The differences between two banks, in the order of the structures they were found in.
+
+    Attributes:
+        changes (list[Change]): Every difference found.
+        compared (int): Number of structure pairs whose content differed and were compared field by field.
+    """
+    changes: list[Change] = field(default_factory=list)
+    compared: int = 0
+
+    def __bool__(self):
+        return bool(self.changes)
+
+    def __len__(self):
+        return len(self.changes)
+
+    def __iter__(self):
+        return iter(self.changes)
+
+    def __repr__(self):
+        lines = [f'BankDiff(changes={len(self.changes)}, compared={self.compared})']
+        lines.extend(f'  {change}' for change in self.changes)
+        return '\n'.join(lines)
+
+class _Side:
+    """ One of the banks being compared, with its digests and the offsets of its structures. """
+    def __init__(self, bank: Audiobank, memo: dict[int, bytes] | None):
+        self.bank = bank
+        self.memo = {} if memo is None else memo
+        self._layout: BankLayout | None = None
+
+    def digest(self, node: BankStruct) -> bytes:
+        return node.content_hash(self.memo)
+
+    def _planned(self) -> BankLayout:
+        # Banks parsed without recording origins only know where `to_bytes` would place their structures
+        if self._layout is None:
+            self._layout = self.bank.layout()
+        return self._layout
+
+    def offset(self, node: BankStruct) -> int | None:
+        origin = self.bank.origin_of(node)
+        if origin is not None:
+            return origin
+        return self._planned().offsets.get(id(node))
+
+    def effect_offset(self, effect: BankStruct, slot: int) -> int:
+        origin = self.bank.origin_of(effect)
+        if origin is not None:
+            return origin
+        # Effects are stored in the effect list itself
+        return self._planned().effect_list_offset + 8 * slot
+
+def _offset_in(parent_offset: int | None, delta: int) -> int | None:
+    return None if parent_offset is None else parent_offset + delta
+
+def diff_banks(
+    a: Audiobank | tuple[bytes, bytes],
+    b: Audiobank | tuple[bytes, bytes],
+    memo_a: dict[int, bytes] = None,
+    memo_b: dict[int, bytes] = None,
+) -> BankDiff:
+    """
+    Compares two instrument banks structure by structure, such as two versions of a bank from a music pack.
+
+    Instruments, drums and effects are compared list slot by list slot. Two structures whose `content_hash` is
+    the same are equal along with everything they point to, so they are skipped without looking inside; only the
+    structures on the way to a difference are compared field by field. A structure shared by several instruments
+    is compared once, and its changes are reported under the first path it is reached by.
+
+    Offsets are the ones structures were parsed from, for banks parsed with `record_origins` or `track_changes`
+    or given as binary data. For other banks they are the offsets `to_bytes` would write structures at, which
+    takes laying out the bank once.
+
+    Every structure of both banks is hashed once. When comparing many versions against the same bank, pass the same
+    `memo_a` to every call so that bank is only hashed once, and do not modify a bank while its memo is in use.
+
+    Args:
+        a (Audiobank | tuple[bytes, bytes]): The old bank, or its binary table entry and bank data.
+        b (Audiobank | tuple[bytes, bytes]): The new bank, or its binary table entry and bank data.
+        memo_a (dict[int, bytes]): Digests of the structures of `a`, by structure `id`, filled in as they are computed.
+        memo_b (dict[int, bytes]): Digests of the structures of `b`, by structure `id`, filled in as they are computed.
+
+    Returns:
+        diff (BankDiff): Every difference between the banks.
+    """
+    if not isinstance(a, Audiobank):
+        a = Audiobank.from_bytes(*a, record_origins=True)
+    if not isinstance(b, Audiobank):
+        b = Audiobank.from_bytes(*b, record_origins=True)
+    old, new = _Side(a, memo_a), _Side(b, memo_b)
+    diff = BankDiff()
+
+    for (name, old_value, _), (_, new_value, _) in zip(public_fields(a.metadata), public_fields(b.metadata)):
+        old_value, new_value = plain_value(old_value, []), plain_value(new_value, [])
+        if old_value != new_value:
+            diff.changes.append(Change(f'metadata.{name}', 'changed', type(a.metadata).__name__, old_value, new_value))
+
+    # (path, old structure, new structure, old offset, new offset), in the order the changes are reported in
+    pending = []
+    for list_name, old_slots, new_slots in zip(('instruments', 'drums', 'effects'), a.list_slots(), b.list_slots()):
+        for slot in range(max(len(old_slots), len(new_slots))):
+            x = old_slots[slot] if slot < len(old_slots) else None
+            y = new_slots[slot] if slot < len(new_slots) else None
+            if list_name == 'effects':
+                x_offset = None if x is None else old.effect_offset(x, slot)
+                y_offset = None if y is None else new.effect_offset(y, slot)
+                pending.append((f'effects[{slot}]', x, y, x_offset, y_offset))
+            else:
+                pending.append((f'{list_name}[{slot}]', x, y, None, None))
+    pending.reverse()
+
+    seen: set[tuple[int, int]] = set()
+    while pending:
+        path, x, y, x_offset, y_offset = pending.pop()
+        if x is None and y is None:
+            continue
+        if x is not None and y is not None and old.digest(x) == new.digest(y):
+            continue
+
+        # Offsets are only looked up for structures that differ
+        if x is not None and x_offset is None:
+            x_offset = old.offset(x)
+        if y is not None and y_offset is None:
+            y_offset = new.offset(y)
+        if x is None or y is None:
+            kind, node = ('added', y) if x is None else ('removed', x)
+            diff.changes.append(Change(path, kind, type(node).__name__, x, y, x_offset, y_offset))
+            continue
+
+        diff.compared += 1
+        type_name = type(x).__name__
+        embedded = {name: field_offset for name, _, _, field_offset in type(x)._embedded_}
+        children = []
+        for (name, x_value, is_pointer), (_, y_value, _) in zip(public_fields(x), public_fields(y)):
+            field_path = f'{path}.{name}'
+            if is_pointer:
+                if x_value is not None and y_value is not None:
+                    if (id(x_value), id(y_value)) in seen:
+                        continue
+                    seen.add((id(x_value), id(y_value)))
+                children.append((field_path, x_value, y_value, None, None))
+            elif isinstance(x_value, BankStruct):
+                delta = embedded.get(name, 0)
+                children.append((field_path, x_value, y_value, _offset_in(x_offset, delta), _offset_in(y_offset, delta)))
+            elif isinstance(x_value, list) and any(isinstance(item, BankStruct) for item in x_value + y_value):
+                # Lists of structures, such as the points of an envelope
+                for i in range(max(len(x_value), len(y_value))):
+                    x_item = x_value[i] if i < len(x_value) else None
+                    y_item = y_value[i] if i < len(y_value) else None
+                    item_size = type(x_item if x_item is not None else y_item).size()
+                    children.append((f'{field_path}[{i}]', x_item, y_item, _offset_in(x_offset, i * item_size), _offset_in(y_offset, i * item_size)))
+            else:
+                _diff_values(diff, field_path, type_name, plain_value(x_value, []), plain_value(y_value, []), x_offset, y_offset)
+        pending.extend(reversed(children))
+
+    return diff
+
+def _diff_values(diff: BankDiff, path: str, type_name: str, x: Any, y: Any, x_offset: int | None, y_offset: int | None):
+    """ Reports the differences between two plain field values, element by element for lists and bitfields. """
+    if x == y:
+        return
+    if isinstance(x, dict) and isinstance(y, dict):
+        for key in list(x) + [key for key in y if key not in x]:
+            _diff_values(diff, f'{path}.{key}', type_name, x.get(key), y.get(key), x_offset, y_offset)
+    elif isinstance(x, list) and isinstance(y, list):
+        for i in range(max(len(x), len(y))):
+            _diff_values(diff, f'{path}[{i}]', type_name, x[i] if i < len(x) else None, y[i] if i < len(y) else None, x_offset, y_offset)
+    else:
+        diff.changes.append(Change(path, 'changed', type_name, x, y, x_offset, y_offset))
@@ -0,0 +1,158 @@
+"""
+Duplicates
+=====
+
+Finds structures with the same content across many instrument banks, using `BankStruct.content_hash`.
+
+Only the bank data is compared. A `Sample` is identified by its header, including the address of its audio data
+in its sample bank, and not by the audio data itself: two samples with the same header in banks that use
+different sample banks are reported as duplicates even though their audio differs.
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from .audiobank import Audiobank
+from .structures.sample import Sample
+
+@dataclass
+class DuplicateGroup:
+    """
+    Structures of one type that share the same content.
+
+    Attributes:
+        digest (bytes): The content hash the structures share.
+        type_name (str): Name of the structure type.
+        size (int): Size of one structure in bytes, not counting the structures it points to.
+        data_size (int): Size of the audio data one sample header describes, or 0 for other structures. The audio
+            data itself is not compared.
+        locations (list[tuple[int, int]]): The (bank, offset) of every copy, `bank` being the position of the
+            bank in the corpus.
+    """
+    digest: bytes
+    type_name: str
+    size: int
+    data_size: int = 0
+    locations: list[tuple[int, int]] = field(default_factory=list)
+
+    @property
+    def count(self) -> int:
+        return len(self.locations)
+
+    @property
+    def saved_bytes(self) -> int:
+        """ Bytes of bank data saved by keeping a single copy of the structures. Audio data is not counted. """
+        return (self.count - 1) * self.size
+
+@dataclass
+class DuplicateReport:
+    """
+    The duplicate structures found in a corpus of instrument banks.
+
+    Attributes:
+        banks (int): Number of banks indexed.
+        structures (int): Number of structures indexed.
+        groups (list[DuplicateGroup]): Every group of two or more structures with the same content, largest
+            saving first.
+    """
+    banks: int = 0
+    structures: int = 0
+    groups: list[DuplicateGroup] = field(default_factory=list)
+
+    def saved_bytes(self, type_name: str = None) -> int:
+        """
+        Returns the bytes of bank data a shared pool would save, for one structure type or for all of them.
+
+        Sample groups only count their headers, since samples are compared by header rather than by audio data.
+        """
+        return sum(g.saved_bytes for g in self.groups if type_name is None or g.type_name == type_name)
+
+    def __repr__(self):
+        lines = [f'DuplicateReport(banks={self.banks}, structures={self.structures}, groups={len(self.groups)})']
+        lines.append(f'  {"type":<16} {"groups":>8} {"copies":>8} {"saved bytes":>12}')
+        by_type: dict[str, list[DuplicateGroup]] = {}
+        for group in self.groups:
+            by_type.setdefault(group.type_name, []).append(group)
+        for type_name, groups in sorted(by_type.items()):
+            copies = sum(g.count for g in groups)
+            lines.append(f'  {type_name:<16} {len(groups):>8} {copies:>8} {self.saved_bytes(type_name):>12}')
+        return '\n'.join(lines)
+
+def index_bank(table_entry: bytes, bank_data: bytes) -> list[tuple[bytes, str, int, int, int]]:
+    """
+    Hashes every structure stored in an instrument bank.
+
+    Instruments, drums and everything they or the effects point to are indexed once per offset. Effects are
+    stored in the effect list rather than pointed to, so they are not indexed themselves.
+
+    Args:
+        table_entry (bytes): Binary table entry data. Can be either truncated (0x08) or full (0x10) bytes long.
+        bank_data (bytes): Binary instrument bank data.
+
+    Returns:
+        index (list[tuple[bytes, str, int, int, int]]): The digest, type name, size, audio data size and offset
+            of each structure.
+    """
+    bank = Audiobank.from_bytes(table_entry, bank_data, record_origins=True)
+
+    pending = deque(bank.instruments + bank.drums)
+    pending.extend(target for effect in bank.effects for target in effect.pointer_targets())
+    seen: set[int] = set()
+    memo: dict[int, bytes] = {}
+    index = []
+
+    while pending:
+        node = pending.popleft()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        data_size = node.flags.size if isinstance(node, Sample) else 0
+        index.append((node.content_hash(memo), type(node).__name__, node.packed_size(), data_size, bank.origin_of(node)))
+        pending.extend(node.pointer_targets())
+
+    return index
+
+def _index_worker(pair: tuple[bytes, bytes]) -> list[tuple[bytes, str, int, int, int]]:
+    return index_bank(*pair)
+
+def find_duplicates(banks: Iterable[tuple[bytes, bytes]], jobs: int | None = 1) -> DuplicateReport:
+    """
+    Finds structures with the same content across a corpus of instrument banks.
+
+    With more than one job, banks are parsed and hashed in a process pool, and only their digests are sent back.
+
+    Args:
+        banks (Iterable[tuple[bytes, bytes]]): The (table entry, bank data) pair of each bank.
+        jobs (int | None): Number of worker processes, or `None` for one per CPU.
+
+    Returns:
+        report (DuplicateReport): Every group of structures that share their content.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    if jobs <= 1:
+        indexes = map(_index_worker, banks)
+        return _report(indexes)
+
+    banks = [(bytes(table_entry), bytes(bank_data)) for table_entry, bank_data in banks]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return _report(pool.map(_index_worker, banks, chunksize=max(1, len(banks) // (jobs * 4))))
+
+def _report(indexes: Iterable[list[tuple[bytes, str, int, int, int]]]) -> DuplicateReport:
+    report = DuplicateReport()
+    groups: dict[bytes, DuplicateGroup] = {}
+
+    for bank_index, index in enumerate(indexes):
+        report.banks += 1
+        report.structures += len(index)
+        for digest, type_name, size, data_size, offset in index:
+            group = groups.get(digest)
+            if group is None:
+                group = groups[digest] = DuplicateGroup(digest, type_name, size, data_size)
+            group.locations.append((bank_index, offset))
+
+    report.groups = sorted((g for g in groups.values() if g.count > 1), key=lambda g: -g.saved_bytes)
+    return report
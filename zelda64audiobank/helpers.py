@@ -2,6 +2,25 @@
 Helpers
 =====
 """
+import os
+import mmap
+from typing import Any
+from contextlib import contextmanager
+
+_enum_tables: dict[type, dict[int, Any]] = {}
+
+def enum_table(enum_cls) -> dict[int, Any]:
+    """
+    Returns a lookup table mapping every value of `enum_cls` to its member, built once per enum.
+
+    Args:
+        enum_cls (Class): The enum class.
+    """
+    table = _enum_tables.get(enum_cls)
+    if table is None:
+        table = _enum_tables[enum_cls] = {member.value: member for member in enum_cls}
+    return table
+
 def safe_enum(enum_cls, value: int):
     """
     Safely converts `value` to `enum_cls`
@@ -11,15 +30,51 @@ def safe_enum(enum_cls, value: int):
         value (int): The value to convert.
     """
     try:
-        return enum_cls(value)
-    except ValueError as e:
-        raise ValueError(f'Invalid value {value} for enum {enum_cls.__name__}')
+        return enum_table(enum_cls)[value]
+    except (KeyError, TypeError):
+        raise ValueError(f'Invalid value {value} for enum {enum_cls.__name__}') from None
 
 def make_property(raw_attr_name, transform):
+    raw_attr = f'_{raw_attr_name}_raw'
+
     def getter(self):
-        return transform(getattr(self, f"_{raw_attr_name}_raw"))
+        return transform(getattr(self, raw_attr))
 
     def setter(self, value):
-        setattr(self, f'_{raw_attr_name}_raw', value)
+        setattr(self, raw_attr, value)
+
+    return property(getter, setter)
+
+def make_enum_property(raw_attr_name, enum_cls):
+    table = enum_table(enum_cls)
+    raw_attr = f'_{raw_attr_name}_raw'
 
-    return property(getter, setter)
\ No newline at end of file
+    def getter(self):
+        value = getattr(self, raw_attr)
+        try:
+            return table[value]
+        except (KeyError, TypeError):
+            raise ValueError(f'Invalid value {value} for enum {enum_cls.__name__}') from None
+
+    def setter(self, value):
+        setattr(self, raw_attr, value)
+
+    return property(getter, setter)
+
+@contextmanager
+def mapped_file(path: str | os.PathLike):
+    """
+    Maps a file into memory read-only for the duration of the `with` block.
+
+    Args:
+        path (str | PathLike): The file to map.
+
+    Yields:
+        buffer (mmap | bytes): The mapped file, or empty bytes for an empty file (which cannot be mapped).
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
@@ -0,0 +1,136 @@
+"""
+Key Tables
+=====
+
+Tables mapping every MIDI note of every instrument and drum of a bank to the `TunedSample` it plays and the rate it
+plays it at, so a note is looked up with two array reads.
+
+Requires NumPy.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .structures.drum import Drum
+from .structures.instrument import Instrument
+from .structures.tuned_sample import TunedSample
+
+NUM_KEYS = 128
+
+# MIDI note of game note 0 (A0); key regions and drum indices are given in game notes
+GAME_NOTE_OFFSET = 21
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('Key tables require NumPy')
+
+class KeyTables:
+    """
+    Note lookup tables of an instrument bank, indexed by list slot and MIDI note.
+
+    Sample tables hold indices into `tuned_samples`, or -1 where nothing sounds: an empty slot, or a key region
+    without a sample. Ratio tables hold the playback rate relative to the sample's own rate, which is the sample's
+    `tuning` times the pitch of the note relative to middle C for instruments, and the `tuning` alone for drums, and
+    0 where nothing sounds. Like the game, drums are played by the note that gives their index in game notes, so
+    MIDI note 21 plays drum 0.
+
+    Attributes:
+        instruments (list[Instrument | None]): The instrument of each list slot.
+        drums (list[Drum | None]): The drum of each list slot.
+        tuned_samples (list[TunedSample]): Every distinct `TunedSample` the tables refer to.
+        instrument_sample (ndarray): int16 array of shape (instrument slots, 128).
+        instrument_ratio (ndarray): float32 array of shape (instrument slots, 128).
+        drum_index (ndarray): int16 array of 128 drum slots, -1 where the note plays no drum.
+        drum_sample (ndarray): int16 array of 128 entries.
+        drum_ratio (ndarray): float32 array of 128 entries.
+        instrument (method): Returns what an instrument slot plays for a note.
+        drum (method): Returns what a note plays on the drum channel.
+    """
+    def __init__(self, instruments: list[Instrument | None], drums: list[Drum | None]):
+        _require_numpy()
+        self.instruments: list[Instrument | None] = instruments
+        self.drums: list[Drum | None] = drums
+        self.tuned_samples: list[TunedSample] = []
+        self._sample_index: dict[int, int] = {}
+        self._instrument_slots: dict[int, int] = {id(instrument): slot for slot, instrument in enumerate(instruments) if instrument is not None}
+
+        # Every instrument's low, primary and high sample and tuning, one row per slot
+        regions = np.zeros((len(instruments), 2), dtype=np.int16)
+        samples = np.full((len(instruments), 3), -1, dtype=np.int16)
+        tunings = np.zeros((len(instruments), 3), dtype=np.float32)
+        for slot, instrument in enumerate(instruments):
+            if instrument is None:
+                continue
+            regions[slot] = instrument.low_key_region, instrument.high_key_region
+            for region, tuned_sample in enumerate((
+                instrument.low_key_region_sample, instrument.prim_key_region_sample, instrument.high_key_region_sample
+            )):
+                samples[slot, region], tunings[slot, region] = self._add(tuned_sample)
+
+        # Audio_GetInstrumentTunedSample: below the low region, up to and including the high region, and above it
+        semitones = np.arange(NUM_KEYS, dtype=np.int16) - GAME_NOTE_OFFSET
+        region = np.where(semitones < regions[:, :1], 0, np.where(semitones <= regions[:, 1:], 1, 2))
+        rows = np.arange(len(instruments))[:, None]
+        pitch = (2.0 ** ((np.arange(NUM_KEYS) - 60) / 12)).astype(np.float32)
+
+        self.instrument_sample: 'np.ndarray' = samples[rows, region]
+        self.instrument_ratio: 'np.ndarray' = np.where(self.instrument_sample >= 0, tunings[rows, region] * pitch, np.float32(0))
+
+        self.drum_index: 'np.ndarray' = np.full(NUM_KEYS, -1, dtype=np.int16)
+        self.drum_sample: 'np.ndarray' = np.full(NUM_KEYS, -1, dtype=np.int16)
+        self.drum_ratio: 'np.ndarray' = np.zeros(NUM_KEYS, dtype=np.float32)
+        for slot, drum in enumerate(drums[:NUM_KEYS - GAME_NOTE_OFFSET]):
+            if drum is None:
+                continue
+            note = slot + GAME_NOTE_OFFSET
+            self.drum_index[note] = slot
+            self.drum_sample[note], self.drum_ratio[note] = self._add(drum.tuned_sample)
+
+        for table in (self.instrument_sample, self.instrument_ratio, self.drum_index, self.drum_sample, self.drum_ratio):
+            table.setflags(write=False)
+
+    def _add(self, tuned_sample: TunedSample | None) -> tuple[int, float]:
+        # Like the game, a key region without a sample does not sound
+        if tuned_sample is None or tuned_sample.sample is None:
+            return -1, 0.0
+        index = self._sample_index.get(id(tuned_sample))
+        if index is None:
+            index = self._sample_index[id(tuned_sample)] = len(self.tuned_samples)
+            self.tuned_samples.append(tuned_sample)
+        return index, tuned_sample.tuning
+
+    def slot_of(self, instrument: Instrument) -> int:
+        """ Returns the list slot of an instrument of the bank. """
+        slot = self._instrument_slots.get(id(instrument))
+        if slot is None:
+            raise ValueError('Instrument is not part of the bank')
+        return slot
+
+    def instrument(self, slot: int, note: int) -> tuple[TunedSample | None, float]:
+        """
+        Returns the `TunedSample` an instrument slot plays a MIDI note with and its playback rate ratio, or
+        `(None, 0.0)` if the note does not sound.
+        """
+        index = self.instrument_sample[slot, note]
+        if index < 0:
+            return None, 0.0
+        return self.tuned_samples[index], float(self.instrument_ratio[slot, note])
+
+    def drum(self, note: int) -> tuple[TunedSample | None, float]:
+        """
+        Returns the `TunedSample` a MIDI note plays on the drum channel and its playback rate ratio, or
+        `(None, 0.0)` if the note does not sound.
+        """
+        index = self.drum_sample[note]
+        if index < 0:
+            return None, 0.0
+        return self.tuned_samples[index], float(self.drum_ratio[note])
+
+    @property
+    def nbytes(self) -> int:
+        tables = (self.instrument_sample, self.instrument_ratio, self.drum_index, self.drum_sample, self.drum_ratio)
+        return sum(table.nbytes for table in tables)
+
+    def __repr__(self):
+        return f'KeyTables(instruments={len(self.instrument_sample)}, tuned_samples={len(self.tuned_samples)}, size={self.nbytes})'
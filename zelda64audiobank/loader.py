@@ -0,0 +1,142 @@
+"""
+Loader
+=====
+
+Loads many instrument banks from (table entry, bank) file pairs with asyncio, overlapping file reads with parsing.
+"""
+import asyncio
+import os
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import AsyncIterable, AsyncIterator, Iterable
+
+from .audiobank import Audiobank
+
+@dataclass
+class LoadResult:
+    """
+    The outcome of loading one bank.
+
+    Attributes:
+        index (int): Position of the file pair in the input.
+        entry_path (str | PathLike): Path to the binary table entry.
+        bank_path (str | PathLike): Path to the binary instrument bank.
+        bank (Audiobank | None): The parsed bank, or `None` if loading failed.
+        error (BaseException | None): The exception raised while reading or parsing the files, if any.
+    """
+    index: int
+    entry_path: str | os.PathLike
+    bank_path: str | os.PathLike
+    bank: Audiobank | None = None
+    error: BaseException | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+def _read_file(path: str | os.PathLike) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+def _parse(table_entry: bytes, bank_data: bytes) -> Audiobank:
+    return Audiobank.from_bytes(table_entry, bank_data)
+
+async def _load(index: int, entry_path, bank_path, executor: Executor | None) -> LoadResult:
+    result = LoadResult(index, entry_path, bank_path)
+    try:
+        table_entry, bank_data = await asyncio.gather(
+            asyncio.to_thread(_read_file, entry_path),
+            asyncio.to_thread(_read_file, bank_path),
+        )
+        result.bank = await asyncio.get_running_loop().run_in_executor(executor, _parse, table_entry, bank_data)
+    except Exception as e:
+        result.error = e
+    return result
+
+async def _pairs(pairs: Iterable | AsyncIterable) -> AsyncIterator:
+    if isinstance(pairs, AsyncIterable):
+        async for pair in pairs:
+            yield pair
+    else:
+        for pair in pairs:
+            yield pair
+
+async def load_banks(
+    pairs: Iterable[tuple[str | os.PathLike, str | os.PathLike]] | AsyncIterable[tuple[str | os.PathLike, str | os.PathLike]],
+    concurrency: int = 16,
+    executor: Executor | None = None,
+    ordered: bool = False,
+) -> AsyncIterator[LoadResult]:
+    """
+    Loads instrument banks from (table entry, bank) file pairs.
+
+    Example::
+
+        async for result in load_banks(pairs, concurrency=32):
+            if result.ok:
+                process(result.bank)
+            else:
+                log(result.bank_path, result.error)
+
+    Files are read in worker threads, and up to `concurrency` banks are read and parsed at the same time. Banks are
+    parsed in `executor`, which defaults to the event loop's default thread pool; pass a `ProcessPoolExecutor` to
+    parse on several CPUs. At most `concurrency` results are held at once, including finished ones the consumer has
+    not taken yet, and the next pair is only taken from `pairs` when one of them is, so a slow consumer slows the
+    loader down instead of letting results pile up in memory.
+
+    A pair that cannot be read or parsed produces a result holding the error, and the other pairs are still loaded.
+    Leaving the `async for` loop early cancels the loads in progress.
+
+    Args:
+        pairs (Iterable | AsyncIterable): Paths to the binary table entry and the binary instrument bank of each bank.
+        concurrency (int): Maximum number of banks loaded at the same time.
+        executor (Executor | None): Executor used to parse the banks, or `None` for the event loop's default executor.
+        ordered (bool): Whether to yield results in the order of `pairs` instead of the order they finish in.
+
+    Yields:
+        result (LoadResult): The outcome of loading each pair.
+    """
+    if concurrency < 1:
+        raise ValueError(f'concurrency must be at least 1, but got {concurrency}')
+
+    source = _pairs(pairs)
+    running: set[asyncio.Task] = set()
+    finished: dict[int, LoadResult] = {}
+    next_index = 0      # Index of the next pair taken from `pairs`
+    next_yield = 0      # Index of the next result to yield when `ordered` is set
+    exhausted = False
+
+    try:
+        while True:
+            # Start new loads while there is room, counting results that are finished but not yielded yet
+            while not exhausted and len(running) + len(finished) < concurrency:
+                try:
+                    entry_path, bank_path = await anext(source)
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                running.add(asyncio.create_task(_load(next_index, entry_path, bank_path, executor)))
+                next_index += 1
+
+            if not running and not finished:
+                return
+
+            if running:
+                done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    finished[result.index] = result
+
+            if ordered:
+                while next_yield in finished:
+                    yield finished.pop(next_yield)
+                    next_yield += 1
+            else:
+                for index in sorted(finished):
+                    yield finished.pop(index)
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+        await source.aclose()
@@ -0,0 +1,331 @@
+"""
+Renderer
+=====
+
+Renders notes of instruments and drums offline into signed 16-bit PCM.
+
+Each note plays the `TunedSample` its instrument uses for the note's key region, looked up in the bank's key
+tables, resampled by linear interpolation at `tuning * 2 ** ((note - 60) / 12)` times its rate (drums use their
+tuning alone), looped as its `VadpcmLoop` says, and shaped by the instrument's envelope and a velocity gain of
+`(velocity / 127) ** 2`. Samples are taken to be recorded at 32 kHz, like the game assumes.
+
+Every sample is decoded once per call. The output frames of all notes are then laid end to end, so resampling,
+looping, the envelope and mixing are each a single NumPy operation over many notes at once rather than a loop over
+notes. Panning, reverb and the game's channel and sequence effects are not applied, and the output is mono.
+
+Requires NumPy.
+"""
+import math
+from dataclasses import dataclass
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .adsr import DEFAULT_UPDATE_RATE, decay_step, envelope_curve
+from .audiobank import Audiobank
+from .constants import AdsrOpcode
+from .decoder import decode_samples
+from .samplebank import SampleBankTable, SampleBanks
+from .structures.drum import Drum
+from .structures.instrument import Instrument
+from .structures.sample import Sample
+from .structures.vadpcm import VadpcmLoopCount
+
+SAMPLE_RATE = 32000
+""" Rate of the samples at a pitch ratio of 1. """
+
+# Stands in for a missing envelope: full amplitude after one update, held until release
+_FLAT_ENVELOPE = ((1, 32767), (AdsrOpcode.HANG, 0))
+
+# Output frames rendered at once, which bounds the memory used by the intermediate arrays
+_CHUNK_FRAMES = 1 << 21
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('Rendering notes requires NumPy')
+
+@dataclass
+class NoteEvent:
+    """
+    A note to render.
+
+    Attributes:
+        program (Instrument | Drum | int): The instrument or drum to play, or the list slot of an instrument of the bank.
+        note (int): MIDI note number, 60 being middle C. Drums play at their own pitch whatever the note.
+        velocity (int): MIDI velocity, from 0 to 127.
+        duration (float): Time the note is held for before it is released, in seconds.
+        start (float): Time the note starts at in the mix, in seconds. Ignored by `render_clips`.
+    """
+    program: Instrument | Drum | int
+    note: int = 60
+    velocity: int = 127
+    duration: float = 1.0
+    start: float = 0.0
+
+def audition_sheet(bank: Audiobank, notes: tuple[int, ...] = (48, 60, 72), velocity: int = 100, duration: float = 0.5, gap: float = 0.25) -> list[NoteEvent]:
+    """
+    Returns events playing every instrument of a bank at each of `notes`, then every drum once, one after another.
+
+    Each note is given `gap` seconds after its release before the next one starts.
+    """
+    events = []
+    start = 0.0
+    programs = [(instrument, notes) for instrument in bank.instruments if instrument is not None]
+    programs += [(drum, (60,)) for drum in bank.drums if drum is not None]
+    for program, program_notes in programs:
+        for note in program_notes:
+            events.append(NoteEvent(program, note, velocity, duration, start))
+            start += duration + gap
+    return events
+
+class _Voice:
+    __slots__ = ('event', 'sample', 'step', 'gain', 'envelope', 'frames', 'loop')
+
+    def __init__(self, event: NoteEvent, sample: Sample, step: float, gain: float, envelope: 'np.ndarray', frames: int):
+        self.event = event
+        self.sample = sample
+        self.step = step
+        self.gain = gain
+        self.envelope = envelope
+        self.frames = frames
+        self.loop = (0, 0, 0)
+
+def _loop_bounds(sample: Sample, num_samples: int) -> tuple[int, int, float]:
+    """ Returns the loop start, loop end and loop count of a sample, a count of 0 meaning it does not loop. """
+    loop = sample.loop
+    if loop is None:
+        return 0, num_samples, 0
+    header = loop.header
+    if header.loop_count == 0 or not 0 <= header.loop_start < header.loop_end <= num_samples:
+        return 0, num_samples, 0
+    count = math.inf if header.loop_count == VadpcmLoopCount.INDEFINITE_LOOP else header.loop_count
+    return header.loop_start, header.loop_end, count
+
+def _prepare(bank: Audiobank, events: list, output_rate: float, update_rate: float, max_release: float) -> list[_Voice | None]:
+    tables = bank.key_tables()
+    voices = []
+    for event in events:
+        if not isinstance(event, NoteEvent):
+            event = NoteEvent(*event)
+
+        program = event.program
+        if isinstance(program, Drum):
+            tuned_sample = program.tuned_sample
+            ratio = tuned_sample.tuning
+        elif isinstance(program, (Instrument, int)):
+            slot = program if isinstance(program, int) else tables.slot_of(program)
+            tuned_sample, ratio = tables.instrument(slot, event.note)
+            program = tables.instruments[slot]
+        else:
+            raise ValueError(f'Cannot play a {type(program).__name__}')
+
+        # Like the game, an empty slot or a key region without a sample does not sound
+        if tuned_sample is None or tuned_sample.sample is None or event.velocity <= 0 or not ratio > 0:
+            voices.append(None)
+            continue
+
+        curve = envelope_curve(program.envelope if program.envelope is not None else _FLAT_ENVELOPE, update_rate)
+        release_at = max(round(event.duration * update_rate), 0)
+        held = curve.render(release_at)
+        level = float(held[-1]) if release_at else 0.0
+        if curve.end == AdsrOpcode.DISABLE and curve.length < release_at:
+            num_updates = curve.length
+        else:
+            step = decay_step(program.decay_index, update_rate)
+            tail = math.ceil(level / step) + 1 if step > 0 else math.ceil(max_release * update_rate)
+            num_updates = release_at + min(tail, math.ceil(max_release * update_rate))
+
+        frames = math.floor(num_updates * output_rate / update_rate)
+        envelope = curve.render(num_updates, release_at, program.decay_index)
+        voices.append(_Voice(event, tuned_sample.sample, ratio * SAMPLE_RATE / output_rate, (event.velocity / 127) ** 2, envelope, frames))
+    return voices
+
+def _fit(voices: list[_Voice | None], pcm: dict[int, 'np.ndarray']) -> list[_Voice]:
+    """ Cuts notes short when their sample ends, and returns the notes that sound. """
+    sounding = []
+    for voice in voices:
+        if voice is None:
+            continue
+        num_samples = len(pcm[id(voice.sample)])
+        voice.loop = start, end, loops = _loop_bounds(voice.sample, num_samples)
+        if loops != math.inf:
+            played = num_samples + loops * (end - start)
+            voice.frames = min(voice.frames, max(math.ceil((played - 1) / voice.step), 0))
+        if voice.frames > 0:
+            sounding.append(voice)
+    return sounding
+
+def _render_voices(voices: list[_Voice], pcm: dict[int, 'np.ndarray'], output_rate: float, update_rate: float) -> 'np.ndarray':
+    """ Returns the output frames of every voice, laid end to end. """
+    # One pool of source audio and one pool of envelopes, indexed by per-voice offsets
+    sources = list({id(voice.sample): pcm[id(voice.sample)] for voice in voices}.items())
+    source_base = {}
+    offset = 0
+    for key, data in sources:
+        source_base[key] = offset
+        offset += len(data)
+    source_pool = np.concatenate([data for _, data in sources]).astype(np.float32) / 32768.0
+    envelope_pool = np.concatenate([voice.envelope for voice in voices])
+
+    count = len(voices)
+    base = np.empty(count, dtype=np.int64)
+    length = np.empty(count, dtype=np.int64)
+    loop_start = np.empty(count, dtype=np.float64)
+    loop_end = np.empty(count, dtype=np.float64)
+    loop_count = np.empty(count, dtype=np.float64)
+    step = np.empty(count, dtype=np.float64)
+    gain = np.empty(count, dtype=np.float64)
+    envelope_base = np.empty(count, dtype=np.int64)
+    frames = np.empty(count, dtype=np.int64)
+
+    envelope_offset = 0
+    envelope_length = np.empty(count, dtype=np.int64)
+    for i, voice in enumerate(voices):
+        base[i] = source_base[id(voice.sample)]
+        length[i] = len(pcm[id(voice.sample)])
+        loop_start[i], loop_end[i], loop_count[i] = voice.loop
+        step[i] = voice.step
+        gain[i] = voice.gain
+        envelope_base[i] = envelope_offset
+        envelope_length[i] = len(voice.envelope)
+        envelope_offset += len(voice.envelope)
+        frames[i] = voice.frames
+
+    total = int(frames.sum())
+    which = np.repeat(np.arange(count), frames)
+    k = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(frames) - frames, frames)
+
+    # Source position of each frame, folded back into the loop while it is looping
+    position = k * step[which]
+    start, end, loops = loop_start[which], loop_end[which], loop_count[which]
+    span = np.maximum(end - start, 1)
+    looped_until = end + loops * span
+    in_loop = (loops > 0) & (position >= end)
+    position = np.where(
+        in_loop & (position < looped_until), start + np.fmod(position - start, span),
+        np.where(in_loop, position - loops * span, position)
+    )
+
+    index = position.astype(np.int64)
+    frac = (position - index).astype(np.float32)
+    nxt = index + 1
+    # The frame after the end of the loop is its start
+    nxt = np.where((loops > 0) & (nxt == end) & (position < looped_until), start.astype(np.int64), nxt)
+    last = length[which] - 1
+    index = np.minimum(index, last)
+    nxt = np.minimum(nxt, last)
+    audio = source_pool[base[which] + index] * (1 - frac) + source_pool[base[which] + nxt] * frac
+
+    update = np.minimum((k * update_rate / output_rate).astype(np.int64), envelope_length[which] - 1)
+    amplitude = envelope_pool[envelope_base[which] + update]
+    return audio * amplitude * gain[which].astype(np.float32)
+
+def _chunks(voices: list[_Voice]):
+    chunk, size = [], 0
+    for voice in voices:
+        chunk.append(voice)
+        size += voice.frames
+        if size >= _CHUNK_FRAMES:
+            yield chunk
+            chunk, size = [], 0
+    if chunk:
+        yield chunk
+
+def _decode(voices: list[_Voice | None], sample_data) -> dict[int, 'np.ndarray']:
+    samples = list({id(voice.sample): voice.sample for voice in voices if voice is not None}.values())
+    return {id(sample): pcm for sample, pcm in zip(samples, decode_samples(samples, sample_data))}
+
+def _sample_data(bank: Audiobank, sample_data: SampleBankTable | SampleBanks | bytes) -> SampleBanks | bytes:
+    if isinstance(sample_data, SampleBankTable):
+        return sample_data.select(bank.metadata)
+    return sample_data
+
+def _to_pcm16(mix: 'np.ndarray') -> 'np.ndarray':
+    return np.clip(np.rint(mix * 32767.0), -0x8000, 0x7FFF).astype(np.int16)
+
+def render_notes(
+    bank: Audiobank,
+    sample_data: SampleBankTable | SampleBanks | bytes,
+    events: list[NoteEvent | tuple],
+    output_rate: int = SAMPLE_RATE,
+    update_rate: float = DEFAULT_UPDATE_RATE,
+    max_release: float = 4.0,
+) -> 'np.ndarray':
+    """
+    Renders notes of a bank's instruments and drums, mixed together at their start times.
+
+    Example::
+
+        with SampleBankTable.from_file(rom_path, sample_table_offset, audiotable_offset=audiotable_offset) as table:
+            pcm = render_notes(bank, table, audition_sheet(bank))
+
+    Args:
+        bank (Audiobank): The bank the instruments and drums belong to.
+        sample_data (SampleBankTable | SampleBanks | bytes): The sample banks, or the raw sample bank the samples'
+            addresses point into.
+        events (list[NoteEvent | tuple]): The notes to render, as events or (program, note, velocity, duration,
+            start) tuples.
+        output_rate (int): Rate of the output, in frames per second.
+        update_rate (float): Envelope updates per second.
+        max_release (float): Longest time a released note keeps sounding, in seconds.
+
+    Returns:
+        pcm (ndarray): Mono signed 16-bit PCM, long enough for the last note to end.
+    """
+    _require_numpy()
+    voices = _prepare(bank, events, output_rate, update_rate, max_release)
+    pcm = _decode(voices, _sample_data(bank, sample_data))
+    sounding = _fit(voices, pcm)
+
+    starts = [round(voice.event.start * output_rate) for voice in sounding]
+    mix = np.zeros(max((start + voice.frames for start, voice in zip(starts, sounding)), default=0), dtype=np.float64)
+    position = 0
+    for chunk in _chunks(sounding):
+        chunk_starts = np.array(starts[position:position + len(chunk)], dtype=np.int64)
+        position += len(chunk)
+        frames = np.array([voice.frames for voice in chunk], dtype=np.int64)
+        out = np.repeat(chunk_starts - (np.cumsum(frames) - frames), frames) + np.arange(int(frames.sum()))
+        mix += np.bincount(out, weights=_render_voices(chunk, pcm, output_rate, update_rate), minlength=len(mix))
+    return _to_pcm16(mix)
+
+def render_clips(
+    bank: Audiobank,
+    sample_data: SampleBankTable | SampleBanks | bytes,
+    events: list[NoteEvent | tuple],
+    output_rate: int = SAMPLE_RATE,
+    update_rate: float = DEFAULT_UPDATE_RATE,
+    max_release: float = 4.0,
+) -> list['np.ndarray']:
+    """
+    Renders notes of a bank's instruments and drums into one clip per note, such as previews of each instrument.
+
+    Notes are rendered together as with `render_notes`, but not mixed. Notes that do not sound, such as notes in a
+    key region without a sample, give an empty clip.
+
+    Args:
+        bank (Audiobank): The bank the instruments and drums belong to.
+        sample_data (SampleBankTable | SampleBanks | bytes): The sample banks, or the raw sample bank the samples'
+            addresses point into.
+        events (list[NoteEvent | tuple]): The notes to render, as events or (program, note, velocity, duration)
+            tuples.
+        output_rate (int): Rate of the output, in frames per second.
+        update_rate (float): Envelope updates per second.
+        max_release (float): Longest time a released note keeps sounding, in seconds.
+
+    Returns:
+        pcm (list[ndarray]): Mono signed 16-bit PCM for each note.
+    """
+    _require_numpy()
+    voices = _prepare(bank, events, output_rate, update_rate, max_release)
+    pcm = _decode(voices, _sample_data(bank, sample_data))
+    sounding = _fit(voices, pcm)
+
+    clips = {}
+    for chunk in _chunks(sounding):
+        rendered = _to_pcm16(_render_voices(chunk, pcm, output_rate, update_rate))
+        bounds = np.cumsum([voice.frames for voice in chunk])[:-1]
+        for voice, clip in zip(chunk, np.split(rendered, bounds)):
+            clips[id(voice)] = clip
+    return [clips.get(id(voice), np.zeros(0, dtype=np.int16)) for voice in voices]
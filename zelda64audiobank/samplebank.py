@@ -0,0 +1,230 @@
+"""
+SampleBank
+=====
+
+Locates the audio data of samples in the sample banks of the Audiotable segment, without copying it.
+"""
+import os
+import mmap
+
+from .structures.metadata import AudioTableHeader, AudioTableEntry, AudiobankEntry
+from .structures.sample import Sample
+from .table import AudiobankTable
+
+# Sample bank id that stands for "no second sample bank" in an `AudiobankEntry`
+NO_SAMPLE_BANK = 0xFF
+
+class SampleBank:
+    """
+    Represents one sample bank of the Audiotable segment.
+
+    Attributes:
+        id (int): Index of the sample bank's entry in the sample bank index. Aliases keep the id of the entry they refer to.
+        entry (AudioTableEntry): The entry giving the location and size of the sample bank.
+        data (memoryview): The sample bank's bytes, a view into the Audiotable segment.
+    """
+    def __init__(self, id: int, entry: AudioTableEntry, data: memoryview):
+        self.id: int = id
+        self.entry: AudioTableEntry = entry
+        self.data: memoryview = data
+
+    def __len__(self):
+        return self.data.nbytes
+
+    def slice(self, addr: int, size: int) -> memoryview:
+        """
+        Returns `size` bytes at `addr`, relative to the start of the sample bank, without copying them.
+
+        Raises:
+            ValueError: If the range does not lie within the sample bank.
+        """
+        if addr < 0 or addr + size > self.data.nbytes:
+            raise ValueError(f'Sample at {hex(addr)} with size {hex(size)} extends past the end of sample bank {self.id}')
+        return self.data[addr:addr + size]
+
+    def __repr__(self):
+        return f'SampleBank(id={self.id}, rom_addr={hex(self.entry.rom_addr)}, size={hex(len(self))})'
+
+class SampleBanks:
+    """
+    The sample banks an instrument bank draws its samples from, as selected by its `AudiobankEntry`.
+
+    Samples stored in medium 0 are read from the first sample bank, and samples stored in medium 1 from the second
+    one. When a bank has no second sample bank (id 0xFF), the game relocates medium 1 samples against a base address
+    of 0. This library reads them from the first sample bank instead.
+
+    Samples that are already relocated, or stored in a medium above 1, are assumed to hold an address relative to
+    the start of the Audiotable segment. The game does not relocate them, so their address is really whatever was
+    stored in the bank, and this assumption only holds for banks built with it in mind.
+
+    Attributes:
+        primary (SampleBank): The sample bank selected by `sample_bank_id_1`.
+        secondary (SampleBank | None): The sample bank selected by `sample_bank_id_2`, if any.
+        audiotable (memoryview): The whole Audiotable segment.
+    """
+    def __init__(self, primary: SampleBank, secondary: SampleBank | None, audiotable: memoryview):
+        self.primary: SampleBank = primary
+        self.secondary: SampleBank | None = secondary
+        self.audiotable: memoryview = audiotable
+
+    def sample_data(self, sample: Sample) -> memoryview:
+        """
+        Returns the audio data of a sample, without copying it.
+
+        Args:
+            sample (Sample): The sample whose data to locate.
+
+        Returns:
+            data (memoryview): The `sample.flags.size` bytes of audio data.
+        """
+        flags = sample.flags
+        addr = sample.sample_addr
+        size = flags.size
+
+        if flags.is_relocated or flags._medium > 1:
+            if addr + size > self.audiotable.nbytes:
+                raise ValueError(f'Sample at {hex(addr)} with size {hex(size)} extends past the end of the Audiotable segment')
+            return self.audiotable[addr:addr + size]
+
+        if flags._medium == 1 and self.secondary is not None:
+            return self.secondary.slice(addr, size)
+        return self.primary.slice(addr, size)
+
+class SampleBankTable:
+    """
+    Represents the sample bank index and the Audiotable segment it points into.
+
+    The index is found in the code segment of a decompressed OoT or MM ROM, right after the audiobank index. Each
+    `AudioTableEntry` gives the address of its sample bank relative to the start of the Audiotable segment and its
+    size in bytes. An entry with a size of 0 reuses another sample bank, and its address holds the index of the
+    entry it refers to.
+
+    Sample banks and sample data are views into the Audiotable data, so nothing is copied. A table created by
+    `from_file` keeps the Audiotable file mapped until `close` is called, or until the end of a `with` block using
+    the table; views handed out by it must be released before that.
+
+    Attributes:
+        from_bytes (method): Reads the sample bank index over binary Audiotable data.
+        from_file (method): Reads the sample bank index over a memory-mapped Audiotable file.
+        select (method): Returns the sample banks an instrument bank draws its samples from.
+    """
+    def __init__(self):
+        self.header: AudioTableHeader = None
+        self.entries: list[AudioTableEntry] = []
+        self.banks: list[SampleBank] = []
+        self.audiotable: memoryview = None
+        self._mapping: mmap.mmap | None = None
+
+    @classmethod
+    def from_bytes(cls, table_data: bytes, table_offset: int, audiotable_data: bytes, audiotable_offset: int = 0):
+        """
+        Instantiates a sample bank table over binary data.
+
+        For a decompressed ROM, `table_data` and `audiotable_data` are both the ROM. When working with extracted
+        files, `table_data` is the code segment and `audiotable_data` is the Audiotable segment.
+
+        Args:
+            table_data (bytes): Binary data containing the sample bank index.
+            table_offset (int): Offset of the sample bank index in `table_data`.
+            audiotable_data (bytes): Binary data containing the Audiotable segment. The table keeps a reference to it.
+            audiotable_offset (int): Offset of the Audiotable segment in `audiotable_data`.
+
+        Returns:
+            object (SampleBankTable): The table, with one sample bank per entry.
+        """
+        header, table_entries = AudiobankTable.read_index(table_data, table_offset)
+
+        obj = cls()
+        obj.header = header
+        obj.entries = [AudioTableEntry.from_bytes(table_entry) for table_entry in table_entries]
+        obj.audiotable = memoryview(audiotable_data).cast('B')[audiotable_offset:]
+
+        banks: dict[int, SampleBank] = {}
+        for i in range(len(obj.entries)):
+            real_index = AudiobankTable.real_index(obj.entries, i)
+            if real_index not in banks:
+                entry = obj.entries[real_index]
+                if entry.rom_addr + entry.bank_size > obj.audiotable.nbytes:
+                    raise ValueError(f'Sample bank {real_index} at {hex(entry.rom_addr)} extends past the end of the Audiotable segment')
+                banks[real_index] = SampleBank(real_index, entry, obj.audiotable[entry.rom_addr:entry.rom_addr + entry.bank_size])
+            obj.banks.append(banks[real_index])
+
+        return obj
+
+    @classmethod
+    def from_file(cls, table_path: str | os.PathLike, table_offset: int, audiotable_path: str | os.PathLike = None, audiotable_offset: int = 0):
+        """
+        Instantiates a sample bank table over a memory-mapped Audiotable file.
+
+        Args:
+            table_path (str | PathLike): Path to the file containing the sample bank index, either a ROM or the code segment.
+            table_offset (int): Offset of the sample bank index in the table file.
+            audiotable_path (str | PathLike): Path to the file containing the Audiotable segment. Defaults to `table_path`.
+            audiotable_offset (int): Offset of the Audiotable segment in the Audiotable file.
+
+        Returns:
+            object (SampleBankTable): The table, with one sample bank per entry.
+        """
+        if audiotable_path is None:
+            audiotable_path = table_path
+
+        with open(audiotable_path, 'rb') as a:
+            mapping = mmap.mmap(a.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            if os.path.samefile(table_path, audiotable_path):
+                table = cls.from_bytes(mapping, table_offset, mapping, audiotable_offset)
+            else:
+                with open(table_path, 'rb') as t:
+                    table = cls.from_bytes(t.read(), table_offset, mapping, audiotable_offset)
+        except Exception:
+            mapping.close()
+            raise
+        table._mapping = mapping
+        return table
+
+    def close(self):
+        """
+        Releases the Audiotable file mapped by `from_file`.
+
+        Raises:
+            BufferError: If sample data returned by the table is still in use.
+        """
+        for bank in self.banks:
+            bank.data.release()
+        if self.audiotable is not None:
+            self.audiotable.release()
+        if self._mapping is not None:
+            self._mapping.close()
+            self._mapping = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.banks)
+
+    def __getitem__(self, id: int) -> SampleBank:
+        return self.banks[id]
+
+    def select(self, entry: AudiobankEntry) -> SampleBanks:
+        """
+        Returns the sample banks an instrument bank draws its samples from.
+
+        Args:
+            entry (AudiobankEntry): The instrument bank's table entry, such as `Audiobank.metadata`.
+
+        Returns:
+            sample_banks (SampleBanks): The instrument bank's sample banks, to pass to `Sample.data`.
+        """
+        id_1, id_2 = entry.sample_bank_id_1, entry.sample_bank_id_2
+        if not 0 <= id_1 < len(self.banks):
+            raise ValueError(f'Instrument bank uses nonexistent sample bank {id_1}')
+        if id_2 != NO_SAMPLE_BANK and not 0 <= id_2 < len(self.banks):
+            raise ValueError(f'Instrument bank uses nonexistent sample bank {id_2}')
+
+        secondary = None if id_2 == NO_SAMPLE_BANK else self.banks[id_2]
+        return SampleBanks(self.banks[id_1], secondary, self.audiotable)
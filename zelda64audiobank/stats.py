@@ -0,0 +1,159 @@
+"""
+Parse Statistics
+=====
+
+Opt-in instrumentation for bank parsing. Statistics are only collected when a bank is parsed with
+`collect_stats=True` or inside `collect_parse_stats()`; otherwise parsing uses the plain `ParseContext` and
+nothing here runs.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Iterator, Type
+
+from .bankstruct import BankStruct, ParseContext, ParseLimits
+
+@dataclass
+class StructStats:
+    """
+    Parse statistics of a single structure type.
+
+    Attributes:
+        instances (int): Number of structures decoded.
+        bytes (int): Number of bytes the decoded structures occupy in the bank.
+        time (float): Seconds spent decoding the structures, excluding the structures they point to.
+        pointer_derefs (int): Number of non-null pointers to the structure type that were followed.
+        repeat_visits (int): Number of followed pointers whose structure had already been decoded.
+    """
+    instances: int = 0
+    bytes: int = 0
+    time: float = 0.0
+    pointer_derefs: int = 0
+    repeat_visits: int = 0
+
+    def merge(self, other: 'StructStats'):
+        self.instances += other.instances
+        self.bytes += other.bytes
+        self.time += other.time
+        self.pointer_derefs += other.pointer_derefs
+        self.repeat_visits += other.repeat_visits
+
+class ParseStats:
+    """
+    Parse statistics of one or more banks, by structure type name.
+
+    Attributes:
+        banks (int): Number of banks the statistics were collected from.
+        by_type (dict[str, StructStats]): Statistics of each structure type.
+        total (method): Returns the statistics of every structure type combined.
+        merge (method): Adds the statistics of another `ParseStats` object.
+    """
+    def __init__(self):
+        self.banks: int = 0
+        self.by_type: dict[str, StructStats] = {}
+
+    def __getitem__(self, type_name: str) -> StructStats:
+        return self.by_type[type_name]
+
+    def for_type(self, struct_type: Type[BankStruct]) -> StructStats:
+        stats = self.by_type.get(struct_type.__name__)
+        if stats is None:
+            stats = self.by_type[struct_type.__name__] = StructStats()
+        return stats
+
+    def total(self) -> StructStats:
+        total = StructStats()
+        for stats in self.by_type.values():
+            total.merge(stats)
+        return total
+
+    def merge(self, other: 'ParseStats'):
+        self.banks += other.banks
+        for type_name, stats in other.by_type.items():
+            self.by_type.setdefault(type_name, StructStats()).merge(stats)
+
+    def __repr__(self):
+        lines = [f'ParseStats(banks={self.banks})']
+        lines.append(f'  {"type":<16} {"instances":>10} {"bytes":>10} {"time (ms)":>10} {"derefs":>8} {"repeats":>8}')
+        for type_name, stats in sorted(self.by_type.items(), key=lambda item: -item[1].time):
+            lines.append(
+                f'  {type_name:<16} {stats.instances:>10} {stats.bytes:>10} {stats.time * 1000:>10.3f} '
+                f'{stats.pointer_derefs:>8} {stats.repeat_visits:>8}'
+            )
+        return '\n'.join(lines)
+
+class StatsContext(ParseContext):
+    """
+    A `ParseContext` that records `ParseStats` for every structure it decodes or resolves.
+    """
+    def __init__(self, lazy: bool = False, track_changes: bool = False, limits: ParseLimits | None = None, record_origins: bool = False):
+        super().__init__(lazy, track_changes, limits, record_origins)
+        self.stats: ParseStats = ParseStats()
+        # Time spent in nested decodes, one entry per decode in progress
+        self._child_time: list[float] = []
+
+    def resolve(self, struct_type: Type[BankStruct], buffer: bytes, offset: int) -> BankStruct:
+        stats = self.stats.for_type(struct_type)
+        stats.pointer_derefs += 1
+
+        key = (struct_type, offset)
+        obj = self.interned.get(key)
+        if obj is not None:
+            stats.repeat_visits += 1
+            return obj
+
+        obj = self._decode(stats, struct_type, buffer, offset)
+        self.interned[key] = obj
+        return obj
+
+    def decode(self, struct_type: Type[BankStruct], buffer: bytes, offset: int) -> BankStruct:
+        return self._decode(self.stats.for_type(struct_type), struct_type, buffer, offset)
+
+    def _decode(self, stats: StructStats, struct_type: Type[BankStruct], buffer: bytes, offset: int) -> BankStruct:
+        self._child_time.append(0.0)
+        start = perf_counter()
+        try:
+            obj = self._from_bytes(struct_type, buffer, offset)
+        finally:
+            elapsed = perf_counter() - start
+            child_time = self._child_time.pop()
+            if self._child_time:
+                self._child_time[-1] += elapsed
+
+        stats.instances += 1
+        stats.bytes += obj.packed_size()
+        stats.time += elapsed - child_time
+        return obj
+
+_collector: ContextVar[ParseStats | None] = ContextVar('parse_stats_collector', default=None)
+
+def active_collector() -> ParseStats | None:
+    """ Returns the statistics being aggregated by the innermost `collect_parse_stats()`, if any. """
+    return _collector.get()
+
+@contextmanager
+def collect_parse_stats() -> Iterator[ParseStats]:
+    """
+    Aggregates the parse statistics of every bank parsed inside the `with` block.
+
+    Example::
+
+        with collect_parse_stats() as stats:
+            table = AudiobankTable.from_file(rom_path, table_offset)
+        print(stats)
+
+    Blocks may be nested; the statistics of an inner block are added to the outer one when it exits.
+
+    Yields:
+        stats (ParseStats): The aggregated statistics, updated as banks are parsed.
+    """
+    outer = _collector.get()
+    stats = ParseStats()
+    token = _collector.set(stats)
+    try:
+        yield stats
+    finally:
+        _collector.reset(token)
+        if outer is not None:
+            outer.merge(stats)
@@ -36,7 +36,7 @@ class EnvelopePoint(BankStruct):
         return (
             f'{type(self).__name__}('
             f'time_or_opcode={self.time_or_opcode}, '
-            f'amp_or_index={self.amp_or_index}'
+            f'amp_or_index={self.amp_or_index})'
         )
 
 class Envelope(BankStruct):
@@ -45,31 +45,59 @@ class Envelope(BankStruct):
 
     In MIPS, words *cannot* begin at an odd memory alignment, they must be 2-byte aligned.
     """
+    __slots__ = ('points',)
     _fields_ = []
     _align_ = 0x10
+    _pointer_align_ = 0x02
 
     def __init__(self):
         self.points: list[EnvelopePoint] = []
 
     @classmethod
-    def from_bytes(cls, buffer: bytes, struct_offset: int = 0):
-        obj = cls()
+    def from_bytes(cls, buffer: bytes, struct_offset: int = 0, context: ParseContext = None):
+        points = []
         offset = struct_offset
+        limits = context.limits if context is not None else None
 
         # Loop through the array and create EnvelopePoint objects for each point
         # in the array until it hits an opcode. The game handles the array similarly.
         while True:
-            point = EnvelopePoint.from_bytes(buffer, offset)
-            obj.points.append(point)
+            if limits is not None:
+                if len(points) >= limits.max_envelope_points:
+                    raise EnvelopeLengthError(f'Envelope at {hex(struct_offset)} has no opcode within {limits.max_envelope_points} points')
+                context.charge(buffer, offset, EnvelopePoint.size(), 'EnvelopePoint')
+
+            point = EnvelopePoint.from_bytes(buffer, offset, context)
+            points.append(point)
             offset += EnvelopePoint.size()
 
             if point.is_opcode:
                 break
 
+        obj = cls.__new__(cls)
+        obj.points = points
+        if context is not None and context.record_origins:
+            context.track(obj, struct_offset)
+
         return obj
 
-    def __repr__(self):
-        if not self.points:
-            return f'{type(self).__name__}([])'
-        points_repr = ',\n '.join(repr(p) for p in self.points)
-        return f'{type(self).__name__}([\n {points_repr}\n])'
\ No newline at end of file
+    def packed_size(self) -> int:
+        return len(self.points) * EnvelopePoint.size()
+
+    def pack_into(self, buffer: bytearray, offset: int, offsets: dict[int, int] = None):
+        for point in self.points:
+            point.pack_into(buffer, offset)
+            offset += EnvelopePoint.size()
+
+    def curve(self, update_rate: float = 240.0) -> 'EnvelopeCurve':
+        """
+        Returns the envelope's amplitude curve, from the shared curve cache of `zelda64audiobank.adsr`.
+
+        Args:
+            update_rate (float): Envelope updates per second.
+
+        Returns:
+            curve (EnvelopeCurve): The envelope's amplitude curve. Requires NumPy.
+        """
+        from ..adsr import envelope_curve
+        return envelope_curve(self, update_rate)
@@ -35,4 +35,55 @@ class AudiobankEntry(BankStruct):
         'medium': AudioStorageMedium,
         'cache_load_type': AudioCacheLoadType
     }
-    # _align_ = 0x10
\ No newline at end of file
+    # _align_ = 0x10
+
+class AudioTableHeader(BankStruct):
+    """
+    Represents the header of an audio table, such as the audiobank index in code.
+
+    .. code-block:: c
+
+        typdef struct AudioTableHeader {
+            /* 0x00 */ s16 numEntries;
+            /* 0x02 */ s16 unkMediumParam;
+            /* 0x04 */ uintptr_t romAddr;
+            /* 0x08 */ char pad[0x8];
+        } AudioTableHeader; // Size = 0x10
+    """
+    _fields_ = [
+        ('num_entries', s16),
+        ('unk_medium_param', s16),
+        ('rom_addr', u32),
+        ('_pad_0', u32),
+        ('_pad_1', u32)
+    ]
+
+class AudioTableEntry(BankStruct):
+    """
+    Represents an entry of the sample bank index, which gives the location of a sample bank in the Audiotable segment.
+
+    .. code-block:: c
+
+        typdef struct AudioTableEntry {
+            /* 0x00 */ uintptr_t romAddr;
+            /* 0x04 */ size_t size;
+            /* 0x08 */ s8 medium;
+            /* 0x09 */ s8 cachePolicy;
+            /* 0x0A */ s16 shortData1;
+            /* 0x0C */ s16 shortData2;
+            /* 0x0E */ s16 shortData3;
+        } AudioTableEntry; // Size = 0x10
+    """
+    _fields_ = [
+        ('rom_addr', u32),
+        ('bank_size', u32),
+        ('medium', u8),
+        ('cache_load_type', u8),
+        ('short_data_1', s16),
+        ('short_data_2', s16),
+        ('short_data_3', s16)
+    ]
+    _enum_fields_ = {
+        'medium': AudioStorageMedium,
+        'cache_load_type': AudioCacheLoadType
+    }
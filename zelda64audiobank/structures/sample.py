@@ -33,14 +33,13 @@ class SampleFlags:
 
     def __repr__(self):
         return (
-            f'SampleFlags(\n'
-            f'    unk_0={self.unk_0},\n'
-            f'    codec={self.codec},\n'
-            f'    medium={self.medium},\n'
-            f'    is_cached={self.is_cached},\n'
-            f'    is_relocated={self.is_relocated},\n'
-            f'    size={self.size}\n'
-            '  )'
+            f'SampleFlags('
+            f'unk_0={self.unk_0}, '
+            f'codec={self.codec}, '
+            f'medium={self.medium}, '
+            f'is_cached={self.is_cached}, '
+            f'is_relocated={self.is_relocated}, '
+            f'size={self.size})'
         )
 
 class Sample(BankStruct):
@@ -75,3 +74,16 @@ class Sample(BankStruct):
         ('book', pointer(VadpcmBook))
     ]
     # _align_ = 0x10
+
+    def data(self, sample_banks: 'SampleBanks') -> memoryview:
+        """
+        Returns the sample's audio data, a view into its sample bank rather than a copy.
+
+        Args:
+            sample_banks (SampleBanks): The sample banks of the instrument bank holding the sample, as returned by
+                `SampleBankTable.select`.
+
+        Returns:
+            data (memoryview): The `flags.size` bytes of audio data.
+        """
+        return sample_banks.sample_data(self)
@@ -1,3 +1,4 @@
+import struct
 from enum import IntEnum
 
 from ..bankstruct import *
@@ -50,36 +51,31 @@ class VadpcmLoop(BankStruct):
 
     # Override because the array is conditional based on header values
     @classmethod
-    def from_bytes(cls, buffer: bytes, struct_offset:int = 0):
-        obj = cls.__new__(cls)
-
-        obj.header = VadpcmLoopHeader.from_bytes(buffer, struct_offset)
+    def from_bytes(cls, buffer: bytes, struct_offset:int = 0, context: ParseContext = None):
+        header = VadpcmLoopHeader.from_bytes(buffer, struct_offset, context)
         header_size = VadpcmLoopHeader.size()
 
-        if obj.header.loop_start == 0:
-            obj.predictors = array(s16, 0)
-        else:
-            predictor_offset = struct_offset + header_size
-            obj.predictors = array(s16, 16).from_bytes(buffer, predictor_offset)
+        # The predictor state is only present for looped samples
+        num_predictors = 0 if header.loop_start == 0 else 16
+
+        predictor_offset = struct_offset + header_size
+        if context is not None and context.limits is not None:
+            context.charge(buffer, predictor_offset, num_predictors * s16.size, cls.__name__)
+        obj = cls.__new__(cls)
+        obj.header = header
+        obj.predictors = array(s16, num_predictors).from_bytes(buffer, predictor_offset)
+
+        if context is not None and context.record_origins:
+            context.track(obj, struct_offset)
 
         return obj
 
-    def __repr__(self):
-        header_repr = repr(self.header).replace('\n', '\n  ')
-        if not self.predictors or len(self.predictors) == 0:
-            preds = '[]'
-        else:
-            grouped = [
-                ', '.join(f'{v}' for v in self.predictors[i:i+4])
-                for i in range(0, len(self.predictors), 4)
-            ]
-            preds = '[\n' + '\n'.join(f'    {line},' for line in grouped) + '\n  ]'
-        return (
-            f'{type(self).__name__}(\n'
-            f'  header={header_repr}\n'
-            f'  predictors={preds}\n'
-            f')'
-        )
+    def packed_size(self) -> int:
+        return VadpcmLoopHeader.size() + len(self.predictors) * s16.size
+
+    def pack_into(self, buffer: bytearray, offset: int, offsets: dict[int, int] = None):
+        self.header.pack_into(buffer, offset)
+        struct.pack_into(f'>{len(self.predictors)}h', buffer, offset + VadpcmLoopHeader.size(), *self.predictors)
 
 class VadpcmBookHeader(BankStruct):
     """
@@ -115,35 +111,31 @@ class VadpcmBook(BankStruct):
     _align_ = 0x10
 
     @classmethod
-    def from_bytes(cls, buffer: bytes, struct_offset: int = 0):
-        obj = cls.__new__(cls)
-
-        obj.header = VadpcmBookHeader.from_bytes(buffer, struct_offset)
+    def from_bytes(cls, buffer: bytes, struct_offset: int = 0, context: ParseContext = None):
+        header = VadpcmBookHeader.from_bytes(buffer, struct_offset, context)
         header_size = VadpcmBookHeader.size()
 
-        order = obj.header.order
-        num_predictors = obj.header.num_predictors
+        order = header.order
+        num_predictors = header.num_predictors
         total_coeff = 8 * order * num_predictors
 
         predictor_offset = struct_offset + header_size
+        if context is not None and context.limits is not None:
+            if order <= 0 or num_predictors <= 0:
+                raise BankFormatError(f'VadpcmBook at {hex(struct_offset)} has order {order} and {num_predictors} predictors')
+            context.charge(buffer, predictor_offset, total_coeff * s16.size, cls.__name__)
+        obj = cls.__new__(cls)
+        obj.header = header
         obj.predictors = array(s16, total_coeff).from_bytes(buffer, predictor_offset)
 
+        if context is not None and context.record_origins:
+            context.track(obj, struct_offset)
+
         return obj
 
-    def __repr__(self):
-        header_repr = repr(self.header).replace('\n', '\n  ')
-        if not self.predictors or len(self.predictors) == 0:
-            preds_repr = '[]'
-        else:
-            grouped = [
-                ', '.join(f'{v}' for v in self.predictors[i:i+4])
-                for i in range(0, len(self.predictors), 4)
-            ]
-            preds_repr = '[\n' + '\n'.join(f'    {line},' for line in grouped) + '\n  ]'
-
-        return (
-            f'{type(self).__name__}(\n'
-            f'  header={header_repr}\n'
-            f'  predictors={preds_repr}\n'
-            f')'
-        )
\ No newline at end of file
+    def packed_size(self) -> int:
+        return VadpcmBookHeader.size() + len(self.predictors) * s16.size
+
+    def pack_into(self, buffer: bytearray, offset: int, offsets: dict[int, int] = None):
+        self.header.pack_into(buffer, offset)
+        struct.pack_into(f'>{len(self.predictors)}h', buffer, offset + VadpcmBookHeader.size(), *self.predictors)
@@ -0,0 +1,194 @@
+"""
+AudiobankTable
+=====
+"""
+import os
+import mmap
+from concurrent.futures import ProcessPoolExecutor
+
+from .audiobank import Audiobank
+from .helpers import mapped_file
+from .stats import active_collector
+from .structures.metadata import AudioTableHeader, AudiobankEntry
+
+# Bank data mapped once in each worker process by `_init_worker`, so banks are sliced out of the
+# shared mapping instead of being pickled and sent to the workers.
+_worker_bank_data: mmap.mmap | None = None
+
+def _init_worker(bank_path: str | os.PathLike):
+    global _worker_bank_data
+    with open(bank_path, 'rb') as b:
+        _worker_bank_data = mmap.mmap(b.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _parse_worker(table_entry: bytes, bank_start: int, bank_size: int, collect_stats: bool) -> Audiobank:
+    return Audiobank.from_bytes(table_entry, memoryview(_worker_bank_data)[bank_start:bank_start + bank_size], collect_stats)
+
+class AudiobankTable:
+    """
+    Represents the audiobank index and every instrument bank it points to.
+
+    The index is found in the code segment of a decompressed OoT or MM ROM. Each `AudiobankEntry` gives the
+    address of its bank relative to the start of the Audiobank segment and its size in bytes. An entry with a
+    size of 0 reuses another bank, and its address holds the index of the entry it refers to.
+
+    Attributes:
+        from_bytes (method): Parses the index and every bank it points to from binary data.
+        from_file (method): Parses the index and every bank it points to from files, optionally in parallel.
+        read_index (method): Reads the index header and the binary table entries, without parsing any bank.
+        real_index (method): Returns the index of the entry an entry refers to.
+    """
+    def __init__(self):
+        self.header: AudioTableHeader = None
+        self.entries: list[AudiobankEntry] = []
+        self.banks: list[Audiobank] = []
+
+    @staticmethod
+    def read_index(table_data: bytes, table_offset: int) -> tuple[AudioTableHeader, list[bytes]]:
+        """
+        Reads the audiobank index header and the binary table entry of every bank, without parsing any bank.
+
+        Args:
+            table_data (bytes): Binary data containing the audiobank index.
+            table_offset (int): Offset of the audiobank index in `table_data`.
+
+        Returns:
+            header (AudioTableHeader): The index header.
+            table_entries (list[bytes]): The 0x10-byte table entry of every bank, in index order.
+
+        Raises:
+            ValueError: If the header gives a negative number of entries.
+        """
+        header = AudioTableHeader.from_bytes(table_data, table_offset)
+        if header.num_entries < 0:
+            raise ValueError(f'Unexpected number of audiobank table entries: {header.num_entries}')
+
+        entry_size = AudiobankEntry.size()
+        entry_start = table_offset + AudioTableHeader.size()
+        with memoryview(table_data) as view:
+            table_entries = [
+                bytes(view[entry_start + (i * entry_size):entry_start + ((i + 1) * entry_size)])
+                for i in range(header.num_entries)
+            ]
+
+        return header, table_entries
+
+    @staticmethod
+    def real_index(entries: list[AudiobankEntry], index: int) -> int:
+        """
+        Returns the index of the entry whose bank an entry uses.
+
+        Entries with a size of 0 hold the index of another entry in place of an address, and the reference is
+        followed until an entry with a bank of its own.
+
+        Args:
+            entries (list[AudiobankEntry]): Every entry of the index.
+            index (int): Index of the entry.
+
+        Returns:
+            index (int): Index of the entry with the bank, which is `index` itself for an entry with a size.
+
+        Raises:
+            ValueError: If the references form a loop or refer to an entry outside of `entries`.
+        """
+        seen = set()
+        while entries[index].bank_size == 0:
+            if index in seen:
+                raise ValueError(f'Audiobank table entry {index} is part of a reference loop')
+            seen.add(index)
+
+            index = entries[index].rom_addr
+            if not 0 <= index < len(entries):
+                raise ValueError(f'Audiobank table entry refers to nonexistent entry {index}')
+
+        return index
+
+    @classmethod
+    def _from_index(cls, header: AudioTableHeader, table_entries: list[bytes], parse) -> 'AudiobankTable':
+        obj = cls()
+        obj.header = header
+        obj.entries = [AudiobankEntry.from_bytes(table_entry) for table_entry in table_entries]
+
+        real_indices = [cls.real_index(obj.entries, i) for i in range(len(obj.entries))]
+        unique_indices = sorted(set(real_indices))
+
+        parsed = dict(zip(unique_indices, parse(unique_indices, obj.entries, table_entries)))
+        obj.banks = [parsed[i] for i in real_indices]
+        return obj
+
+    @classmethod
+    def from_bytes(cls, table_data: bytes, table_offset: int, bank_data: bytes, bank_offset: int = 0):
+        """
+        Instantiates an audiobank table object and parses every bank it points to.
+
+        For a decompressed ROM, `table_data` and `bank_data` are both the ROM. When working with extracted
+        files, `table_data` is the code segment and `bank_data` is the Audiobank segment.
+
+        Args:
+            table_data (bytes): Binary data containing the audiobank index.
+            table_offset (int): Offset of the audiobank index in `table_data`.
+            bank_data (bytes): Binary data containing the Audiobank segment.
+            bank_offset (int): Offset of the Audiobank segment in `bank_data`.
+
+        Returns:
+            object (AudiobankTable): The parsed table, with one bank per entry.
+        """
+        def parse(indices, entries, table_entries):
+            with memoryview(bank_data) as view:
+                return [
+                    Audiobank.from_bytes(
+                        table_entries[i],
+                        view[bank_offset + entries[i].rom_addr:bank_offset + entries[i].rom_addr + entries[i].bank_size]
+                    )
+                    for i in indices
+                ]
+
+        return cls._from_index(*cls.read_index(table_data, table_offset), parse)
+
+    @classmethod
+    def from_file(cls, table_path: str | os.PathLike, table_offset: int, bank_path: str | os.PathLike = None, bank_offset: int = 0, jobs: int | None = 1):
+        """
+        Instantiates an audiobank table object from files and parses every bank it points to.
+
+        With more than one job, banks are parsed in a process pool. Each worker maps the bank file once and
+        slices its banks from the mapping, so only the 0x10-byte table entries are sent to the workers.
+
+        Args:
+            table_path (str | PathLike): Path to the file containing the audiobank index, either a ROM or the code segment.
+            table_offset (int): Offset of the audiobank index in the table file.
+            bank_path (str | PathLike): Path to the file containing the Audiobank segment. Defaults to `table_path`.
+            bank_offset (int): Offset of the Audiobank segment in the bank file.
+            jobs (int | None): Number of worker processes, or `None` for one per CPU.
+
+        Returns:
+            object (AudiobankTable): The parsed table, with one bank per entry.
+        """
+        if bank_path is None:
+            bank_path = table_path
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+
+        if jobs <= 1:
+            with mapped_file(table_path) as table_data, mapped_file(bank_path) as bank_data:
+                return cls.from_bytes(table_data, table_offset, bank_data, bank_offset)
+
+        with mapped_file(table_path) as table_data:
+            header, table_entries = cls.read_index(table_data, table_offset)
+
+        def parse(indices, entries, table_entries):
+            # Workers do not see the collector of this process, so their statistics are merged here
+            collector = active_collector()
+            with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(bank_path,)) as pool:
+                banks = list(pool.map(
+                    _parse_worker,
+                    [table_entries[i] for i in indices],
+                    [bank_offset + entries[i].rom_addr for i in indices],
+                    [entries[i].bank_size for i in indices],
+                    [collector is not None] * len(indices),
+                    chunksize=max(1, len(indices) // (jobs * 4))
+                ))
+            if collector is not None:
+                for bank in banks:
+                    collector.merge(bank.parse_stats)
+            return banks
+
+        return cls._from_index(header, table_entries, parse)